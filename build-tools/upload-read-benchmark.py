@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Compare memory usage of the ways the SDK reads files for uploading.
+
+Every reader runs in a separate process which reads the same files
+concurrently chunk by chunk and computes a CRC32 of every chunk (so all
+bytes are touched, like sending does), the same way uploads of several
+files do.  Reported are the wall time, the peak RSS of
+the process, the number of minor page faults and of garbage collections.
+
+    python build-tools/upload-read-benchmark.py --size 2048 --files 8
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import List
+
+from neuro_sdk.blob_storage import _iter_mmap
+from neuro_sdk.storage import READ_SIZE, _BufferPool, _read_chunk
+
+READERS = ("read", "readinto", "mmap")
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.reader:
+        run_reader(args.reader, args.paths)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_files(pathlib.Path(tmp), args.files, args.size * 2 ** 20)
+        print(f"{args.files} files, {args.size} MiB each")
+        print(
+            f"{'reader':<10} {'time, s':>8} {'peak RSS, MiB':>14} "
+            f"{'page faults':>12} {'GC runs':>8}"
+        )
+        for reader in READERS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--reader", reader, *map(str, paths)],
+                check=True,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            ).stdout
+            elapsed, maxrss, minflt, collections = out.split()
+            print(
+                f"{reader:<10} {float(elapsed):>8.2f} {int(maxrss) / 2 ** 20:>14.1f} "
+                f"{int(minflt):>12} {int(collections):>8}"
+            )
+
+
+def generate_files(folder: pathlib.Path, count: int, size: int) -> List[pathlib.Path]:
+    garbage = os.urandom(16 * 2 ** 20)
+    paths = []
+    for i in range(count):
+        path = folder / f"file{i}.bin"
+        with path.open("wb") as f:
+            written = 0
+            while written < size:
+                written += f.write(garbage[: size - written])
+        paths.append(path)
+    return paths
+
+
+def run_reader(reader: str, paths: List[pathlib.Path]) -> None:
+    gc_before = sum(stat["collections"] for stat in gc.get_stats())
+    start = time.monotonic()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(read_files(reader, paths))
+    elapsed = time.monotonic() - start
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - gc_before
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    maxrss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    print(elapsed, maxrss, usage.ru_minflt, collections)
+
+
+async def read_files(reader: str, paths: List[pathlib.Path]) -> None:
+    pool = _BufferPool(len(paths))
+    await asyncio.gather(*(read_file(reader, path, pool) for path in paths))
+
+
+async def read_file(reader: str, path: pathlib.Path, pool: _BufferPool) -> int:
+    loop = asyncio.get_event_loop()
+    crc = 0
+    with path.open("rb") as stream:
+        if reader == "read":
+            while True:
+                chunk = await loop.run_in_executor(None, stream.read, READ_SIZE)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+        elif reader == "readinto":
+            with pool.buffer(READ_SIZE) as buf:
+                while True:
+                    view = await _read_chunk(stream, buf)
+                    if not view:
+                        break
+                    crc = zlib.crc32(view, crc)
+        else:
+            size = os.fstat(stream.fileno()).st_size
+            for view in _iter_mmap(stream.fileno(), size, READ_SIZE):
+                crc = zlib.crc32(view, crc)
+                await asyncio.sleep(0)
+    return crc
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark reading files for uploads.",
+    )
+    parser.add_argument(
+        "--size", type=int, default=1024, help="size of every file in MiB"
+    )
+    parser.add_argument("--files", type=int, default=4, help="number of files")
+    parser.add_argument("--reader", choices=READERS, help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*", type=pathlib.Path, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
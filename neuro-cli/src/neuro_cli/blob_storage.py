@@ -32,7 +32,7 @@ from .utils import (
     command,
     group,
     option,
-    parse_blob_or_file_resource,
+    parse_blob_file_or_storage_resource,
     parse_blob_resource,
 )
 
@@ -85,10 +85,19 @@ async def ls(
 
     blob_storage = root.client.blob_storage
 
+    # Keys are listed in lexicographical order, so a recursive listing sorted
+    # by name is printed as it arrives
+    stream = recursive and sort == "name"
+
     formatter: BaseBlobFormatter
     if format_long:
         # Similar to `ls -l`
-        formatter = LongBlobFormatter(human_readable=human_readable, color=root.color)
+        size_width = 0
+        if stream:
+            size_width = 6 if human_readable else 12
+        formatter = LongBlobFormatter(
+            human_readable=human_readable, color=root.color, size_width=size_width
+        )
     else:
         # Similar to `ls -1`, default for non-terminal on UNIX. We show full uris of
         # blobs, thus column formatting does not work too well.
@@ -110,6 +119,12 @@ async def ls(
                 uri_text = painter.paint(str(short_uri), FileStatusType.DIRECTORY)
                 root.print(Text.assemble("List of ", uri_text, ":"))
             try:
+                if stream:
+                    async for item in blob_storage.iter_blobs(
+                        bucket_name=bucket_name, prefix=key, recursive=True
+                    ):
+                        root.print(formatter([item]))
+                    continue
                 blobs, prefixes = await blob_storage.list_blobs(
                     bucket_name=bucket_name,
                     prefix=key,
@@ -215,6 +230,14 @@ async def glob(root: Root, patterns: Sequence[str]) -> None:
         'configuration variable documented in "neuro help user-config"'
     ),
 )
+@option(
+    "--parallel-segments",
+    metavar="NUMBER",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Download large blobs by NUMBER concurrent byte ranges.",
+)
 @option(
     "-p/-P",
     "--progress/--no-progress",
@@ -234,15 +257,17 @@ async def cp(
     continue_: bool,
     filters: Optional[Tuple[Tuple[bool, str], ...]],
     exclude_from_files: str,
+    parallel_segments: int,
     progress: bool,
 ) -> None:
     """
     Simple utility to copy files and directories into and from Blob Storage.
 
     Either SOURCES or DESTINATION should have `blob://` scheme.
-    If scheme is omitted, file:// scheme is assumed. It is currently not possible to
-    copy files between Blob Storage (`blob://`) destination, nor with `storage://`
-    scheme paths.
+    If scheme is omitted, file:// scheme is assumed. Files are copied between
+    Blob Storage and Storage (`storage://`) directly, without downloading them
+    to the local disk. It is currently not possible to copy files between Blob
+    Storage (`blob://`) destinations.
 
     Use `/dev/stdin` and `/dev/stdout` file names to upload a file from standard input
     or output to stdout.
@@ -269,7 +294,7 @@ async def cp(
                 param_type="argument", param_hint='"SOURCES..."'
             )
         sources = *sources, destination
-        target_dir = parse_blob_or_file_resource(target_directory, root)
+        target_dir = parse_blob_file_or_storage_resource(target_directory, root)
         dst = None
     else:
         if destination is None:
@@ -280,7 +305,7 @@ async def cp(
             raise click.MissingParameter(
                 param_type="argument", param_hint='"SOURCES..."'
             )
-        dst = parse_blob_or_file_resource(destination, root)
+        dst = parse_blob_file_or_storage_resource(destination, root)
 
         # From gsutil:
         #
@@ -354,6 +379,7 @@ async def cp(
                             continue_=continue_,
                             filter=file_filter.match,
                             progress=progress_blob,
+                            parallel_segments=parallel_segments,
                         )
                     else:
                         await root.client.blob_storage.download_file(
@@ -362,6 +388,35 @@ async def cp(
                             update=update,
                             continue_=continue_,
                             progress=progress_blob,
+                            parallel_segments=parallel_segments,
+                        )
+                elif src.scheme == "storage" and dst.scheme == "blob":
+                    if update or continue_:
+                        raise click.UsageError(
+                            "Options --update and --continue are not supported for "
+                            "copying from Storage to Blob Storage"
+                        )
+                    if recursive and await _is_dir(root, src):
+                        await root.client.blob_storage.copy_dir_from_storage(
+                            src, dst, filter=file_filter.match, progress=progress_blob
+                        )
+                    else:
+                        await root.client.blob_storage.copy_from_storage(
+                            src, dst, progress=progress_blob
+                        )
+                elif src.scheme == "blob" and dst.scheme == "storage":
+                    if update or continue_:
+                        raise click.UsageError(
+                            "Options --update and --continue are not supported for "
+                            "copying from Blob Storage to Storage"
+                        )
+                    if recursive and await _is_dir(root, src):
+                        await root.client.blob_storage.copy_dir_to_storage(
+                            src, dst, filter=file_filter.match, progress=progress_blob
+                        )
+                    else:
+                        await root.client.blob_storage.copy_to_storage(
+                            src, dst, progress=progress_blob
                         )
                 else:
                     raise RuntimeError(
@@ -381,6 +436,12 @@ async def _is_dir(root: Root, uri: URL) -> bool:
     if uri.scheme == "blob":
         return await root.client.blob_storage._is_dir(uri)
 
+    elif uri.scheme == "storage":
+        try:
+            stat = await root.client.storage.stat(uri)
+            return stat.is_dir()
+        except ResourceNotFound:
+            pass
     elif uri.scheme == "file":
         path = _extract_path(uri)
         return path.is_dir()
@@ -392,7 +453,7 @@ async def _expand(
 ) -> List[URL]:
     uris = []
     for path in paths:
-        uri = parse_blob_or_file_resource(path, root)
+        uri = parse_blob_file_or_storage_resource(path, root)
         if root.verbosity > 0:
             painter = get_painter(root.color)
             uri_text = painter.paint(str(uri), FileStatusType.FILE)
@@ -410,6 +471,9 @@ async def _expand(
                     bucket_name=bucket_name, pattern=key
                 ):
                     uris.append(blob.uri)
+            elif uri.scheme == "storage":
+                async for file in root.client.storage.glob(uri):
+                    uris.append(file)
             elif allow_file and uri.scheme == "file":
                 for p in globmodule.iglob(uri_path, recursive=True):
                     uris.append(uri.with_path(p))
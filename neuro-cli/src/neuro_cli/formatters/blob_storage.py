@@ -33,9 +33,11 @@ class BaseBlobFormatter:
 class LongBlobFormatter(BaseBlobFormatter):
     permissions_mapping = {Action.MANAGE: "m", Action.WRITE: "w", Action.READ: "r"}
 
-    def __init__(self, human_readable: bool, color: bool):
+    def __init__(self, human_readable: bool, color: bool, size_width: int = 0):
         self.human_readable = human_readable
         self.painter = get_painter(color)
+        # Fixed width of the size column keeps rows formatted separately aligned
+        self.size_width = size_width
 
     def to_row(self, file: BlobListings) -> Sequence[RenderableType]:
         if isinstance(file, BucketListing):
@@ -67,7 +69,7 @@ class LongBlobFormatter(BaseBlobFormatter):
     def __call__(self, files: Sequence[BlobListings]) -> RenderableType:
         table = Table.grid(padding=(0, 2))
         table.add_column()  # Type/Permissions
-        table.add_column(justify="right")  # Size
+        table.add_column(justify="right", min_width=self.size_width)  # Size
         table.add_column()  # Date
         table.add_column()  # Filename
         for file in files:
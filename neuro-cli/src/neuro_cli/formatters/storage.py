@@ -9,7 +9,7 @@ from dataclasses import dataclass
 from fnmatch import fnmatch
 from time import monotonic
 from types import TracebackType
-from typing import Any, Dict, Iterator, List, Sequence, Type
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Type
 
 from rich.ansi import AnsiDecoder
 from rich.columns import Columns
@@ -651,6 +651,14 @@ class StreamProgress(BaseStorageProgress):
         )
 
 
+@dataclass
+class _FileTask:
+    filename: Text
+    size: int
+    current: int = 0
+    task_id: Optional[TaskID] = None  # None if rolled up
+
+
 class TTYProgress(BaseStorageProgress):
     HEIGHT = 25
     FLUSH_INTERVAL = 0.2
@@ -665,7 +673,15 @@ class TTYProgress(BaseStorageProgress):
     ) -> None:
         self.painter = get_painter(root.color)
         self._root = root
-        self._mapping: Dict[URL, TaskID] = {}
+        self._auto_refresh = auto_refresh
+        # All files in flight, the visible ones have their own rows and the
+        # rest is shown as a single "N files in flight" row.
+        self._files: Dict[URL, _FileTask] = {}
+        self._visible: Dict[URL, _FileTask] = {}
+        self._rolled_up: Dict[URL, _FileTask] = {}
+        self._rollup_task: Optional[TaskID] = None
+        self._rollup_size = 0
+        self._rollup_current = 0
         self._progress = Progress(
             TextColumn("[progress.description]{task.fields[filename]}"),
             BarColumn(),
@@ -674,27 +690,78 @@ class TTYProgress(BaseStorageProgress):
             TransferSpeedColumn(),
             console=root.console,
             auto_refresh=auto_refresh,
+            refresh_per_second=1 / self.FLUSH_INTERVAL,
             get_time=get_time,
         )
         self._progress.start()
 
     def _refresh(self) -> None:
-        height = self._root.terminal_size[1]
+        # Redrawing is done by the timer of rich.progress.Progress,
+        # tests disable it to get the output after every event.
+        if not self._auto_refresh:
+            self._progress.refresh()
+
+    def _rebalance(self) -> None:
         # If terminal is to small, we cannot show all tasks.
         # Moreover, scroll will be also broken, so the
-        # only solution is just to hide some tasks.
-        to_hide = len(self._progress.task_ids) - height + 2
-        hidden = sum(1 for task in self._progress.tasks if not task.visible)
-        for task in self._progress.tasks:
-            if to_hide < hidden and not task.visible:
-                self._progress.update(task.id, visible=True)
-                hidden -= 1
-            if to_hide > hidden and task.visible:
-                self._progress.update(task.id, visible=False)
-                hidden += 1
-            if to_hide == hidden:
-                break
-        self._progress.refresh()
+        # only solution is to roll up some tasks into one row.
+        rows = max(self._root.terminal_size[1] - 2, 1)
+        if len(self._files) <= rows:
+            limit = len(self._files)
+        else:
+            limit = rows - 1
+        while len(self._visible) > limit:
+            src, file = self._visible.popitem()
+            self._hide(src, file)
+        while len(self._visible) < limit and self._rolled_up:
+            src = next(iter(self._rolled_up))
+            self._show(src, self._rolled_up.pop(src))
+        self._update_rollup()
+
+    def _show(self, src: URL, file: _FileTask) -> None:
+        self._rollup_size -= file.size
+        self._rollup_current -= file.current
+        file.task_id = self._progress.add_task(
+            description=src.name,
+            total=file.size,
+            completed=file.current,
+            filename=file.filename,
+        )
+        self._visible[src] = file
+        if self._rollup_task is not None:
+            # Keep the rollup row below
+            self._progress.remove_task(self._rollup_task)
+            self._rollup_task = None
+
+    def _hide(self, src: URL, file: _FileTask) -> None:
+        assert file.task_id is not None
+        self._progress.remove_task(file.task_id)
+        file.task_id = None
+        self._rolled_up[src] = file
+        self._rollup_size += file.size
+        self._rollup_current += file.current
+
+    def _update_rollup(self) -> None:
+        if not self._rolled_up:
+            if self._rollup_task is not None:
+                self._progress.remove_task(self._rollup_task)
+                self._rollup_task = None
+            return
+        filename = Text(f"{len(self._rolled_up)} files in flight")
+        if self._rollup_task is None:
+            self._rollup_task = self._progress.add_task(
+                description="",
+                total=self._rollup_size,
+                completed=self._rollup_current,
+                filename=filename,
+            )
+        else:
+            self._progress.update(
+                self._rollup_task,
+                total=self._rollup_size,
+                completed=self._rollup_current,
+                filename=filename,
+            )
 
     def fmt_url(self, url: URL, type: FileStatusType) -> Text:
         return self.fmt_str(format_url(url), type)
@@ -725,24 +792,35 @@ class TTYProgress(BaseStorageProgress):
         fmt_src = self.fmt_url(data.src, FileStatusType.FILE)
         fmt_name = self.fmt_str(data.src.name, FileStatusType.FILE)
         self._progress.log(Text.assemble("Copying: ", fmt_src))
-        task_id = self._progress.add_task(
-            description=data.src.name,
-            total=data.size,
-            filename=fmt_name,
-        )
-        self._mapping[data.src] = task_id
+        file = _FileTask(fmt_name, data.size)
+        self._files[data.src] = file
+        self._rolled_up[data.src] = file
+        self._rollup_size += file.size
+        self._rebalance()
         self._refresh()
 
     def step(self, data: StorageProgressStep) -> None:
-        task_id = self._mapping[data.src]
-        self._progress.update(task_id, completed=data.current)
+        file = self._files[data.src]
+        if file.task_id is not None:
+            self._progress.update(file.task_id, completed=data.current)
+        else:
+            self._rollup_current += data.current - file.current
+            self._update_rollup()
+        file.current = data.current
         self._refresh()
 
     def complete(self, data: StorageProgressComplete) -> None:
         fmt_src = self.fmt_url(data.src, FileStatusType.FILE)
         self._progress.log(Text.assemble("Copied: ", fmt_src))
-        task_id = self._mapping[data.src]
-        self._progress.remove_task(task_id)
+        file = self._files.pop(data.src)
+        if file.task_id is not None:
+            self._progress.remove_task(file.task_id)
+            del self._visible[data.src]
+        else:
+            del self._rolled_up[data.src]
+            self._rollup_size -= file.size
+            self._rollup_current -= file.current
+        self._rebalance()
         self._refresh()
 
     def fail(self, data: StorageProgressFail) -> None:
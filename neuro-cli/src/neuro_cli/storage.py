@@ -1,15 +1,24 @@
-import asyncio
 import dataclasses
+import errno
 import glob as globmodule  # avoid conflict with subcommand "glob"
+import hashlib
 import logging
 import sys
-from typing import Any, Callable, List, Optional, Sequence, Tuple
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, TextIO, Tuple
 
 import click
 from rich.text import Text
 from yarl import URL
 
-from neuro_sdk import Client, FileStatusType, IllegalArgumentError, ResourceNotFound
+from neuro_sdk import (
+    Client,
+    FileStatus,
+    FileStatusType,
+    IllegalArgumentError,
+    ResourceNotFound,
+    TransferPlan,
+)
 from neuro_sdk.file_filter import FileFilter
 from neuro_sdk.url_utils import _extract_path
 
@@ -27,7 +36,15 @@ from .formatters.storage import (
     get_painter,
 )
 from .root import Root
-from .utils import Option, argument, command, group, option, parse_file_resource
+from .utils import (
+    Option,
+    argument,
+    command,
+    format_size,
+    group,
+    option,
+    parse_file_resource,
+)
 
 NEUROIGNORE_FILENAME = ".neuroignore"
 
@@ -294,6 +311,40 @@ def filter_option(*args: str, flag_value: bool, help: str) -> Callable[[Any], An
         'configuration variable documented in "neuro help user-config"'
     ),
 )
+@option(
+    "--parallel-segments",
+    metavar="NUMBER",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Download large files from the storage by NUMBER concurrent byte ranges.",
+)
+@option(
+    "--dry-run",
+    is_flag=True,
+    help="Show the number of files and bytes to copy without copying anything.",
+)
+@option(
+    "--plan-out",
+    metavar="FILE",
+    type=click.Path(dir_okay=False),
+    help="Write the list of directories and files to copy to FILE "
+    "as newline-delimited JSON.  Files are copied largest first.",
+)
+@option(
+    "--plan-in",
+    metavar="FILE",
+    type=click.File(encoding="utf8", lazy=False),
+    help="Copy the directories and files listed in FILE written by --plan-out "
+    "instead of SOURCES.  Files changed since are copied whole.",
+)
+@option(
+    "--resume",
+    is_flag=True,
+    help="Journal the progress of recursive copies and continue "
+    "an interrupted copy of the same directories with the same options "
+    "from the journal.",
+)
 @option(
     "-p/-P",
     "--progress/--no-progress",
@@ -313,6 +364,11 @@ async def cp(
     continue_: bool,
     filters: Optional[Tuple[Tuple[bool, str], ...]],
     exclude_from_files: str,
+    parallel_segments: int,
+    dry_run: bool,
+    plan_out: Optional[str],
+    plan_in: Optional[TextIO],
+    resume: bool,
     progress: bool,
 ) -> None:
     """
@@ -356,7 +412,42 @@ async def cp(
 
     # download only files with extension `.out` into the current directory
     neuro cp storage:results/*.out .
+
+    # show how many files and bytes an upload would copy
+    neuro cp -r --update --dry-run foo storage:foo
+
+    # upload a large directory, repeat the command after an interruption
+    # to skip the files which are already copied
+    neuro cp -r --resume foo storage:foo
+
+    # plan an upload and run it later
+    neuro cp -r --continue --dry-run --plan-out plan.json foo storage:foo
+    neuro cp --plan-in plan.json
     """
+    if plan_in is not None:
+        if sources or destination or target_directory or no_target_directory:
+            raise click.UsageError(
+                "Cannot combine --plan-in with SOURCES and DESTINATION"
+            )
+        if update or continue_ or filters or exclude_from_files:
+            raise click.UsageError(
+                "Cannot combine --plan-in with --update, --continue "
+                "and file filters, they are applied by the plan"
+            )
+        if resume or plan_out is not None:
+            raise click.UsageError(
+                "Cannot combine --plan-in with --resume or --plan-out"
+            )
+        if await _cp_plan_in(
+            root,
+            plan_in,
+            parallel_segments=parallel_segments,
+            dry_run=dry_run,
+            show_progress=root.tty and progress,
+        ):
+            sys.exit(EX_OSFILE)
+        return
+
     target_dir: Optional[URL]
     dst: Optional[URL]
     if target_directory:
@@ -400,6 +491,35 @@ async def cp(
 
     show_progress = root.tty and progress
 
+    if dry_run or plan_out is not None:
+        if resume:
+            raise click.UsageError(
+                "Cannot combine --resume with --dry-run or --plan-out"
+            )
+        errors = await _cp_planned(
+            root,
+            srcs,
+            dst,
+            target_dir,
+            recursive=recursive,
+            update=update,
+            continue_=continue_,
+            file_filter=file_filter,
+            ignore_file_names=ignore_file_names,
+            parallel_segments=parallel_segments,
+            dry_run=dry_run,
+            plan_out=plan_out,
+            show_progress=show_progress,
+        )
+        if errors:
+            sys.exit(EX_OSFILE)
+        return
+
+    def journal_path(src: URL, dst: URL) -> Path:
+        return _journal_path(
+            root, src, dst, update, continue_, filters, sorted(ignore_file_names)
+        )
+
     errors = False
     for src in srcs:
         if target_dir:
@@ -419,6 +539,7 @@ async def cp(
                             filter=file_filter.match,
                             ignore_file_names=frozenset(ignore_file_names),
                             progress=progress_obj,
+                            journal=journal_path(src, dst) if resume else None,
                         )
                     else:
                         await root.client.storage.upload_file(
@@ -437,6 +558,8 @@ async def cp(
                             continue_=continue_,
                             filter=file_filter.match,
                             progress=progress_obj,
+                            parallel_segments=parallel_segments,
+                            journal=journal_path(src, dst) if resume else None,
                         )
                     else:
                         await root.client.storage.download_file(
@@ -445,6 +568,7 @@ async def cp(
                             update=update,
                             continue_=continue_,
                             progress=progress_obj,
+                            parallel_segments=parallel_segments,
                         )
                 else:
                     raise RuntimeError(
@@ -460,6 +584,241 @@ async def cp(
         sys.exit(EX_OSFILE)
 
 
+async def _cp_plan_in(
+    root: Root,
+    plan_in: TextIO,
+    *,
+    parallel_segments: int,
+    dry_run: bool,
+    show_progress: bool,
+) -> bool:
+    try:
+        plan = TransferPlan.load(plan_in)
+    except (ValueError, KeyError) as error:
+        raise click.BadParameter(
+            f"{plan_in.name} is not a transfer plan: {error}", param_hint="--plan-in"
+        )
+    if not plan.entries:
+        return False
+    src, dst = plan.entries[0].src, plan.entries[0].dst
+    try:
+        # The files may be changed since the plan was written
+        plan = await root.client.storage.check_plan(plan)
+        if dry_run:
+            root.print(
+                Text(
+                    f"{plan_in.name}: {plan.transfer_files} files, "
+                    f"{format_size(plan.transfer_bytes)} to copy, "
+                    f"{plan.skipped_files} files up to date"
+                )
+            )
+            return False
+        progress_obj = create_storage_progress(root, show_progress)
+        with progress_obj.begin(src, dst):
+            await root.client.storage.run_plan(
+                plan, progress=progress_obj, parallel_segments=parallel_segments
+            )
+    except (OSError, ValueError) as error:
+        log.error(f"cannot copy {src} to {dst}: {error}")
+        return True
+    return False
+
+
+def _journal_path(root: Root, src: URL, dst: URL, *options: Any) -> Path:
+    # Different options make a different plan
+    ident = repr((str(src), str(dst), *options))
+    key = hashlib.sha256(ident.encode()).hexdigest()[:32]
+    return root.config_path.expanduser() / "journal" / f"{key}.db"
+
+
+async def _cp_planned(
+    root: Root,
+    srcs: Sequence[URL],
+    dst: Optional[URL],
+    target_dir: Optional[URL],
+    *,
+    recursive: bool,
+    update: bool,
+    continue_: bool,
+    file_filter: FileFilter,
+    ignore_file_names: Sequence[str],
+    parallel_segments: int,
+    dry_run: bool,
+    plan_out: Optional[str],
+    show_progress: bool,
+) -> bool:
+    errors = False
+    plans = []
+    for src in srcs:
+        if target_dir:
+            dst = target_dir / src.name
+        assert dst
+        try:
+            if not recursive and await _is_dir(root, src):
+                raise IsADirectoryError(
+                    errno.EISDIR, "Is a directory, use recursive copy", str(src)
+                )
+            if src.scheme == "file" and dst.scheme == "storage":
+                plan = await root.client.storage.plan_upload(
+                    src,
+                    dst,
+                    update=update,
+                    continue_=continue_,
+                    filter=file_filter.match,
+                    ignore_file_names=frozenset(ignore_file_names),
+                )
+            elif src.scheme == "storage" and dst.scheme == "file":
+                plan = await root.client.storage.plan_download(
+                    src,
+                    dst,
+                    update=update,
+                    continue_=continue_,
+                    filter=file_filter.match,
+                )
+            else:
+                raise RuntimeError(
+                    f"Copy operation of the file with scheme '{src.scheme}'"
+                    f" to the file with scheme '{dst.scheme}'"
+                    f" is not supported"
+                )
+        except (OSError, ResourceNotFound, IllegalArgumentError) as error:
+            log.error(f"cannot copy {src} to {dst}: {error}")
+            errors = True
+            continue
+        plans.append((src, dst, plan))
+        if dry_run:
+            root.print(
+                Text(
+                    f"{src} -> {dst}: {plan.transfer_files} files, "
+                    f"{format_size(plan.transfer_bytes)} to copy, "
+                    f"{plan.skipped_files} files up to date"
+                )
+            )
+
+    if plan_out is not None:
+        with open(plan_out, "w") as stream:
+            for _, _, plan in plans:
+                plan.dump(stream)
+    if dry_run:
+        return errors
+
+    for src, dst, plan in plans:
+        progress_obj = create_storage_progress(root, show_progress)
+        try:
+            with progress_obj.begin(src, dst):
+                await root.client.storage.run_plan(
+                    plan, progress=progress_obj, parallel_segments=parallel_segments
+                )
+        except (OSError, ResourceNotFound, IllegalArgumentError) as error:
+            log.error(f"cannot copy {src} to {dst}: {error}")
+            errors = True
+    return errors
+
+
+@command()
+@argument("source")
+@argument("destination")
+@filter_option(
+    "--exclude",
+    "filters",
+    flag_value=True,
+    help=("Exclude files and directories that match the specified pattern."),
+)
+@filter_option(
+    "--include",
+    "filters",
+    flag_value=False,
+    help=("Don't exclude files and directories that match the specified pattern."),
+)
+@option(
+    "--exclude-from-files",
+    metavar="FILES",
+    help=(
+        "A list of file names that contain patterns for exclusion files "
+        "and directories. Used only for uploading. "
+        "The default can be changed using the storage.cp-exclude-from-files "
+        'configuration variable documented in "neuro help user-config"'
+    ),
+)
+@option(
+    "--manifest",
+    metavar="FILE",
+    type=click.Path(dir_okay=False),
+    help=(
+        "Local database of files transferred by previous syncs.  "
+        "By default a file in the configuration directory is used, "
+        "one per pair of SOURCE and DESTINATION."
+    ),
+)
+@option(
+    "-p/-P",
+    "--progress/--no-progress",
+    is_flag=True,
+    default=True,
+    help="Show progress, on by default in TTY mode, off otherwise.",
+)
+async def sync(
+    root: Root,
+    source: str,
+    destination: str,
+    filters: Optional[Tuple[Tuple[bool, str], ...]],
+    exclude_from_files: str,
+    manifest: Optional[str],
+    progress: bool,
+) -> None:
+    """
+    Incrementally synchronize directories.
+
+    Either SOURCE or DESTINATION should have storage:// scheme.
+    If scheme is omitted, file:// scheme is assumed.
+
+    Only files added or changed since the previous sync of the same
+    directories are transferred.  The sizes and modification times of
+    transferred files are kept in a local manifest database.  When
+    uploading, the storage is not listed at all, so remove the manifest to
+    force a full upload if files on the storage were changed by other means.
+    Files removed from SOURCE are not removed from DESTINATION.
+
+    Examples:
+
+    # upload changes of local directory `data` to remote directory `data`
+    neuro storage sync data storage:data
+
+    # download changes of remote directory `results`
+    neuro storage sync storage:results results
+    """
+    src = parse_file_resource(source, root)
+    dst = parse_file_resource(destination, root)
+    if manifest is not None:
+        manifest_path = Path(manifest)
+    else:
+        key = hashlib.sha256(f"{src} {dst}".encode()).hexdigest()[:32]
+        manifest_path = root.config_path.expanduser() / "sync" / f"{key}.db"
+
+    ignore_file_names = await calc_ignore_file_names(root.client, exclude_from_files)
+    filters = await calc_filters(root.client, filters)
+    file_filter = FileFilter()
+    for exclude, pattern in filters:
+        log.debug("%s %s", "Exclude" if exclude else "Include", pattern)
+        file_filter.append(exclude, pattern)
+
+    show_progress = root.tty and progress
+    progress_obj = create_storage_progress(root, show_progress)
+    try:
+        with progress_obj.begin(src, dst):
+            await root.client.storage.sync(
+                src,
+                dst,
+                manifest=manifest_path,
+                filter=file_filter.match,
+                ignore_file_names=frozenset(ignore_file_names),
+                progress=progress_obj,
+            )
+    except (OSError, ResourceNotFound, IllegalArgumentError, ValueError) as error:
+        log.error(f"cannot sync {src} to {dst}: {error}")
+        sys.exit(EX_OSFILE)
+
+
 @command()
 @argument("paths", nargs=-1, required=True)
 @option(
@@ -711,6 +1070,7 @@ async def _is_dir(root: Root, uri: URL) -> bool:
 
 
 storage.add_command(cp)
+storage.add_command(sync)
 storage.add_command(ls)
 storage.add_command(glob)
 storage.add_command(rm)
@@ -750,23 +1110,25 @@ async def calc_ignore_file_names(
 
 
 async def fetch_tree(client: Client, uri: URL, show_all: bool) -> Tree:
-    loop = asyncio.get_event_loop()
-    folders = []
-    files = []
-    tasks = []
-    size = 0
-    async for item in client.storage.ls(uri):
-        if not show_all and item.name.startswith("."):
-            continue
-        if item.is_dir():
-            tasks.append(
-                loop.create_task(fetch_tree(client, uri / item.name, show_all))
-            )
-        else:
-            files.append(item)
-            size += item.size
-    for task in tasks:
-        subtree = await task
-        folders.append(subtree)
-        size += subtree.size
-    return Tree(uri.name, size, folders, files)
+    def visible(item: FileStatus) -> bool:
+        return show_all or not item.name.startswith(".")
+
+    listings: Dict[URL, List[FileStatus]] = {}
+    async for folder, items in client.storage.walk(uri, descend=visible):
+        listings[folder] = [item for item in items if visible(item)]
+
+    def build(folder: URL) -> Tree:
+        folders = []
+        files = []
+        size = 0
+        for item in listings[folder]:
+            if item.is_dir():
+                subtree = build(folder / item.name)
+                folders.append(subtree)
+                size += subtree.size
+            else:
+                files.append(item)
+                size += item.size
+        return Tree(folder.name, size, folders, files)
+
+    return build(uri)
@@ -509,13 +509,12 @@ def parse_blob_resource(uri: str, root: Root) -> URL:
     )
 
 
-def parse_blob_or_file_resource(uri: str, root: Root) -> URL:
-    # Username will not be used, just part of the signature
+def parse_blob_file_or_storage_resource(uri: str, root: Root) -> URL:
     return uri_from_cli(
         uri,
         root.client.username,
         root.client.cluster_name,
-        allowed_schemes=("blob", "file"),
+        allowed_schemes=("blob", "file", "storage"),
     )
 
 
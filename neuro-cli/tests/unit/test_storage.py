@@ -1,11 +1,17 @@
 from pathlib import Path
-from typing import Any, Callable
+from typing import Any, Callable, List
+from unittest import mock
 
 import toml
+from yarl import URL
 
 from neuro_sdk import Client
 
-from neuro_cli.storage import calc_filters, calc_ignore_file_names
+from neuro_cli.storage import _journal_path, calc_filters, calc_ignore_file_names
+
+from .conftest import SysCapWithCode
+
+_RunCli = Callable[[List[str]], SysCapWithCode]
 
 _MakeClient = Callable[..., Client]
 
@@ -82,3 +88,37 @@ async def test_calc_ignore_file_names_user_spec(
             )
         )
         assert await calc_ignore_file_names(client, None) == [".gitignore", ".hgignore"]
+
+
+def test_cp_plan_in_with_sources(run_cli: _RunCli, tmp_path: Path) -> None:
+    plan = tmp_path / "plan.json"
+    plan.write_text("\n")
+    capture = run_cli(["storage", "cp", "--plan-in", str(plan), "foo", "storage:foo"])
+    assert capture.code == 2
+    assert "Cannot combine --plan-in with SOURCES and DESTINATION" in capture.err
+
+
+def test_cp_plan_in_empty(run_cli: _RunCli, tmp_path: Path) -> None:
+    plan = tmp_path / "plan.json"
+    plan.write_text("\n")
+    capture = run_cli(["storage", "cp", "--plan-in", str(plan)])
+    assert capture.code == 0, capture
+
+
+def test_cp_plan_in_malformed(run_cli: _RunCli, tmp_path: Path) -> None:
+    plan = tmp_path / "plan.json"
+    plan.write_text("not json\n")
+    capture = run_cli(["storage", "cp", "--plan-in", str(plan)])
+    assert capture.code == 2
+    assert "is not a transfer plan" in capture.err
+
+
+def test_journal_path_depends_on_options(tmp_path: Path) -> None:
+    root = mock.Mock(config_path=tmp_path)
+    src = URL("file:///folder")
+    dst = URL("storage://default/user/folder")
+    path = _journal_path(root, src, dst, False, False, (), [])
+    assert path.parent == tmp_path / "journal"
+    assert _journal_path(root, src, dst, False, False, (), []) == path
+    assert _journal_path(root, src, dst, True, False, (), []) != path
+    assert _journal_path(root, src, dst, False, False, ((True, "*.jpg"),), []) != path
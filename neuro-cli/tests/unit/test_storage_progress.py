@@ -1,7 +1,7 @@
 import sys
 from itertools import product
 from pathlib import Path
-from typing import Any, Callable, Iterator
+from typing import Any, Callable, Iterator, List
 
 import pytest
 from yarl import URL
@@ -161,6 +161,61 @@ def test_progress(
     rich_cmp(root.console, index=7)
 
 
+def test_progress_rollup(make_root: _MakeRoot, time_ctl: TimeCtl) -> None:
+    root = make_root(False, True, False)
+    assert root.terminal_size[1] == 24
+    report = TTYProgress(root, get_time=time_ctl.get_time, auto_refresh=False)
+    dst = URL("storage:xyz")
+    srcs = [URL(f"file:///file{i}") for i in range(25)]
+
+    def rows() -> List[str]:
+        return [str(task.fields["filename"]) for task in report._progress.tasks]
+
+    for src in srcs:
+        report.start(StorageProgressStart(src, dst, 100))
+    assert rows() == [f"file{i}" for i in range(21)] + ["4 files in flight"]
+    rollup = report._progress.tasks[-1]
+    assert rollup.total == 400
+
+    report.step(StorageProgressStep(srcs[22], dst, 30, 100))
+    report.step(StorageProgressStep(srcs[24], dst, 50, 100))
+    assert report._progress.tasks[-1].completed == 80
+
+    report.complete(StorageProgressComplete(srcs[3], dst, 100))
+    # the first rolled up file takes the free row
+    assert rows() == [f"file{i}" for i in range(21) if i != 3] + [
+        "file22",
+        "3 files in flight",
+    ]
+    assert report._progress.tasks[-1].total == 300
+    assert report._progress.tasks[-1].completed == 50
+    assert report._progress.tasks[-2].completed == 30
+
+    report.complete(StorageProgressComplete(srcs[0], dst, 100))
+    assert rows() == [f"file{i}" for i in range(1, 21) if i != 3] + [
+        "file22",
+        "file21",
+        "2 files in flight",
+    ]
+    assert report._progress.tasks[-1].completed == 50
+
+    report.complete(StorageProgressComplete(srcs[1], dst, 100))
+    # All files fit the terminal now
+    assert rows() == [f"file{i}" for i in range(2, 21) if i != 3] + [
+        "file22",
+        "file21",
+        "file23",
+        "file24",
+    ]
+    assert report._progress.tasks[-1].completed == 50
+
+    for i in range(2, 25):
+        if i != 3:
+            report.complete(StorageProgressComplete(srcs[i], dst, 100))
+    assert rows() == []
+    report.end()
+
+
 @pytest.mark.skipif(
     sys.platform == "win32",
     reason="Windows does not supports UNIX-like permissions",
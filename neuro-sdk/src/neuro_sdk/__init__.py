@@ -16,6 +16,7 @@ from .abc import (
     ImageProgressSave,
     ImageProgressStep,
     StorageProgressComplete,
+    StorageProgressConcurrency,
     StorageProgressDelete,
     StorageProgressEnterDir,
     StorageProgressFail,
@@ -23,7 +24,14 @@ from .abc import (
     StorageProgressStart,
     StorageProgressStep,
 )
-from .blob_storage import Blob, BlobListing, BlobStorage, BucketListing, PrefixListing
+from .blob_storage import (
+    Blob,
+    BlobListing,
+    BlobPart,
+    BlobStorage,
+    BucketListing,
+    PrefixListing,
+)
 from .client import Client, Preset
 from .config import Config
 from .config_factory import (
@@ -43,7 +51,9 @@ from .errors import (
     ConfigError,
     IllegalArgumentError,
     ResourceNotFound,
+    ServerError,
     ServerNotAvailable,
+    TooManyRequests,
 )
 from .images import Images
 from .jobs import (
@@ -63,7 +73,14 @@ from .parsing_utils import LocalImage, RemoteImage, TagOption
 from .plugins import ConfigBuilder, PluginManager
 from .secrets import Secret, Secrets
 from .server_cfg import Cluster
-from .storage import FileStatus, FileStatusType, Storage
+from .storage import (
+    FileStatus,
+    FileStatusType,
+    Storage,
+    StorageFile,
+    TransferPlan,
+    TransferPlanEntry,
+)
 from .tracing import gen_trace_id
 from .users import Action, Permission, Share, Users
 from .utils import _ContextManager, find_project_root
@@ -83,6 +100,7 @@ __all__ = (
     "AuthorizationError",
     "Blob",
     "BlobListing",
+    "BlobPart",
     "BlobStorage",
     "BucketListing",
     "CONFIG_ENV_NAME",
@@ -129,11 +147,14 @@ __all__ = (
     "Secret",
     "SecretFile",
     "Secrets",
+    "ServerError",
     "ServerNotAvailable",
     "Share",
     "StdStream",
     "Storage",
+    "StorageFile",
     "StorageProgressComplete",
+    "StorageProgressConcurrency",
     "StorageProgressDelete",
     "StorageProgressEnterDir",
     "StorageProgressFail",
@@ -141,6 +162,9 @@ __all__ = (
     "StorageProgressStart",
     "StorageProgressStep",
     "TagOption",
+    "TooManyRequests",
+    "TransferPlan",
+    "TransferPlanEntry",
     "Users",
     "Volume",
     "find_project_root",
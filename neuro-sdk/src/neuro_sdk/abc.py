@@ -56,6 +56,13 @@ class StorageProgressDelete:
     is_dir: bool
 
 
+@dataclass(frozen=True)
+class StorageProgressConcurrency:
+    limit: int
+    in_flight: int
+    throughput: float  # bytes per second
+
+
 class AbstractFileProgress(abc.ABC):
     # design note:
     # dataclasses used instead of direct passing parameters
@@ -75,6 +82,10 @@ class AbstractFileProgress(abc.ABC):
     def step(self, data: StorageProgressStep) -> None:
         pass  # pragma: no cover
 
+    # Not abstract to keep existing implementations working
+    def concurrency(self, data: StorageProgressConcurrency) -> None:
+        pass  # pragma: no cover
+
 
 class AbstractRecursiveFileProgress(AbstractFileProgress):
     @abc.abstractmethod
@@ -96,7 +107,7 @@ class AbstractDeleteProgress(abc.ABC):
         pass  # pragma: no cover
 
 
-# Next class for typing only (wrapped with queue_calls version of above classes)
+# Next class for typing only (async versions of above classes used by transfers)
 
 
 class _AsyncAbstractFileProgress(abc.ABC):
@@ -108,8 +119,10 @@ class _AsyncAbstractFileProgress(abc.ABC):
     async def complete(self, data: StorageProgressComplete) -> None:
         pass  # pragma: no cover
 
+    # Called for every transferred chunk, so StorageProgressStep is created
+    # only when the event is delivered
     @abc.abstractmethod
-    async def step(self, data: StorageProgressStep) -> None:
+    async def step(self, src: URL, dst: URL, current: int, size: int) -> None:
         pass  # pragma: no cover
 
 
@@ -2,14 +2,19 @@ import asyncio
 import base64
 import errno
 import hashlib
-import itertools
+import io
 import logging
+import mmap
 import os
 import re
+import sqlite3
 import sys
+import threading
 import time
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from email.utils import parsedate_to_datetime
+from functools import partial
 from pathlib import Path, PurePath
 from stat import S_ISREG
 from typing import (
@@ -19,12 +24,13 @@ from typing import (
     Awaitable,
     Callable,
     Dict,
+    Iterator,
     List,
     Optional,
     Sequence,
+    Set,
     Tuple,
     Union,
-    cast,
 )
 
 import aiohttp
@@ -40,26 +46,45 @@ from .abc import (
     StorageProgressFail,
     StorageProgressLeaveDir,
     StorageProgressStart,
-    StorageProgressStep,
     _AsyncAbstractFileProgress,
     _AsyncAbstractRecursiveFileProgress,
 )
 from .config import Config
 from .core import _Core
-from .errors import ResourceNotFound
+from .errors import ClientError, ResourceNotFound, ServerError
 from .file_filter import FileFilter, translate
 from .storage import (
+    MAX_INFLIGHT_BYTES,
+    MAX_LISTINGS,
+    MIN_OPEN_FILES,
+    OPEN_FILES_LIMIT,
+    PREFETCH_BYTES,
+    PREFETCH_FILES,
+    SEGMENT_SIZE,
+    STREAM_BUFFER_SIZE,
     TIME_THRESHOLD,
+    Storage,
+    _AdaptiveLimiter,
     _always,
+    _check_prefetch,
+    _check_segments,
+    _CoalescingWriter,
+    _download_segments,
     _has_magic,
+    _iter_buffered,
+    _iter_prefetched,
     _magic_check,
     _parse_content_range,
+    _PositionalWriter,
+    _ProgressPipeline,
+    _scan_dir_async,
+    _TransferDir,
+    _TransferScheduler,
     run_concurrently,
-    run_progress,
 )
 from .url_utils import _extract_path, normalize_blob_path_uri, normalize_local_path_uri
 from .users import Action
-from .utils import NoPublicConstructor, queue_calls, retries
+from .utils import NoPublicConstructor, retries
 
 if sys.version_info >= (3, 7):  # pragma: no cover
     from contextlib import asynccontextmanager
@@ -69,8 +94,22 @@ else:
 
 log = logging.getLogger(__name__)
 
-MAX_OPEN_FILES = 20
+MAX_OPEN_FILES = 20  # initial limit, adapted to throughput by _AdaptiveLimiter
 READ_SIZE = 2 ** 20  # 1 MiB
+# Files of at least this size are uploaded in parts, see _upload_multipart()
+MULTIPART_THRESHOLD = 64 * 2 ** 20  # 64 MiB
+PART_SIZE = 16 * 2 ** 20  # 16 MiB
+MAX_PARTS_IN_FLIGHT = 4  # per file
+# Parts read into memory by all uploads together, 256 MiB with default PART_SIZE
+MAX_BUFFERED_PARTS = 16
+# Threads hashing files, hashlib releases the GIL for large buffers
+MD5_WORKERS = os.cpu_count() or 4
+# Digests of files modified within this many seconds before hashing are not
+# cached, a rewrite in the same mtime tick would not change the cache key
+# (2 seconds is the granularity of FAT)
+MTIME_GRANULARITY = 2.0
+# Files of at least this size are uploaded from a memory mapping, see _iter_mmap()
+MMAP_THRESHOLD: Optional[int] = None
 
 ProgressQueueItem = Optional[Any]
 
@@ -161,6 +200,12 @@ class PrefixListing:
         return True
 
 
+@dataclass(frozen=True)
+class BlobPart:
+    part_number: int
+    etag: str
+
+
 class Blob:
     def __init__(self, resp: aiohttp.ClientResponse, stats: BlobListing):
         self._resp = resp
@@ -172,14 +217,24 @@ class Blob:
 
 
 class BlobStorage(metaclass=NoPublicConstructor):
-    def __init__(self, core: _Core, config: Config) -> None:
+    def __init__(self, core: _Core, config: Config, storage: Storage) -> None:
         self._core = core
         self._config = config
+        self._storage = storage
+        self._md5_cache = _DigestCache(config._path / "md5_cache.db")
         self._default_batch_size = 1000
-        self._file_sem = asyncio.BoundedSemaphore(MAX_OPEN_FILES)
+        self._file_limiter = _AdaptiveLimiter(
+            MAX_OPEN_FILES, min_limit=MIN_OPEN_FILES, max_limit=OPEN_FILES_LIMIT
+        )
+        self._part_limiter = asyncio.Semaphore(MAX_BUFFERED_PARTS)
+        # Cleared if the server rejects multipart uploads
+        self._multipart_supported = True
         self._min_time_diff = 0.0
         self._max_time_diff = 0.0
 
+    def _close(self) -> None:
+        self._md5_cache.close()
+
     async def list_buckets(self) -> List[BucketListing]:
         url = self._config.blob_storage_url / "b" / ""
         auth = await self._config._api_auth()
@@ -208,17 +263,42 @@ class BlobStorage(metaclass=NoPublicConstructor):
         prefix: str = "",
         recursive: bool = False,
         max_keys: Optional[int] = None,
+        start_after: Optional[str] = None,
     ) -> Tuple[Sequence[BlobListing], Sequence[PrefixListing]]:
         contents: List[BlobListing] = []
         common_prefixes: List[PrefixListing] = []
 
         async for blobs, prefixes in self._iter_blob_pages(
-            bucket_name, prefix, recursive=recursive, max_keys=max_keys
+            bucket_name,
+            prefix,
+            recursive=recursive,
+            max_keys=max_keys,
+            start_after=start_after,
         ):
             contents.extend(blobs)
             common_prefixes.extend(prefixes)
         return contents, common_prefixes
 
+    async def iter_blobs(
+        self,
+        bucket_name: str,
+        prefix: str = "",
+        recursive: bool = False,
+        max_keys: Optional[int] = None,
+        start_after: Optional[str] = None,
+    ) -> AsyncIterator[Union[BlobListing, PrefixListing]]:
+        async for blobs, prefixes in self._iter_blob_pages(
+            bucket_name,
+            prefix,
+            recursive=recursive,
+            max_keys=max_keys,
+            start_after=start_after,
+        ):
+            items: List[Union[BlobListing, PrefixListing]] = [*blobs, *prefixes]
+            items.sort(key=lambda item: item.path)
+            for item in items:
+                yield item
+
     async def _iter_blob_pages(
         self,
         bucket_name: str,
@@ -227,6 +307,7 @@ class BlobStorage(metaclass=NoPublicConstructor):
         recursive: bool = False,
         batch_size: Optional[int] = None,
         max_keys: Optional[int] = None,
+        start_after: Optional[str] = None,
     ) -> AsyncIterator[Tuple[Sequence[BlobListing], Sequence[PrefixListing]]]:
         url = self._config.blob_storage_url / "o" / bucket_name
         auth = await self._config._api_auth()
@@ -241,35 +322,139 @@ class BlobStorage(metaclass=NoPublicConstructor):
         query = {"recursive": str(recursive).lower(), "max_keys": str(next_page_size)}
         if prefix:
             query["prefix"] = prefix
+        if start_after:
+            query["start_after"] = start_after
         url = url.with_query(query)
 
-        while True:
+        async def fetch(url: URL) -> Dict[str, Any]:
             request_time = time.time()
             async with self._core.request("GET", url, auth=auth) as resp:
                 self._set_time_diff(request_time, resp)
-                res = await resp.json()
-            contents = [
-                _blob_status_from_key(bucket_name, key) for key in res["contents"]
-            ]
+                return await resp.json()
 
-            common_prefixes = [
-                _blob_status_from_prefix(bucket_name, prefix)
-                for prefix in res["common_prefixes"]
-            ]
-            yield contents, common_prefixes
-
-            if res["is_truncated"]:
-                continuation_token = res["continuation_token"]
-                url = url.update_query(continuation_token=continuation_token)
-                # Limit the next page if we are reaching max_keys limit
-                if max_keys is not None:
-                    max_keys -= len(contents) + len(common_prefixes)
-                    if max_keys <= 0:
-                        break
-                    next_page_size = min(max_keys, batch_size)
-                    url = url.update_query(max_keys=str(next_page_size))
-            else:
-                break
+        # The next page is requested while the caller processes the current one
+        next_page: Optional["asyncio.Future[Dict[str, Any]]"] = asyncio.ensure_future(
+            fetch(url)
+        )
+        try:
+            while next_page is not None:
+                res = await next_page
+                next_page = None
+                contents = [
+                    _blob_status_from_key(bucket_name, key) for key in res["contents"]
+                ]
+
+                common_prefixes = [
+                    _blob_status_from_prefix(bucket_name, prefix)
+                    for prefix in res["common_prefixes"]
+                ]
+
+                if res["is_truncated"]:
+                    continuation_token = res["continuation_token"]
+                    url = url.update_query(continuation_token=continuation_token)
+                    # Limit the next page if we are reaching max_keys limit
+                    if max_keys is not None:
+                        max_keys -= len(contents) + len(common_prefixes)
+                        next_page_size = min(max_keys, batch_size)
+                        url = url.update_query(max_keys=str(next_page_size))
+                    if max_keys is None or max_keys > 0:
+                        next_page = asyncio.ensure_future(fetch(url))
+                yield contents, common_prefixes
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+                await asyncio.wait([next_page])
+                if not next_page.cancelled():
+                    # Retrieve the error of the abandoned request
+                    next_page.exception()
+
+    async def _iter_blobs(
+        self, uri: URL, bucket_name: str, prefix: str
+    ) -> AsyncIterator[BlobListing]:
+        # All blobs under the prefix in a single recursive listing, a failed
+        # listing is resumed after the last yielded key.  Keys are skipped up
+        # to it too, for a server which ignores start_after.
+        last_key: Optional[str] = None
+        for retry in retries(f"Fail to list {uri}"):
+            async with retry:
+                async for blobs, _ in self._iter_blob_pages(
+                    bucket_name, prefix, recursive=True, start_after=last_key
+                ):
+                    for blob in blobs:
+                        if last_key is not None and blob.key <= last_key:
+                            continue
+                        last_key = blob.key
+                        yield blob
+                    if blobs:
+                        retry.reset()
+
+    async def _index_blobs(
+        self, uri: URL, bucket_name: str, prefix: str
+    ) -> "_BlobIndex":
+        index = _BlobIndex()
+        try:
+            async for blob in self._iter_blobs(uri, bucket_name, prefix):
+                index.add(blob.key[len(prefix) :], blob)
+        except ResourceNotFound:
+            pass
+        return index
+
+    async def _walk_blobs(
+        self,
+        root: "_BlobTreeDir",
+        *,
+        filter: Callable[[str], Awaitable[bool]],
+        enter_dir: Callable[["_BlobTreeDir", str, str], Awaitable["_BlobTreeDir"]],
+        add_file: Callable[["_BlobTreeDir", BlobListing, str], Awaitable[None]],
+    ) -> None:
+        # Walk the tree of blobs under root.src by a single recursive listing,
+        # the files are added to the transfer as pages arrive.  *dirs* is
+        # the path from the root to the directory of the last listed key.
+        bucket_name, folder_key = self._extract_bucket_and_key(root.src)
+        prefix_path = folder_key.strip("/")
+        if prefix_path:
+            prefix_path += "/"
+        dirs = [root]
+        async for blob in self._iter_blobs(root.src, bucket_name, prefix_path):
+            assert blob.key.startswith(prefix_path)
+            *names, name = blob.key[len(prefix_path) :].split("/")
+            if "" in names:
+                log.debug(f"Skip {blob.key}")
+                continue
+            # Keys are listed in lexicographical order, so a directory is
+            # complete when a key outside of it is listed.
+            depth = 0
+            while (
+                depth < len(names)
+                and depth + 1 < len(dirs)
+                and dirs[depth + 1].name == names[depth]
+            ):
+                depth += 1
+            while len(dirs) > depth + 1:
+                await dirs.pop().leave()
+            for dir_name in names[depth:]:
+                parent = dirs[-1]
+                rel_path = f"{parent.rel_path}{dir_name}/"
+                if parent.node is not None and await filter(rel_path):
+                    child = await enter_dir(parent, dir_name, rel_path)
+                else:
+                    if parent.node is not None:
+                        log.debug(f"Skip {rel_path}")
+                    child = _BlobTreeDir(
+                        dir_name, rel_path, parent.src / dir_name, parent.dst / dir_name
+                    )
+                dirs.append(child)
+            parent = dirs[-1]
+            # Skip "folder" keys, the directory is already entered
+            if parent.node is None or not name:
+                continue
+            rel_path = f"{parent.rel_path}{name}"
+            if not await filter(rel_path):
+                log.debug(f"Skip {rel_path}")
+                continue
+            await add_file(parent, blob, name)
+        while len(dirs) > 1:
+            await dirs.pop().leave()
 
     async def glob_blobs(
         self, bucket_name: str, pattern: str
@@ -396,6 +581,53 @@ class BlobStorage(metaclass=NoPublicConstructor):
             async for data in blob.body_stream.iter_any():
                 yield data
 
+    async def iter_contents(
+        self,
+        uri: URL,
+        *,
+        pattern: str = "**",
+        concurrency: int = PREFETCH_FILES,
+        prefetch_bytes: int = PREFETCH_BYTES,
+    ) -> AsyncIterator[Tuple[URL, bytes]]:
+        _check_prefetch(concurrency, prefetch_bytes)
+        bucket_name, key = self._extract_bucket_and_key(uri)
+        prefix = key.strip("/")
+        if prefix:
+            prefix += "/"
+        match = re.compile(translate(pattern.lstrip("/")), re.DOTALL).fullmatch
+
+        async def list_blobs() -> AsyncIterator[Tuple[BlobListing, int]]:
+            async for blobs, _ in self._iter_blob_pages(
+                bucket_name, prefix, recursive=True
+            ):
+                for blob in blobs:
+                    if blob.is_file() and match(blob.key[len(prefix) :]):
+                        yield blob, blob.size
+
+        async def fetch(blob: BlobListing, size: int) -> bytes:
+            buf = bytearray()
+            for retry in retries(
+                f"Fail to read {blob.uri}", on_congestion=self._file_limiter.congested
+            ):
+                if len(buf) >= size:
+                    break
+                async with retry:
+                    async for chunk in self.fetch_blob(
+                        bucket_name, blob.key, offset=len(buf)
+                    ):
+                        buf += chunk
+                        if chunk:
+                            retry.reset()
+            return bytes(buf)
+
+        async for blob, data in _iter_prefetched(
+            list_blobs(),
+            fetch,
+            concurrency=concurrency,
+            prefetch_bytes=prefetch_bytes,
+        ):
+            yield blob.uri, data
+
     async def put_blob(
         self,
         bucket_name: str,
@@ -436,6 +668,70 @@ class BlobStorage(metaclass=NoPublicConstructor):
         async with self._core.request("DELETE", url, auth=auth) as resp:
             assert resp.status == 204
 
+    async def create_multipart_upload(self, bucket_name: str, key: str) -> str:
+        url = self._config.blob_storage_url / "o" / bucket_name / key
+        url = url.with_query("uploads")
+        auth = await self._config._api_auth()
+
+        async with self._core.request("POST", url, auth=auth) as resp:
+            res = await resp.json()
+            return res["upload_id"]
+
+    async def upload_part(
+        self,
+        bucket_name: str,
+        key: str,
+        upload_id: str,
+        part_number: int,
+        body: bytes,
+        content_md5: Optional[str] = None,
+    ) -> BlobPart:
+        url = self._config.blob_storage_url / "o" / bucket_name / key
+        url = url.with_query(uploadId=upload_id, partNumber=str(part_number))
+        auth = await self._config._api_auth()
+        timeout = attr.evolve(self._core.timeout, sock_read=None)
+        headers = {}
+        if content_md5 is not None:
+            headers["Content-MD5"] = content_md5
+
+        # A file-like object is sent in chunks without blocking the event loop
+        async with self._core.request(
+            "PUT",
+            url,
+            data=io.BytesIO(body),
+            timeout=timeout,
+            auth=auth,
+            headers=headers,
+        ) as resp:
+            return BlobPart(part_number, resp.headers["ETag"])
+
+    async def complete_multipart_upload(
+        self, bucket_name: str, key: str, upload_id: str, parts: Sequence[BlobPart]
+    ) -> str:
+        url = self._config.blob_storage_url / "o" / bucket_name / key
+        url = url.with_query(uploadId=upload_id)
+        auth = await self._config._api_auth()
+        data = {
+            "parts": [
+                {"part_number": part.part_number, "etag": part.etag}
+                for part in sorted(parts, key=lambda part: part.part_number)
+            ]
+        }
+
+        async with self._core.request("POST", url, json=data, auth=auth) as resp:
+            etag = resp.headers["ETag"]
+            return etag
+
+    async def abort_multipart_upload(
+        self, bucket_name: str, key: str, upload_id: str
+    ) -> None:
+        url = self._config.blob_storage_url / "o" / bucket_name / key
+        url = url.with_query(uploadId=upload_id)
+        auth = await self._config._api_auth()
+
+        async with self._core.request("DELETE", url, auth=auth) as resp:
+            assert resp.status == 204
+
     # high-level helpers
 
     async def _iterate_file(
@@ -448,18 +744,93 @@ class BlobStorage(metaclass=NoPublicConstructor):
     ) -> AsyncIterator[bytes]:
         loop = asyncio.get_event_loop()
         src_url = URL(src.as_uri())
-        async with self._file_sem:
+        async with self._file_limiter:
             with src.open("rb") as stream:
                 await progress.start(StorageProgressStart(src_url, dst, size))
+                if MMAP_THRESHOLD is not None and size >= max(MMAP_THRESHOLD, 1):
+                    pos = 0
+                    for view in _iter_mmap(stream.fileno(), size, READ_SIZE):
+                        pos += len(view)
+                        await progress.step(src_url, dst, pos, size)
+                        yield view
+                    await progress.complete(StorageProgressComplete(src_url, dst, size))
+                    return
                 chunk = await loop.run_in_executor(None, stream.read, READ_SIZE)
                 pos = len(chunk)
                 while chunk:
-                    await progress.step(StorageProgressStep(src_url, dst, pos, size))
+                    await progress.step(src_url, dst, pos, size)
                     yield chunk
                     chunk = await loop.run_in_executor(None, stream.read, READ_SIZE)
                     pos += len(chunk)
                 await progress.complete(StorageProgressComplete(src_url, dst, size))
 
+    async def _iterate_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        src: URL,
+        dst: URL,
+        size: int,
+        *,
+        progress: _AsyncAbstractFileProgress,
+    ) -> AsyncIterator[bytes]:
+        async with self._file_limiter:
+            await progress.start(StorageProgressStart(src, dst, size))
+            pos = 0
+            async for chunk in _iter_buffered(chunks, STREAM_BUFFER_SIZE):
+                pos += len(chunk)
+                await progress.step(src, dst, pos, size)
+                yield chunk
+            await progress.complete(StorageProgressComplete(src, dst, size))
+
+    async def _fetch_stream(self, uri: URL, size: int) -> AsyncIterator[bytes]:
+        bucket_name, key = self._extract_bucket_and_key(uri)
+        pos = 0
+        for retry in retries(
+            f"Fail to read {uri}", on_congestion=self._file_limiter.congested
+        ):
+            if pos >= size:
+                break
+            async with retry:
+                async for chunk in self.fetch_blob(
+                    bucket_name=bucket_name, key=key, offset=pos
+                ):
+                    pos += len(chunk)
+                    yield chunk
+                    if chunk:
+                        retry.reset()
+
+    async def _calc_md5(self, path: Path) -> Tuple[str, int]:
+        try:
+            before = path.stat()
+        except OSError:
+            return await calc_md5(path)
+        if not S_ISREG(before.st_mode):
+            return await calc_md5(path)
+        loop = asyncio.get_event_loop()
+        content_md5 = await loop.run_in_executor(
+            _md5_executor(), self._md5_cache.get, before
+        )
+        if content_md5 is not None:
+            return content_md5, before.st_size
+        hashed_at = time.time()
+        content_md5, size = await calc_md5(path)
+        try:
+            after = path.stat()
+        except OSError:
+            pass
+        else:
+            # Do not cache the digest of a file modified while it was hashed,
+            # or so shortly before that it can be modified again unnoticed
+            if (
+                _digest_key(after) == _digest_key(before)
+                and size == after.st_size
+                and after.st_mtime < hashed_at - MTIME_GRANULARITY
+            ):
+                await loop.run_in_executor(
+                    _md5_executor(), self._md5_cache.put, after, content_md5
+                )
+        return content_md5, size
+
     def _extract_bucket_and_key(self, uri: URL) -> Tuple[str, str]:
         cluster_name = self._config.cluster_name
         uri = normalize_blob_path_uri(uri, cluster_name)
@@ -497,6 +868,39 @@ class BlobStorage(metaclass=NoPublicConstructor):
         assert key.strip("/"), "Can not create a bucket root folder"
         await self.put_blob(bucket_name=bucket_name, key=key, body=b"")
 
+    async def _check_dir_target(self, bucket_name: str, key: str, dst: URL) -> None:
+        try:
+            # Make sure we don't have name conflicts
+            # We can't upload to folder `/path/to/file.txt/` if
+            # `/path/to/file.txt` already exists
+            await self.head_blob(bucket_name=bucket_name, key=key)
+        except ResourceNotFound:
+            pass
+        else:
+            raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(dst))
+
+    async def _check_upload_target(self, dst: URL) -> None:
+        # Avoid name conflicts when uploading
+        bucket_name, key = self._extract_bucket_and_key(dst)
+        parent, _, _ = key.rpartition("/")
+        if await self._is_dir(dst):
+            # Uploading to keys like `prefix/` is prohibited, as they count as `folder`
+            # keys and should only be 0-sized blobs.
+            raise IsADirectoryError(errno.EISDIR, "Is a directory", str(dst))
+        elif parent:
+            # We can't upload files to path like: `path/to/file.txt/new_file.json`
+            # if a file `path/to/file.txt` already exists. This is likely an error in
+            # the cli command call and will cause confusing behaviour on download.
+            assert not parent.endswith("/")
+            try:
+                await self.head_blob(bucket_name=bucket_name, key=parent)
+            except ResourceNotFound:
+                pass
+            else:
+                raise NotADirectoryError(
+                    errno.ENOTDIR, "Not a directory", str(dst.parent)
+                )
+
     def _set_time_diff(self, request_time: float, resp: aiohttp.ClientResponse) -> None:
         response_time = time.time()
         try:
@@ -573,27 +977,9 @@ class BlobStorage(metaclass=NoPublicConstructor):
             # Ignore stat errors for device files like NUL or CON on Windows.
             # See https://bugs.python.org/issue37074
 
-        # Avoid name conflicts when uploading
-        bucket_name, key = self._extract_bucket_and_key(dst)
-        parent, _, _ = key.rpartition("/")
-        if await self._is_dir(dst):
-            # Uploading to keys like `prefix/` is prohibited, as they count as `folder`
-            # keys and should only be 0-sized blobs.
-            raise IsADirectoryError(errno.EISDIR, "Is a directory", str(dst))
-        elif parent:
-            # We can't upload files to path like: `path/to/file.txt/new_file.json`
-            # if a file `path/to/file.txt` already exists. This is likely an error in
-            # the cli command call and will cause confusing behaviour on download.
-            assert not parent.endswith("/")
-            try:
-                await self.head_blob(bucket_name=bucket_name, key=parent)
-            except ResourceNotFound:
-                pass
-            else:
-                raise NotADirectoryError(
-                    errno.ENOTDIR, "Not a directory", str(dst.parent)
-                )
+        await self._check_upload_target(dst)
 
+        bucket_name, key = self._extract_bucket_and_key(dst)
         if update:
             try:
                 dst_stat = await self.head_blob(bucket_name=bucket_name, key=key)
@@ -610,9 +996,8 @@ class BlobStorage(metaclass=NoPublicConstructor):
                         if offset is None:
                             return
 
-        async_progress: _AsyncAbstractFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(queue, self._upload_file(path, dst, progress=async_progress))
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        await async_progress.run(self._upload_file(path, dst, progress=async_progress))
 
     async def _upload_file(
         self,
@@ -622,11 +1007,28 @@ class BlobStorage(metaclass=NoPublicConstructor):
         progress: _AsyncAbstractFileProgress,
     ) -> None:
         bucket_name, key = self._extract_bucket_and_key(dst)
+        try:
+            src_stat = src_path.stat()
+        except OSError:
+            pass
+        else:
+            if (
+                S_ISREG(src_stat.st_mode)
+                and src_stat.st_size >= MULTIPART_THRESHOLD
+                and self._multipart_supported
+            ):
+                if await self._upload_multipart(
+                    src_path, dst, src_stat.st_size, progress=progress
+                ):
+                    return
+
         # Be careful not to have too many opened files.
-        async with self._file_sem:
-            content_md5, size = await calc_md5(src_path)
+        async with self._file_limiter:
+            content_md5, size = await self._calc_md5(src_path)
 
-        for retry in retries(f"Fail to upload {dst}"):
+        for retry in retries(
+            f"Fail to upload {dst}", on_congestion=self._file_limiter.congested
+        ):
             async with retry:
                 await self.put_blob(
                     bucket_name=bucket_name,
@@ -636,6 +1038,84 @@ class BlobStorage(metaclass=NoPublicConstructor):
                     content_md5=content_md5,
                 )
 
+    async def _upload_multipart(
+        self,
+        src_path: Path,
+        dst: URL,
+        size: int,
+        *,
+        progress: _AsyncAbstractFileProgress,
+    ) -> bool:
+        # Parts are read and hashed independently, so only a failed part is
+        # sent again; MAX_PARTS_IN_FLIGHT parts are uploaded concurrently.
+        # Return False if the server does not support multipart uploads.
+        bucket_name, key = self._extract_bucket_and_key(dst)
+        src = URL(src_path.as_uri())
+        part_size = PART_SIZE
+        offsets = iter(enumerate(range(0, size, part_size), 1))
+        parts: List[BlobPart] = []
+        uploaded = 0
+
+        async def upload_part(upload_id: str, part_number: int, offset: int) -> None:
+            nonlocal uploaded
+            # The data is kept for retries, the memory of all uploads is bounded
+            async with self._part_limiter:
+                data, content_md5 = await _read_part(src_path, offset, part_size)
+                for retry in retries(
+                    f"Fail to upload part {part_number} of {dst}",
+                    on_congestion=self._file_limiter.congested,
+                ):
+                    async with retry:
+                        part = await self.upload_part(
+                            bucket_name,
+                            key,
+                            upload_id,
+                            part_number,
+                            data,
+                            content_md5=content_md5,
+                        )
+            parts.append(part)
+            uploaded += len(data)
+            await progress.step(src, dst, uploaded, size)
+
+        async def worker(upload_id: str) -> None:
+            for part_number, offset in offsets:
+                await upload_part(upload_id, part_number, offset)
+
+        async with self._file_limiter:
+            try:
+                for retry in retries(
+                    f"Fail to upload {dst}", on_congestion=self._file_limiter.congested
+                ):
+                    async with retry:
+                        upload_id = await self.create_multipart_upload(bucket_name, key)
+            except (ResourceNotFound, ServerError, ClientError) as e:
+                if not _multipart_unsupported(e):
+                    raise
+                log.info(f"Multipart upload is not supported, upload {dst} whole: {e}")
+                self._multipart_supported = False
+                return False
+            await progress.start(StorageProgressStart(src, dst, size))
+            try:
+                await run_concurrently(
+                    worker(upload_id) for _ in range(MAX_PARTS_IN_FLIGHT)
+                )
+                for retry in retries(
+                    f"Fail to upload {dst}", on_congestion=self._file_limiter.congested
+                ):
+                    async with retry:
+                        await self.complete_multipart_upload(
+                            bucket_name, key, upload_id, parts
+                        )
+            except (asyncio.CancelledError, Exception):
+                try:
+                    await self.abort_multipart_upload(bucket_name, key, upload_id)
+                except Exception as e:
+                    log.warning(f"Fail to abort upload of {dst}: {e}")
+                raise
+            await progress.complete(StorageProgressComplete(src, dst, size))
+        return True
+
     async def upload_dir(
         self,
         src: URL,
@@ -655,113 +1135,124 @@ class BlobStorage(metaclass=NoPublicConstructor):
             raise FileNotFoundError(errno.ENOENT, "No such file", str(path))
         if not path.is_dir():
             raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(path))
-        async_progress: _AsyncAbstractRecursiveFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue,
-            self._upload_dir(
-                src,
-                path,
-                dst,
-                "",
-                update=update,
-                filter=filter,
-                ignore_file_names=ignore_file_names,
-                progress=async_progress,
+
+        index: Optional[_BlobIndex] = None
+        if update:
+            # The destination is listed once to compare with the local files
+            bucket_name, key = self._extract_bucket_and_key(dst)
+            key = key.strip("/")
+            if key:
+                await self._check_dir_target(bucket_name, key, dst)
+                index = await self._index_blobs(dst, bucket_name, key + "/")
+            else:
+                index = await self._index_blobs(dst, bucket_name, "")
+                # Only create folder if we are not uploading to bucket root
+                index.dirs.add("")
+
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=MAX_LISTINGS,
+            max_bytes=MAX_INFLIGHT_BYTES,
+        )
+        await async_progress.run(
+            scheduler.run(
+                partial(
+                    self._upload_dir,
+                    src=src,
+                    src_path=path,
+                    dst=dst,
+                    rel_path="",
+                    file_filter=FileFilter(filter),
+                    ignore_file_names=ignore_file_names,
+                    progress=async_progress,
+                    index=index,
+                )
             ),
         )
 
     async def _upload_dir(
         self,
+        node: _TransferDir,
+        *,
         src: URL,
         src_path: Path,
         dst: URL,
         rel_path: str,
-        *,
-        update: bool,
-        filter: Callable[[str], Awaitable[bool]],
+        file_filter: FileFilter,
         ignore_file_names: AbstractSet[str],
         progress: _AsyncAbstractRecursiveFileProgress,
+        index: Optional["_BlobIndex"],
     ) -> None:
-        tasks = []
         if not dst.path.endswith("/"):
             dst = dst / ""
 
-        bucket_name, key = self._extract_bucket_and_key(dst)
-        key = key.strip("/")
-        exists = False
-        if update:
-            if key:
-                key += "/"
-            try:
-                for retry in retries(f"Fail to list {dst}"):
-                    async with retry:
-                        blobs, _ = await self.list_blobs(
-                            bucket_name=bucket_name, prefix=key, recursive=False
-                        )
-                        dst_files = {x.name: x for x in blobs}
-                exists = True
-            except ResourceNotFound:
-                update = False
+        if index is not None:
+            # The remote keys are known from the index, no per-directory
+            # conflict check is needed.
+            if rel_path and rel_path[:-1] in index.blobs:
+                raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(dst))
+            exists = rel_path in index.dirs
         else:
+            bucket_name, key = self._extract_bucket_and_key(dst)
+            key = key.strip("/")
             if key:
-                try:
-                    # Make sure we don't have name conflicts
-                    # We can't upload to folder `/path/to/file.txt/` if
-                    # `/path/to/file.txt` already exists
-                    await self.head_blob(bucket_name=bucket_name, key=key)
-                except ResourceNotFound:
-                    pass
-                else:
-                    raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(dst))
-            else:
-                # Only create folder if we are not uploading to bucket root
-                exists = True
+                await self._check_dir_target(bucket_name, key, dst)
+            # Only create folder if we are not uploading to bucket root
+            exists = not key
         if not exists:
             for retry in retries(f"Fail to create {dst}"):
                 async with retry:
                     await self._mkdir(dst)
 
         await progress.enter(StorageProgressEnterDir(src, dst))
-        loop = asyncio.get_event_loop()
-        async with self._file_sem:
-            folder = await loop.run_in_executor(None, lambda: list(src_path.iterdir()))
+        node.on_done(partial(progress.leave, StorageProgressLeaveDir(src, dst)))
+        async with self._file_limiter:
+            folder = await _scan_dir_async(src_path)
 
         if ignore_file_names:
             for child in folder:
-                if child.name in ignore_file_names and child.is_file():
+                if child.name in ignore_file_names and child.is_file:
                     log.debug(f"Load ignore file {rel_path}{child.name}")
-                    file_filter = FileFilter(filter)
-                    file_filter.read_from_file(child, prefix=rel_path)
-                    filter = file_filter.match
+                    file_filter = file_filter.copy()
+                    file_filter.read_from_file(src_path / child.name, prefix=rel_path)
 
         for child in folder:
             name = child.name
             child_rel_path = f"{rel_path}{name}"
-            if child.is_dir():
+            if child.is_dir:
                 child_rel_path += "/"
-            if not await filter(child_rel_path):
+            if not await file_filter.match(child_rel_path):
                 log.debug(f"Skip {child_rel_path}")
                 continue
-            if child.is_file():
-                if update and name in dst_files:
-                    offset = self._check_upload(child.stat(), dst_files[name])
+            if child.is_file:
+                child_stat = child.stat
+                assert child_stat is not None
+                if index is not None and child_rel_path in index.blobs:
+                    offset = self._check_upload(child_stat, index.blobs[child_rel_path])
                     if offset is None:
                         continue
-                tasks.append(
-                    self._upload_file(src_path / name, dst / name, progress=progress)
-                )
-            elif child.is_dir():
-                tasks.append(
-                    self._upload_dir(
-                        src / name,
+                await node.add_file(
+                    child_stat.st_size,
+                    partial(
+                        self._upload_file,
                         src_path / name,
                         dst / name,
-                        child_rel_path,
-                        update=update,
-                        filter=filter,
+                        progress=progress,
+                    ),
+                )
+            elif child.is_dir:
+                await node.add_dir(
+                    partial(
+                        self._upload_dir,
+                        src=src / name,
+                        src_path=src_path / name,
+                        dst=dst / name,
+                        rel_path=child_rel_path,
+                        file_filter=file_filter,
                         ignore_file_names=ignore_file_names,
                         progress=progress,
+                        index=index,
                     )
                 )
             else:
@@ -769,11 +1260,10 @@ class BlobStorage(metaclass=NoPublicConstructor):
                     StorageProgressFail(
                         src / name,
                         dst / name,
-                        f"Cannot upload {child}, not regular file/directory",
+                        f"Cannot upload {src_path / name}, "
+                        "not regular file/directory",
                     )
                 )
-        await run_concurrently(tasks)
-        await progress.leave(StorageProgressLeaveDir(src, dst))
 
     async def download_file(
         self,
@@ -783,7 +1273,10 @@ class BlobStorage(metaclass=NoPublicConstructor):
         update: bool = False,
         continue_: bool = False,
         progress: Optional[AbstractFileProgress] = None,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
     ) -> None:
+        _check_segments(parallel_segments, segment_size)
         src = normalize_blob_path_uri(src, self._config.cluster_name)
         dst = normalize_local_path_uri(dst)
         path = _extract_path(dst)
@@ -802,12 +1295,17 @@ class BlobStorage(metaclass=NoPublicConstructor):
         if offset is None:
             return
 
-        async_progress: _AsyncAbstractFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue,
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        await async_progress.run(
             self._download_file(
-                src, dst, path, src_stat.size, offset, progress=async_progress
+                src,
+                dst,
+                path,
+                src_stat.size,
+                offset,
+                progress=async_progress,
+                parallel_segments=parallel_segments,
+                segment_size=segment_size,
             ),
         )
 
@@ -820,29 +1318,57 @@ class BlobStorage(metaclass=NoPublicConstructor):
         offset: int,
         *,
         progress: _AsyncAbstractFileProgress,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
     ) -> None:
-        loop = asyncio.get_event_loop()
-        async with self._file_sem:
+        async with self._file_limiter:
             await progress.start(StorageProgressStart(src, dst, size))
-            with dst_path.open("rb+" if offset else "wb") as stream:
-                if offset:
-                    stream.seek(offset)
-                for retry in retries(f"Fail to download {src}"):
-                    pos = stream.tell()
-                    if pos >= size:
-                        break
-                    async with retry:
-                        bucket_name, key = self._extract_bucket_and_key(src)
-                        async for chunk in self.fetch_blob(
-                            bucket_name=bucket_name, key=key, offset=pos
+            bucket_name, key = self._extract_bucket_and_key(src)
+            written = offset
+
+            async def step(n: int) -> None:
+                nonlocal written
+                written += n
+                await progress.step(src, dst, written, size)
+
+            if parallel_segments > 1 and size - offset > segment_size:
+                await _download_segments(
+                    dst_path,
+                    size,
+                    offset,
+                    lambda start, stop: self.fetch_blob(
+                        bucket_name=bucket_name,
+                        key=key,
+                        offset=start,
+                        size=stop - start,
+                    ),
+                    msg=f"Fail to download {src}",
+                    on_congestion=self._file_limiter.congested,
+                    on_flush=step,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                )
+            else:
+                with dst_path.open("rb+" if offset else "wb") as stream:
+                    writer = _CoalescingWriter(
+                        _PositionalWriter(stream), offset, on_flush=step, stop=size
+                    )
+                    try:
+                        for retry in retries(
+                            f"Fail to download {src}",
+                            on_congestion=self._file_limiter.congested,
                         ):
-                            pos += len(chunk)
-                            await progress.step(
-                                StorageProgressStep(src, dst, pos, size)
-                            )
-                            await loop.run_in_executor(None, stream.write, chunk)
-                            if chunk:
-                                retry.reset()
+                            if writer.pos >= size:
+                                break
+                            async with retry:
+                                async for chunk in self.fetch_blob(
+                                    bucket_name=bucket_name, key=key, offset=writer.pos
+                                ):
+                                    await writer.write(chunk)
+                                    if chunk:
+                                        retry.reset()
+                    finally:
+                        await writer.flush()
             await progress.complete(StorageProgressComplete(src, dst, size))
 
     async def download_dir(
@@ -854,113 +1380,394 @@ class BlobStorage(metaclass=NoPublicConstructor):
         continue_: bool = False,
         filter: Optional[Callable[[str], Awaitable[bool]]] = None,
         progress: Optional[AbstractRecursiveFileProgress] = None,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
     ) -> None:
+        _check_segments(parallel_segments, segment_size)
         if filter is None:
             filter = _always
         src = normalize_blob_path_uri(src, self._config.cluster_name)
         dst = normalize_local_path_uri(dst)
         path = _extract_path(dst)
-        async_progress: _AsyncAbstractRecursiveFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue,
-            self._download_dir(
-                src,
-                dst,
-                path,
-                update=update,
-                continue_=continue_,
-                filter=filter,
-                progress=async_progress,
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=MAX_LISTINGS,
+            max_bytes=MAX_INFLIGHT_BYTES,
+        )
+        await async_progress.run(
+            scheduler.run(
+                partial(
+                    self._download_dir,
+                    src=src,
+                    dst=dst,
+                    dst_path=path,
+                    update=update,
+                    continue_=continue_,
+                    filter=filter,
+                    progress=async_progress,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                )
             ),
         )
 
     async def _download_dir(
         self,
+        node: _TransferDir,
+        *,
         src: URL,
         dst: URL,
         dst_path: Path,
-        *,
         update: bool,
         continue_: bool,
         filter: Callable[[str], Awaitable[bool]],
         progress: _AsyncAbstractRecursiveFileProgress,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
     ) -> None:
-        dst_path.mkdir(parents=True, exist_ok=True)
-        await progress.enter(StorageProgressEnterDir(src, dst))
-        tasks = []
-        if update or continue_:
-            loop = asyncio.get_event_loop()
-            async with self._file_sem:
-                dst_files = await loop.run_in_executor(
-                    None,
-                    lambda: {
-                        item.name: item for item in dst_path.iterdir() if item.is_file()
-                    },
+        async def enter_dir(
+            tree_dir: _BlobTreeDir,
+        ) -> _BlobTreeDir:
+            assert tree_dir.node is not None and tree_dir.dst_path is not None
+            tree_dir.dst_path.mkdir(parents=True, exist_ok=True)
+            await progress.enter(StorageProgressEnterDir(tree_dir.src, tree_dir.dst))
+            tree_dir.node.on_done(
+                partial(
+                    progress.leave,
+                    StorageProgressLeaveDir(tree_dir.src, tree_dir.dst),
+                )
+            )
+            if update or continue_:
+                async with self._file_limiter:
+                    tree_dir.local_files = {
+                        item.name: item.stat
+                        for item in await _scan_dir_async(tree_dir.dst_path)
+                        if item.stat is not None
+                    }
+            return tree_dir
+
+        async def enter_subdir(
+            parent: _BlobTreeDir, name: str, rel_path: str
+        ) -> _BlobTreeDir:
+            assert parent.node is not None and parent.dst_path is not None
+            return await enter_dir(
+                _BlobTreeDir(
+                    name,
+                    rel_path,
+                    parent.src / name,
+                    parent.dst / name,
+                    parent.node.add_listed_dir(),
+                    parent.dst_path / name,
                 )
+            )
 
-        bucket_name, folder_key = self._extract_bucket_and_key(src)
-        prefix_path = folder_key.strip("/")
-        # If we are downloading the whole bucket we need to specify an empty prefix '',
-        # not "/", thus only add it if path not empty
-        if prefix_path:
-            prefix_path += "/"
-        for retry in retries(f"Fail to list {src}"):
+        async def add_file(parent: _BlobTreeDir, blob: BlobListing, name: str) -> None:
+            assert parent.node is not None and parent.dst_path is not None
+            offset: Optional[int] = 0
+            if (update or continue_) and name in parent.local_files:
+                offset = self._check_download(
+                    parent.local_files[name], blob, update, continue_
+                )
+            if offset is None:
+                return
+            # The size from the listing is enough to plan the byte ranges,
+            # no head_blob() is needed.
+            await parent.node.add_file(
+                blob.size - offset,
+                partial(
+                    self._download_file,
+                    parent.src / name,
+                    parent.dst / name,
+                    parent.dst_path / name,
+                    blob.size,
+                    offset,
+                    progress=progress,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                ),
+            )
+
+        root = await enter_dir(_BlobTreeDir("", "", src, dst, node, dst_path))
+        await self._walk_blobs(
+            root, filter=filter, enter_dir=enter_subdir, add_file=add_file
+        )
+
+    async def copy_from_storage(
+        self,
+        src: URL,
+        dst: URL,
+        *,
+        progress: Optional[AbstractFileProgress] = None,
+    ) -> None:
+        src = self._storage._normalize_uri(src)
+        dst = normalize_blob_path_uri(dst, self._config.cluster_name)
+        src_stat = await self._storage.stat(src)
+        if src_stat.is_dir():
+            raise IsADirectoryError(
+                errno.EISDIR, "Is a directory, use recursive copy", str(src)
+            )
+        await self._check_upload_target(dst)
+
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        await async_progress.run(
+            self._copy_from_storage(src, dst, src_stat.size, progress=async_progress)
+        )
+
+    async def _copy_from_storage(
+        self,
+        src: URL,
+        dst: URL,
+        size: int,
+        *,
+        progress: _AsyncAbstractFileProgress,
+    ) -> None:
+        bucket_name, key = self._extract_bucket_and_key(dst)
+        for retry in retries(
+            f"Fail to copy {src} to {dst}", on_congestion=self._file_limiter.congested
+        ):
             async with retry:
-                blobs, prefixes = await self.list_blobs(
-                    bucket_name=bucket_name, prefix=prefix_path, recursive=False
+                await self.put_blob(
+                    bucket_name=bucket_name,
+                    key=key,
+                    body=self._iterate_stream(
+                        self._storage._read_stream(src, size),
+                        src,
+                        dst,
+                        size,
+                        progress=progress,
+                    ),
+                    size=size,
+                )
+
+    async def copy_dir_from_storage(
+        self,
+        src: URL,
+        dst: URL,
+        *,
+        filter: Optional[Callable[[str], Awaitable[bool]]] = None,
+        progress: Optional[AbstractRecursiveFileProgress] = None,
+    ) -> None:
+        if filter is None:
+            filter = _always
+        src = self._storage._normalize_uri(src)
+        dst = normalize_blob_path_uri(dst, self._config.cluster_name)
+        src_stat = await self._storage.stat(src)
+        if not src_stat.is_dir():
+            raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(src))
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=MAX_LISTINGS,
+            max_bytes=MAX_INFLIGHT_BYTES,
+        )
+        await async_progress.run(
+            scheduler.run(
+                partial(
+                    self._copy_dir_from_storage,
+                    src=src,
+                    dst=dst,
+                    rel_path="",
+                    filter=filter,
+                    progress=async_progress,
                 )
+            ),
+        )
 
-        for child in itertools.chain(blobs, prefixes):
-            child = cast(Union[PrefixListing, BlobListing], child)
+    async def _copy_dir_from_storage(
+        self,
+        node: _TransferDir,
+        *,
+        src: URL,
+        dst: URL,
+        rel_path: str,
+        filter: Callable[[str], Awaitable[bool]],
+        progress: _AsyncAbstractRecursiveFileProgress,
+    ) -> None:
+        if not dst.path.endswith("/"):
+            dst = dst / ""
 
-            # Skip "folder" keys, as they will be returned as BlobListing results again,
-            # previously being a common prefix, ie. PrefixListing.
-            if child.path == prefix_path:
-                continue
+        bucket_name, key = self._extract_bucket_and_key(dst)
+        key = key.strip("/")
+        # Only create folder if we are not copying to bucket root
+        if key:
+            try:
+                await self.head_blob(bucket_name=bucket_name, key=key)
+            except ResourceNotFound:
+                pass
+            else:
+                raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(dst))
+            for retry in retries(f"Fail to create {dst}"):
+                async with retry:
+                    await self._mkdir(dst)
+
+        await progress.enter(StorageProgressEnterDir(src, dst))
+        node.on_done(partial(progress.leave, StorageProgressLeaveDir(src, dst)))
+        folder = await self._storage._list_dir(src)
 
+        for child in folder:
             name = child.name
-            assert child.path.startswith(prefix_path)
-            child_rel_path = child.path[len(prefix_path) :]
+            child_rel_path = f"{rel_path}{name}"
             if child.is_dir():
                 child_rel_path += "/"
             if not await filter(child_rel_path):
                 log.debug(f"Skip {child_rel_path}")
                 continue
             if child.is_file():
-                # Only BlobListing can be a file, so it's safe to just cast
-                child = cast(BlobListing, child)
-                offset: Optional[int] = 0
-                if (update or continue_) and name in dst_files:
-                    offset = self._check_download(
-                        dst_files[name].stat(), child, update, continue_
-                    )
-                if offset is None:
-                    continue
-                tasks.append(
-                    self._download_file(
+                await node.add_file(
+                    child.size,
+                    partial(
+                        self._copy_from_storage,
                         src / name,
                         dst / name,
-                        dst_path / name,
                         child.size,
-                        offset,
+                        progress=progress,
+                    ),
+                )
+            elif child.is_dir():
+                await node.add_dir(
+                    partial(
+                        self._copy_dir_from_storage,
+                        src=src / name,
+                        dst=dst / name,
+                        rel_path=child_rel_path,
+                        filter=filter,
                         progress=progress,
                     )
                 )
             else:
-                tasks.append(
-                    self._download_dir(
+                await progress.fail(
+                    StorageProgressFail(
                         src / name,
                         dst / name,
-                        dst_path / name,
-                        update=update,
-                        continue_=continue_,
-                        filter=filter,
-                        progress=progress,
+                        f"Cannot copy {src / name}, not regular file/directory",
                     )
                 )
-        await run_concurrently(tasks)
-        await progress.leave(StorageProgressLeaveDir(src, dst))
+
+    async def copy_to_storage(
+        self,
+        src: URL,
+        dst: URL,
+        *,
+        progress: Optional[AbstractFileProgress] = None,
+    ) -> None:
+        src = normalize_blob_path_uri(src, self._config.cluster_name)
+        dst = self._storage._normalize_uri(dst)
+        bucket_name, key = self._extract_bucket_and_key(src)
+        src_stat = await self.head_blob(bucket_name=bucket_name, key=key)
+
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        await async_progress.run(
+            self._copy_to_storage(src, dst, src_stat.size, progress=async_progress)
+        )
+
+    async def _copy_to_storage(
+        self,
+        src: URL,
+        dst: URL,
+        size: int,
+        *,
+        progress: _AsyncAbstractFileProgress,
+    ) -> None:
+        for retry in retries(
+            f"Fail to copy {src} to {dst}", on_congestion=self._file_limiter.congested
+        ):
+            async with retry:
+                await self._storage.create(
+                    dst,
+                    self._iterate_stream(
+                        self._fetch_stream(src, size),
+                        src,
+                        dst,
+                        size,
+                        progress=progress,
+                    ),
+                )
+
+    async def copy_dir_to_storage(
+        self,
+        src: URL,
+        dst: URL,
+        *,
+        filter: Optional[Callable[[str], Awaitable[bool]]] = None,
+        progress: Optional[AbstractRecursiveFileProgress] = None,
+    ) -> None:
+        if filter is None:
+            filter = _always
+        src = normalize_blob_path_uri(src, self._config.cluster_name)
+        dst = self._storage._normalize_uri(dst)
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=MAX_LISTINGS,
+            max_bytes=MAX_INFLIGHT_BYTES,
+        )
+        await async_progress.run(
+            scheduler.run(
+                partial(
+                    self._copy_dir_to_storage,
+                    src=src,
+                    dst=dst,
+                    filter=filter,
+                    progress=async_progress,
+                )
+            ),
+        )
+
+    async def _copy_dir_to_storage(
+        self,
+        node: _TransferDir,
+        *,
+        src: URL,
+        dst: URL,
+        filter: Callable[[str], Awaitable[bool]],
+        progress: _AsyncAbstractRecursiveFileProgress,
+    ) -> None:
+        async def enter_dir(tree_dir: _BlobTreeDir) -> _BlobTreeDir:
+            assert tree_dir.node is not None
+            for retry in retries(f"Fail to create {tree_dir.dst}"):
+                async with retry:
+                    await self._storage.mkdir(tree_dir.dst, parents=True, exist_ok=True)
+            await progress.enter(StorageProgressEnterDir(tree_dir.src, tree_dir.dst))
+            tree_dir.node.on_done(
+                partial(
+                    progress.leave,
+                    StorageProgressLeaveDir(tree_dir.src, tree_dir.dst),
+                )
+            )
+            return tree_dir
+
+        async def enter_subdir(
+            parent: _BlobTreeDir, name: str, rel_path: str
+        ) -> _BlobTreeDir:
+            assert parent.node is not None
+            return await enter_dir(
+                _BlobTreeDir(
+                    name,
+                    rel_path,
+                    parent.src / name,
+                    parent.dst / name,
+                    parent.node.add_listed_dir(),
+                )
+            )
+
+        async def add_file(parent: _BlobTreeDir, blob: BlobListing, name: str) -> None:
+            assert parent.node is not None
+            await parent.node.add_file(
+                blob.size,
+                partial(
+                    self._copy_to_storage,
+                    parent.src / name,
+                    parent.dst / name,
+                    blob.size,
+                    progress=progress,
+                ),
+            )
+
+        root = await enter_dir(_BlobTreeDir("", "", src, dst, node))
+        await self._walk_blobs(
+            root, filter=filter, enter_dir=enter_subdir, add_file=add_file
+        )
 
 
 def _glob_safe_prefix(pattern: str) -> str:
@@ -1009,19 +1816,212 @@ def _blob_status_from_response(
     )
 
 
+@dataclass
+class _BlobTreeDir:
+    """A directory in a walk over a recursive listing of blobs.
+
+    *node* is None for a directory skipped by the filter.
+    """
+
+    name: str
+    rel_path: str
+    src: URL
+    dst: URL
+    node: Optional[_TransferDir] = None
+    dst_path: Optional[Path] = None
+    local_files: Dict[str, os.stat_result] = field(default_factory=dict)
+
+    async def leave(self) -> None:
+        if self.node is not None:
+            await self.node.listed()
+
+
+class _BlobIndex:
+    """Blobs under a folder collected by a single recursive listing.
+
+    Keys are relative to the folder, *dirs* contains the relative paths of
+    all existing directories, explicit "folder" keys and implicit ones.
+    """
+
+    def __init__(self) -> None:
+        self.blobs: Dict[str, BlobListing] = {}
+        self.dirs: Set[str] = set()
+
+    def add(self, rel_key: str, blob: BlobListing) -> None:
+        self.blobs[rel_key] = blob
+        self.dirs.add("")
+        pos = rel_key.find("/")
+        while pos >= 0:
+            self.dirs.add(rel_key[: pos + 1])
+            pos = rel_key.find("/", pos + 1)
+
+
+def _multipart_unsupported(error: Exception) -> bool:
+    # 404, 405 or 501 from a server without multipart uploads
+    if isinstance(error, ServerError):
+        return error.status == 501
+    return isinstance(error, ResourceNotFound) or type(error) is ClientError
+
+
 async def calc_md5(path: Path) -> Tuple[str, int]:
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _calc_md5_blocking, path)
+    return await loop.run_in_executor(_md5_executor(), _calc_md5_blocking, path)
+
+
+_md5_pool: Optional[ThreadPoolExecutor] = None
+_md5_pool_lock = threading.Lock()
+
+
+def _md5_executor() -> ThreadPoolExecutor:
+    # A dedicated pool, so hashing many files neither waits for nor blocks
+    # file reads and writes in the default executor.
+    global _md5_pool
+    with _md5_pool_lock:
+        if _md5_pool is None:
+            _md5_pool = ThreadPoolExecutor(
+                max_workers=MD5_WORKERS, thread_name_prefix="neuro-md5"
+            )
+        return _md5_pool
+
+
+def _digest_key(stat: os.stat_result) -> Tuple[int, int, int, int]:
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class _DigestCache:
+    """Persistent cache of MD5 digests of local files kept in a SQLite database.
+
+    Digests are keyed by the device, the inode, the size and the modification
+    time of the file, so a modified or replaced file is hashed again.  The
+    cache is disabled if the database cannot be used.  It is used from the
+    threads of the MD5 pool.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def _open(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and not self._disabled:
+            try:
+                self._path.parent.mkdir(0o700, parents=True, exist_ok=True)
+                db = sqlite3.connect(
+                    str(self._path), isolation_level=None, check_same_thread=False
+                )
+                # It is only a cache, losing recent entries on a crash is fine
+                db.execute("PRAGMA synchronous=OFF")
+                db.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS md5 (
+                        dev INTEGER,
+                        ino INTEGER,
+                        size INTEGER,
+                        mtime_ns INTEGER,
+                        digest TEXT,
+                        PRIMARY KEY (dev, ino));
+                    """
+                )
+            except (OSError, sqlite3.Error) as e:
+                log.debug(f"Disable MD5 cache {self._path}: {e}")
+                self._disabled = True
+            else:
+                self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get(self, stat: os.stat_result) -> Optional[str]:
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return None
+            dev, ino, size, mtime_ns = _digest_key(stat)
+            try:
+                row = db.execute(
+                    "SELECT digest FROM md5 WHERE dev = ? AND ino = ? "
+                    "AND size = ? AND mtime_ns = ?",
+                    (dev, ino, size, mtime_ns),
+                ).fetchone()
+            except sqlite3.Error as e:
+                log.debug(f"Fail to read MD5 cache {self._path}: {e}")
+                return None
+        return row[0] if row is not None else None
+
+    def put(self, stat: os.stat_result, digest: str) -> None:
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO md5 (dev, ino, size, mtime_ns, digest) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (*_digest_key(stat), digest),
+                )
+            except sqlite3.Error as e:
+                log.debug(f"Fail to write MD5 cache {self._path}: {e}")
+
+
+async def _read_part(path: Path, offset: int, size: int) -> Tuple[bytes, str]:
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, _read_part_blocking, path, offset, size)
+
+
+def _read_part_blocking(path: Path, offset: int, size: int) -> Tuple[bytes, str]:
+    with path.open("rb") as stream:
+        stream.seek(offset)
+        data = stream.read(size)
+    content_md5 = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+    return data, content_md5
 
 
 def _calc_md5_blocking(path: Path) -> Tuple[str, int]:
     md5 = hashlib.md5()
     size = 0
+    buf = memoryview(bytearray(READ_SIZE))
     with path.open("rb") as stream:
         while True:
-            chunk = stream.read(READ_SIZE)
-            if not chunk:
+            n = stream.readinto(buf)
+            if not n:
                 break
-            md5.update(chunk)
-            size += len(chunk)
+            md5.update(buf[:n])
+            size += n
     return base64.b64encode(md5.digest()).decode("ascii"), size
+
+
+def _iter_mmap(fd: int, size: int, chunk_size: int) -> Iterator[memoryview]:
+    # Chunks are slices of a read-only memory mapping of the file, so no bytes
+    # objects are allocated for them; pages are read from the page cache when
+    # aiohttp sends a chunk.  The file should not be truncated while uploading,
+    # accessing a page past the end of the file raises SIGBUS.
+    mapped = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+    can_madvise = hasattr(mapped, "madvise")
+    if can_madvise:
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mapped)
+    try:
+        for pos in range(0, size, chunk_size):
+            yield view[pos : pos + chunk_size]
+            if can_madvise:
+                # Unmap pages of the passed chunk, otherwise the whole file is
+                # eventually counted in RSS.  They are read again from the page
+                # cache if the chunk is still accessed.
+                start = pos - pos % mmap.PAGESIZE
+                stop = pos + chunk_size
+                stop -= stop % mmap.PAGESIZE
+                if stop > start:
+                    mapped.madvise(mmap.MADV_DONTNEED, start, stop - start)
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # The last chunks are still referenced by the transport,
+            # the mapping is released together with them.
+            pass
@@ -43,8 +43,10 @@ class Client(metaclass=NoPublicConstructor):
         self._parser = Parser._create(self._config)
         self._admin = _Admin._create(self._core, self._config)
         self._jobs = Jobs._create(self._core, self._config, self._parser)
-        self._blob_storage = BlobStorage._create(self._core, self._config)
         self._storage = Storage._create(self._core, self._config)
+        self._blob_storage = BlobStorage._create(
+            self._core, self._config, self._storage
+        )
         self._quota = _Quota._create(self._core, self._config)
         self._users = Users._create(self._core, self._config)
         self._secrets = Secrets._create(self._core, self._config)
@@ -58,6 +60,7 @@ class Client(metaclass=NoPublicConstructor):
         with self._config._open_db() as db:
             self._core._save_cookies(db)
         await self._core.close()
+        self._blob_storage._close()
         if self._images is not None:
             await self._images._close()
         await self._session.close()
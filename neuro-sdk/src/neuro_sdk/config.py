@@ -10,6 +10,7 @@ import sys
 import time
 from dataclasses import dataclass, replace
 from pathlib import Path
+from stat import S_ISREG
 from types import MappingProxyType
 from typing import Any, Dict, Iterator, List, Mapping, Optional, Set, Tuple, Union
 
@@ -241,25 +242,96 @@ class Config(metaclass=NoPublicConstructor):
             yield db
 
 
+@dataclass(frozen=True)
+class UserConfigCacheInfo:
+    hits: int
+    misses: int
+    size: int
+
+
+# (filename, st_mtime_ns, st_size)
+_FileKey = Tuple[str, int, int]
+
+
+class _UserConfigCache:
+    """Process-wide cache of parsed and validated user configs.
+
+    An entry is reused while both the global and the project config files keep
+    the same size and modification time.  Only the latest version is kept for
+    every pair of file names.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[
+            Tuple[str, Optional[str]],
+            Tuple[Optional[_FileKey], Optional[_FileKey], Mapping[str, Any]],
+        ] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, global_file: Path, local_file: Optional[Path]) -> Mapping[str, Any]:
+        global_key = _file_key(global_file)
+        local_key = _file_key(local_file) if local_file is not None else None
+        name = (str(global_file), str(local_file) if local_file is not None else None)
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == global_key and entry[1] == local_key:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        if global_key is None:
+            # Empty global configuration
+            config: Mapping[str, Any] = {}
+        else:
+            config = _load_file(global_file, allow_cluster_name=False)
+        if local_file is not None and local_key is not None:
+            local_config = _load_file(local_file, allow_cluster_name=True)
+            config = _merge_user_configs(config, local_config)
+        self._entries[name] = (global_key, local_key, config)
+        return config
+
+    def info(self) -> UserConfigCacheInfo:
+        return UserConfigCacheInfo(
+            hits=self.hits, misses=self.misses, size=len(self._entries)
+        )
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+_user_config_cache = _UserConfigCache()
+
+
+def user_config_cache_info() -> UserConfigCacheInfo:
+    return _user_config_cache.info()
+
+
+def clear_user_config_cache() -> None:
+    _user_config_cache.clear()
+
+
+def _file_key(filename: Path) -> Optional[_FileKey]:
+    try:
+        stat = filename.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not S_ISREG(stat.st_mode):
+        raise ConfigError(f"User config {filename} should be a regular file")
+    return str(filename), stat.st_mtime_ns, stat.st_size
+
+
 def load_user_config(path: Path) -> Mapping[str, Any]:
     # TODO: search in several locations (HOME+curdir),
     # merge found configs
-    filename = path / "user.toml"
-    if not filename.exists():
-        # Empty global configuration
-        config: Mapping[str, Any] = {}
-    elif not filename.is_file():
-        raise ConfigError(f"User config {filename} should be a regular file")
-    else:
-        config = _load_file(filename, allow_cluster_name=False)
+    local_file: Optional[Path]
     try:
         project_root = find_project_root()
     except ConfigError:
-        return config
+        local_file = None
     else:
-        filename = project_root / ".neuro.toml"
-        local_config = _load_file(filename, allow_cluster_name=True)
-        return _merge_user_configs(config, local_config)
+        local_file = project_root / ".neuro.toml"
+    return _user_config_cache.get(path / "user.toml", local_file)
 
 
 @contextlib.contextmanager
@@ -631,24 +703,14 @@ def _validate_user_config(
     #
     # Since currently CLI is the only API client that reads user config data, API
     # validates it.
-    plugin_manager = PluginManager()
-    plugin_manager.config.define_str("job", "ps-format")
-    plugin_manager.config.define_str("job", "life-span")
-    if allow_cluster_name:
-        plugin_manager.config.define_str("job", "cluster-name")
-    else:
+    if not allow_cluster_name:
         if "cluster-name" in config.get("job", {}):
             raise ConfigError(
                 f"{filename}: cluster name is not allowed in global user "
                 f"config file, use 'neuro config switch-cluster' for "
                 f"changing the default cluster name"
             )
-
-    plugin_manager.config.define_str_list("storage", "cp-exclude")
-    plugin_manager.config.define_str_list("storage", "cp-exclude-from-files")
-    for entry_point in pkg_resources.iter_entry_points("neuro_api"):
-        entry_point.load()(plugin_manager)
-    config_spec = plugin_manager.config._get_spec()
+    config_spec = _get_user_config_spec()
 
     # Alias section uses different validation
     _check_sections(config, set(config_spec.keys()) | {"alias"}, filename)
@@ -668,6 +730,25 @@ def _validate_user_config(
         _validate_alias(key, value, filename)
 
 
+_user_config_spec: Optional[Mapping[str, Any]] = None
+
+
+def _get_user_config_spec() -> Mapping[str, Any]:
+    # Loading plugins is expensive, the spec is built once per process
+    global _user_config_spec
+    if _user_config_spec is None:
+        plugin_manager = PluginManager()
+        plugin_manager.config.define_str("job", "ps-format")
+        plugin_manager.config.define_str("job", "life-span")
+        plugin_manager.config.define_str("job", "cluster-name")
+        plugin_manager.config.define_str_list("storage", "cp-exclude")
+        plugin_manager.config.define_str_list("storage", "cp-exclude-from-files")
+        for entry_point in pkg_resources.iter_entry_points("neuro_api"):
+            entry_point.load()(plugin_manager)
+        _user_config_spec = plugin_manager.config._get_spec()
+    return _user_config_spec
+
+
 def _validate_alias(
     key: str, value: Dict[str, str], filename: Union[str, "os.PathLike[str]"]
 ) -> None:
@@ -6,6 +6,7 @@ import logging
 import sqlite3
 import sys
 import time
+from email.utils import parsedate_to_datetime
 from http.cookies import Morsel, SimpleCookie
 from types import SimpleNamespace
 from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Sequence
@@ -21,7 +22,9 @@ from .errors import (
     ClientError,
     IllegalArgumentError,
     ResourceNotFound,
+    ServerError,
     ServerNotAvailable,
+    TooManyRequests,
 )
 from .tracing import gen_trace_id
 
@@ -72,7 +75,10 @@ class _Core:
             403: AuthorizationError,
             404: ResourceNotFound,
             405: ClientError,
+            429: TooManyRequests,
             502: ServerNotAvailable,
+            503: ServerNotAvailable,
+            504: ServerNotAvailable,
         }
         self._prev_cookie: Optional[Morsel[str]] = None
 
@@ -158,8 +164,18 @@ class _Core:
                     os_errno: Any = payload["errno"]
                     os_errno = errno.__dict__.get(os_errno, os_errno)
                     raise OSError(os_errno, err_text)
-                err_cls = self._exception_map.get(resp.status, IllegalArgumentError)
-                raise err_cls(err_text)
+                default_cls = (
+                    ServerError if resp.status >= 500 else IllegalArgumentError
+                )
+                err_cls = self._exception_map.get(resp.status, default_cls)
+                err = err_cls(err_text)
+                if isinstance(err, ServerNotAvailable):
+                    err.retry_after = _parse_retry_after(
+                        resp.headers.get("Retry-After")
+                    )
+                elif isinstance(err, ServerError):
+                    err.status = resp.status
+                raise err
             else:
                 try:
                     yield resp
@@ -267,3 +283,18 @@ def _make_cookie(name: str, value: str, domain: str, path: str) -> "Morsel[str]"
     cookie["path"] = path
     cookie["max-age"] = str(SESSION_COOKIE_MAXAGE)
     return cookie
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
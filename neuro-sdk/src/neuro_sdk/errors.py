@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class ConfigError(RuntimeError):
     pass
 
@@ -10,6 +13,11 @@ class IllegalArgumentError(ValueError):
     pass
 
 
+class ServerError(IllegalArgumentError):
+    # 5xx response without a more specific error
+    status: int = 500
+
+
 class AuthError(ClientError):
     pass
 
@@ -27,6 +35,11 @@ class ResourceNotFound(ValueError):
 
 
 class ServerNotAvailable(ValueError):
+    # Seconds to wait before retrying as requested by the server
+    retry_after: Optional[float] = None
+
+
+class TooManyRequests(ServerNotAvailable):
     pass
 
 
@@ -1,6 +1,6 @@
 import re
 from pathlib import Path
-from typing import Any, Awaitable, Callable, List, Tuple, cast
+from typing import Any, Awaitable, Callable, List, Match, Optional, Tuple, cast
 
 
 async def _always_match(path: str) -> bool:
@@ -13,6 +13,9 @@ class FileFilter:
     ) -> None:
         self.filters: List[Tuple[bool, str, Callable[[str], Any]]] = []
         self.default = default
+        # Regular expressions of filters with prefixes, in the order of filters
+        self._patterns: List[str] = []
+        self._matcher: Optional[Callable[[str], Optional[Match[str]]]] = None
 
     def read_from_buffer(self, data: bytes, prefix: str = "") -> None:
         lines = data.decode("utf-8-sig").split("\n")
@@ -23,10 +26,8 @@ class FileFilter:
                 continue
             line = _strip_trailing_spaces(line)
             if line.startswith("!"):
-                print(f"include {line!r}")
                 self.include(line[1:], prefix=prefix)
             else:
-                print(f"exclude {line!r}")
                 self.exclude(line, prefix=prefix)
 
     def read_from_file(self, path: Path, prefix: str = "") -> None:
@@ -44,6 +45,8 @@ class FileFilter:
             Callable[[str], Any], re.compile(re_pattern, re.DOTALL).fullmatch
         )
         self.filters.append((exclude, prefix, matcher))
+        self._patterns.append(re.escape(prefix) + re_pattern)
+        self._matcher = None
 
     def exclude(self, pattern: str, prefix: str = "") -> None:
         self.append(True, pattern, prefix=prefix)
@@ -51,11 +54,46 @@ class FileFilter:
     def include(self, pattern: str, prefix: str = "") -> None:
         self.append(False, pattern, prefix=prefix)
 
+    def copy(self) -> "FileFilter":
+        """Return a filter with the same filters and default.
+
+        Filters appended to the copy do not affect the original, e.g.
+        filters from an ignore file in a subdirectory.
+        """
+        ret = FileFilter(self.default)
+        ret.filters = list(self.filters)
+        ret._patterns = list(self._patterns)
+        ret._matcher = self._matcher
+        return ret
+
+    def check(self, path: str) -> Optional[bool]:
+        """Match path against the filters only.
+
+        Return the verdict of the last matching filter or None if no filter
+        matches and the default should decide.  A directory path ending
+        with "/" for which False is returned is excluded with all its content.
+        """
+        if not self._patterns:
+            return None
+        if self._matcher is None:
+            # All filters are combined in a single regular expression,
+            # the last added filter is the first alternative.
+            self._matcher = re.compile(
+                "|".join(f"({pattern})" for pattern in reversed(self._patterns)),
+                re.DOTALL,
+            ).fullmatch
+        m = self._matcher(path)
+        if m is None:
+            return None
+        assert m.lastindex is not None
+        exclude = self.filters[len(self.filters) - m.lastindex][0]
+        return not exclude
+
     async def match(self, path: str) -> bool:
-        for exclude, prefix, matcher in reversed(self.filters):
-            if path.startswith(prefix) and matcher(path[len(prefix) :]):
-                return not exclude
-        return await self.default(path)
+        ret = self.check(path)
+        if ret is None:
+            return await self.default(path)
+        return ret
 
 
 def translate(pat: str) -> str:
@@ -49,7 +49,7 @@ from .url_utils import (
     normalize_secret_uri,
     normalize_storage_path_uri,
 )
-from .utils import NoPublicConstructor
+from .utils import NoPublicConstructor, retries
 
 if sys.version_info >= (3, 7):  # pragma: no cover
     from contextlib import asynccontextmanager
@@ -429,16 +429,20 @@ class Jobs(metaclass=NoPublicConstructor):
     async def status(self, id: str) -> JobDescription:
         url = self._config.api_url / "jobs" / id
         auth = await self._config._api_auth()
-        async with self._core.request("GET", url, auth=auth) as resp:
-            ret = await resp.json()
-            return _job_description_from_api(ret, self._parse)
+        for retry in retries(f"Fail to get status of {id}"):
+            async with retry:
+                async with self._core.request("GET", url, auth=auth) as resp:
+                    ret = await resp.json()
+        return _job_description_from_api(ret, self._parse)
 
     async def tags(self) -> List[str]:
         url = self._config.api_url / "tags"
         auth = await self._config._api_auth()
-        async with self._core.request("GET", url, auth=auth) as resp:
-            ret = await resp.json()
-            return ret["tags"]
+        for retry in retries("Fail to get tags"):
+            async with retry:
+                async with self._core.request("GET", url, auth=auth) as resp:
+                    ret = await resp.json()
+        return ret["tags"]
 
     async def top(self, id: str) -> AsyncIterator[JobTelemetry]:
         url = self._config.monitoring_url / id / "top"
@@ -640,17 +644,19 @@ class Jobs(metaclass=NoPublicConstructor):
     async def exec_inspect(self, id: str, exec_id: str) -> ExecInspect:
         url = self._config.monitoring_url / id / exec_id / "exec_inspect"
         auth = await self._config._api_auth()
-        async with self._core.request("GET", url, auth=auth) as resp:
-            data = await resp.json()
-            return ExecInspect(
-                id=data["id"],
-                running=data["running"],
-                exit_code=data["exit_code"],
-                job_id=data["job_id"],
-                tty=data["tty"],
-                entrypoint=data["entrypoint"],
-                command=data["command"],
-            )
+        for retry in retries(f"Fail to inspect exec {exec_id}"):
+            async with retry:
+                async with self._core.request("GET", url, auth=auth) as resp:
+                    data = await resp.json()
+        return ExecInspect(
+            id=data["id"],
+            running=data["running"],
+            exit_code=data["exit_code"],
+            job_id=data["job_id"],
+            tty=data["tty"],
+            entrypoint=data["entrypoint"],
+            command=data["command"],
+        )
 
     @asynccontextmanager
     async def exec_start(self, id: str, exec_id: str) -> AsyncIterator[StdStream]:
@@ -680,8 +686,11 @@ class Jobs(metaclass=NoPublicConstructor):
     async def get_capacity(self) -> Mapping[str, int]:
         url = self._config.monitoring_url / "capacity"
         auth = await self._config._api_auth()
-        async with self._core.request("GET", url, auth=auth) as resp:
-            return await resp.json()
+        for retry in retries("Fail to get capacity"):
+            async with retry:
+                async with self._core.request("GET", url, auth=auth) as resp:
+                    capacity = await resp.json()
+        return capacity
 
 
 #  ############## Internal helpers ###################
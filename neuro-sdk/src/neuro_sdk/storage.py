@@ -2,13 +2,22 @@ import asyncio
 import enum
 import errno
 import fnmatch
+import hashlib
+import itertools
 import json
 import logging
 import os
 import re
+import sqlite3
+import sys
+import threading
 import time
-from dataclasses import dataclass
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
 from email.utils import parsedate_to_datetime
+from functools import partial
+from io import BufferedReader
 from pathlib import Path
 from stat import S_ISREG
 from typing import (
@@ -16,14 +25,21 @@ from typing import (
     Any,
     AsyncIterator,
     Awaitable,
+    BinaryIO,
     Callable,
+    Deque,
     Dict,
     Iterable,
+    Iterator,
+    List,
     Mapping,
     Optional,
+    Sequence,
+    Set,
+    TextIO,
     Tuple,
+    TypeVar,
     Union,
-    cast,
 )
 
 import aiohttp
@@ -35,6 +51,7 @@ from .abc import (
     AbstractFileProgress,
     AbstractRecursiveFileProgress,
     StorageProgressComplete,
+    StorageProgressConcurrency,
     StorageProgressDelete,
     StorageProgressEnterDir,
     StorageProgressFail,
@@ -48,19 +65,42 @@ from .abc import (
 from .config import Config
 from .core import _Core
 from .errors import ResourceNotFound
-from .file_filter import FileFilter
+from .file_filter import FileFilter, translate
 from .url_utils import (
     _extract_path,
     normalize_local_path_uri,
     normalize_storage_path_uri,
 )
 from .users import Action
-from .utils import NoPublicConstructor, QueuedCall, queue_calls, retries
+from .utils import NoPublicConstructor, retries
+
+if sys.version_info >= (3, 7):  # pragma: no cover
+    from contextlib import asynccontextmanager
+else:
+    from async_generator import asynccontextmanager
+
 
 log = logging.getLogger(__name__)
 
-MAX_OPEN_FILES = 20
+MAX_OPEN_FILES = 20  # initial limit, adapted to throughput by _AdaptiveLimiter
+MIN_OPEN_FILES = 1
+OPEN_FILES_LIMIT = 256
+CONCURRENCY_INTERVAL = 1.0  # seconds between adjustments of the limit
+LATENCY_TOLERANCE = 0.1
+MAX_LISTINGS = 4
+MAX_INFLIGHT_BYTES: Optional[int] = None
 READ_SIZE = 2 ** 20  # 1 MiB
+WRITE_BUFFER_SIZE = 2 ** 20  # 1 MiB
+PROGRESS_MAX_RATE = 10.0  # step events per second
+PROGRESS_QUEUE_SIZE = 1000
+SEGMENT_SIZE = 64 * 2 ** 20  # 64 MiB
+DELTA_BLOCK_SIZE = 4 * 2 ** 20  # 4 MiB
+FILE_BLOCK_SIZE = 2 ** 20  # 1 MiB
+FILE_CACHE_BLOCKS = 32
+MAX_READAHEAD_BLOCKS = 8
+PREFETCH_FILES = 8
+PREFETCH_BYTES = 64 * 2 ** 20  # 64 MiB
+STREAM_BUFFER_SIZE = 8 * 2 ** 20  # 8 MiB
 TIME_THRESHOLD = 1.0
 
 Printer = Callable[[str], None]
@@ -91,11 +131,88 @@ class FileStatus:
         return Path(self.path).name
 
 
+@dataclass(frozen=True)
+class TransferPlanEntry:
+    src: URL
+    dst: URL
+    type: FileStatusType
+    size: int = 0
+    offset: int = 0  # bytes already present in dst, for continuing
+    skip: bool = False  # dst is up to date
+
+    def is_file(self) -> bool:
+        return self.type == FileStatusType.FILE
+
+    def is_dir(self) -> bool:
+        return self.type == FileStatusType.DIRECTORY
+
+    @property
+    def transfer_size(self) -> int:
+        if self.skip or not self.is_file():
+            return 0
+        return self.size - self.offset
+
+    def _to_json(self) -> Dict[str, Any]:
+        return {
+            "type": self.type.value,
+            "src": str(self.src),
+            "dst": str(self.dst),
+            "size": self.size,
+            "offset": self.offset,
+            "skip": self.skip,
+        }
+
+    @classmethod
+    def _from_json(cls, data: Dict[str, Any]) -> "TransferPlanEntry":
+        return cls(
+            src=URL(data["src"]),
+            dst=URL(data["dst"]),
+            type=FileStatusType(data["type"]),
+            size=data.get("size", 0),
+            offset=data.get("offset", 0),
+            skip=data.get("skip", False),
+        )
+
+
+@dataclass(frozen=True)
+class TransferPlan:
+    entries: Sequence[TransferPlanEntry]
+
+    @property
+    def transfer_files(self) -> int:
+        return sum(1 for entry in self.entries if entry.is_file() and not entry.skip)
+
+    @property
+    def transfer_bytes(self) -> int:
+        return sum(entry.transfer_size for entry in self.entries)
+
+    @property
+    def skipped_files(self) -> int:
+        return sum(1 for entry in self.entries if entry.is_file() and entry.skip)
+
+    def dump(self, stream: TextIO) -> None:
+        for entry in self.entries:
+            stream.write(json.dumps(entry._to_json()) + "\n")
+
+    @classmethod
+    def load(cls, stream: TextIO) -> "TransferPlan":
+        return cls(
+            [
+                TransferPlanEntry._from_json(json.loads(line))
+                for line in stream
+                if line.strip()
+            ]
+        )
+
+
 class Storage(metaclass=NoPublicConstructor):
     def __init__(self, core: _Core, config: Config) -> None:
         self._core = core
         self._config = config
-        self._file_sem = asyncio.BoundedSemaphore(MAX_OPEN_FILES)
+        self._file_limiter = _AdaptiveLimiter(
+            MAX_OPEN_FILES, min_limit=MIN_OPEN_FILES, max_limit=OPEN_FILES_LIMIT
+        )
+        self._buffers = _BufferPool(lambda: self._file_limiter.limit)
         self._min_time_diff = 0.0
         self._max_time_diff = 0.0
 
@@ -190,6 +307,65 @@ class Storage(metaclass=NoPublicConstructor):
                 for status in res["FileStatuses"]["FileStatus"]:
                     yield _file_status_from_api_ls(uri, status)
 
+    async def walk(
+        self,
+        uri: URL,
+        *,
+        max_concurrency: int = MAX_LISTINGS,
+        max_depth: Optional[int] = None,
+        ordered: bool = False,
+        descend: Optional[Callable[[FileStatus], bool]] = None,
+    ) -> AsyncIterator[Tuple[URL, List[FileStatus]]]:
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency should be > 0")
+        if max_depth is not None and max_depth < 0:
+            raise ValueError("max_depth should be >= 0")
+        # Directories to list, breadth-first
+        todo: Deque[Tuple[URL, int]] = deque([(uri, 0)])
+        running: "Deque[Tuple[URL, int, asyncio.Future[List[FileStatus]]]]" = deque()
+
+        def schedule() -> None:
+            while todo and len(running) < max_concurrency:
+                dir_uri, depth = todo.popleft()
+                task = asyncio.ensure_future(self._list_dir(dir_uri))
+                running.append((dir_uri, depth, task))
+
+        try:
+            schedule()
+            while running:
+                if ordered:
+                    dir_uri, depth, task = running[0]
+                    await asyncio.wait([task])
+                else:
+                    await asyncio.wait(
+                        [task for _, _, task in running],
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    dir_uri, depth, task = next(
+                        item for item in running if item[2].done()
+                    )
+                running.remove((dir_uri, depth, task))
+                folder = task.result()
+                if max_depth is None or depth < max_depth:
+                    for stat in folder:
+                        if stat.is_dir() and (descend is None or descend(stat)):
+                            todo.append((dir_uri / stat.name, depth + 1))
+                # Start listing subdirectories before the caller gets the entries
+                schedule()
+                yield dir_uri, folder
+        finally:
+            tasks = [task for _, _, task in running]
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks)
+
+    async def _list_dir(self, uri: URL) -> List[FileStatus]:
+        for retry in retries(f"Fail to list {uri}"):
+            async with retry:
+                folder = [stat async for stat in self.ls(uri)]
+        return folder
+
     async def glob(self, uri: URL, *, dironly: bool = False) -> AsyncIterator[URL]:
         if not _has_magic(uri.path):
             yield uri
@@ -240,14 +416,36 @@ class Storage(metaclass=NoPublicConstructor):
                 yield stat
 
     async def _rlistdir(self, uri: URL, dironly: bool) -> AsyncIterator[URL]:
-        async for stat in self._iterdir(uri, dironly):
-            name = stat.path
-            if not _ishidden(name):
-                x = uri / name
-                yield x
-                if stat.is_dir():
-                    async for y in self._rlistdir(x, dironly):
-                        yield y
+        # Directories are listed concurrently by walk(), but the results are
+        # yielded depth-first, in the order of a sequential recursive listing.
+        walker = self.walk(uri, descend=lambda stat: not _ishidden(stat.name))
+        listings: Dict[URL, List[FileStatus]] = {}
+
+        async def listdir(dir_uri: URL) -> Iterator[FileStatus]:
+            while dir_uri not in listings:
+                listed_uri, folder = await walker.__anext__()
+                listings[listed_uri] = folder
+            return iter(listings.pop(dir_uri))
+
+        try:
+            stack = [(uri, await listdir(uri))]
+            while stack:
+                dir_uri, it = stack[-1]
+                for stat in it:
+                    if _ishidden(stat.name):
+                        continue
+                    child_uri = dir_uri / stat.name
+                    if not dironly or stat.is_dir():
+                        yield child_uri
+                    if stat.is_dir():
+                        stack.append((child_uri, await listdir(child_uri)))
+                        break
+                else:
+                    stack.pop()
+        finally:
+            aclose = getattr(walker, "aclose", None)
+            if aclose is not None:
+                await aclose()
 
     async def mkdir(
         self, uri: URL, *, parents: bool = False, exist_ok: bool = False
@@ -361,6 +559,91 @@ class Storage(metaclass=NoPublicConstructor):
             async for data in resp.content.iter_any():
                 yield data
 
+    async def _read(self, uri: URL, start: int, stop: int) -> bytes:
+        buf = bytearray()
+        for retry in retries(
+            f"Fail to read {uri}", on_congestion=self._file_limiter.congested
+        ):
+            pos = start + len(buf)
+            if pos >= stop:
+                break
+            async with retry:
+                async for chunk in self.open(uri, offset=pos, size=stop - pos):
+                    buf += chunk
+                    if chunk:
+                        retry.reset()
+        return bytes(buf)
+
+    async def _read_stream(self, uri: URL, size: int) -> AsyncIterator[bytes]:
+        pos = 0
+        for retry in retries(
+            f"Fail to read {uri}", on_congestion=self._file_limiter.congested
+        ):
+            if pos >= size:
+                break
+            async with retry:
+                async for chunk in self.open(uri, offset=pos):
+                    pos += len(chunk)
+                    yield chunk
+                    if chunk:
+                        retry.reset()
+
+    async def iter_contents(
+        self,
+        uri: URL,
+        *,
+        pattern: str = "**",
+        concurrency: int = PREFETCH_FILES,
+        prefetch_bytes: int = PREFETCH_BYTES,
+    ) -> AsyncIterator[Tuple[URL, bytes]]:
+        _check_prefetch(concurrency, prefetch_bytes)
+        uri = self._normalize_uri(uri)
+        match = re.compile(translate(pattern.lstrip("/")), re.DOTALL).fullmatch
+
+        async def list_files() -> AsyncIterator[Tuple[URL, int]]:
+            async for dir_uri, folder in self.walk(uri, ordered=True):
+                rel_path = dir_uri.path[len(uri.path) :].strip("/")
+                if rel_path:
+                    rel_path += "/"
+                for status in folder:
+                    if status.is_file() and match(rel_path + status.name):
+                        yield dir_uri / status.name, status.size
+
+        async def fetch(file_uri: URL, size: int) -> bytes:
+            return await self._read(file_uri, 0, size)
+
+        async for item in _iter_prefetched(
+            list_files(),
+            fetch,
+            concurrency=concurrency,
+            prefetch_bytes=prefetch_bytes,
+        ):
+            yield item
+
+    @asynccontextmanager
+    async def open_file(
+        self,
+        uri: URL,
+        *,
+        block_size: int = FILE_BLOCK_SIZE,
+        cache_blocks: int = FILE_CACHE_BLOCKS,
+    ) -> AsyncIterator["StorageFile"]:
+        if block_size <= 0:
+            raise ValueError("block_size should be > 0")
+        if cache_blocks < 0:
+            raise ValueError("cache_blocks should be >= 0")
+        uri = self._normalize_uri(uri)
+        stat = await self.stat(uri)
+        if stat.is_dir():
+            raise IsADirectoryError(errno.EISDIR, "Is a directory", str(uri))
+        file = StorageFile._create(
+            self, uri, stat.size, block_size=block_size, cache_blocks=cache_blocks
+        )
+        try:
+            yield file
+        finally:
+            file.close()
+
     async def rm(
         self,
         uri: URL,
@@ -379,10 +662,9 @@ class Storage(metaclass=NoPublicConstructor):
         # if final_path == root_data_path or final_path.parent == root_data_path:
         #     raise ValueError("Invalid path value.")
 
-        async_progress: _AsyncAbstractDeleteProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue, self._rm(uri, recursive=recursive, progress=async_progress)
+        async_progress = _ProgressPipeline(progress)
+        await async_progress.run(
+            self._rm(uri, recursive=recursive, progress=async_progress)
         )
 
     def check_for_server_error(self, server_message: Mapping[str, Any]) -> None:
@@ -440,7 +722,16 @@ class Storage(metaclass=NoPublicConstructor):
         update: bool = False,
         continue_: bool = False,
         progress: Optional[AbstractFileProgress] = None,
+        write_window: int = 1,
+        chunk_size: Optional[int] = None,
+        delta_store: Optional[Path] = None,
+        delta_block_size: int = DELTA_BLOCK_SIZE,
     ) -> None:
+        _check_write_window(write_window, chunk_size)
+        if delta_block_size <= 0:
+            raise ValueError("delta_block_size should be > 0")
+        if continue_:
+            write_window = 1  # see _upload_chunks()
         src = normalize_local_path_uri(src)
         dst = normalize_storage_path_uri(
             dst, self._config.username, self._config.cluster_name
@@ -459,8 +750,9 @@ class Storage(metaclass=NoPublicConstructor):
             # Ignore stat errors for device files like NUL or CON on Windows.
             # See https://bugs.python.org/issue37074
         offset: Optional[int] = 0
+        existing: Optional[FileStatus] = None
         try:
-            dst_stat = await self.stat(dst)
+            dst_stat = existing = await self.stat(dst)
             if dst_stat.is_dir():
                 raise IsADirectoryError(errno.EISDIR, "Is a directory", str(dst))
         except ResourceNotFound:
@@ -490,12 +782,150 @@ class Storage(metaclass=NoPublicConstructor):
         if offset is None:
             return
 
-        async_progress: _AsyncAbstractFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue, self._upload_file(path, dst, offset, progress=async_progress)
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        if delta_store is not None and _is_regular_file(path):
+            await async_progress.run(
+                self._upload_file_delta(
+                    path,
+                    dst,
+                    offset,
+                    existing,
+                    delta_store=delta_store,
+                    delta_block_size=delta_block_size,
+                    progress=async_progress,
+                    write_window=write_window,
+                    chunk_size=chunk_size,
+                ),
+            )
+            return
+        await async_progress.run(
+            self._upload_file(
+                path,
+                dst,
+                offset,
+                progress=async_progress,
+                write_window=write_window,
+                chunk_size=chunk_size,
+            ),
         )
 
+    async def _upload_file_delta(
+        self,
+        src_path: Path,
+        dst: URL,
+        offset: int,
+        dst_stat: Optional[FileStatus],
+        *,
+        delta_store: Path,
+        delta_block_size: int,
+        progress: _AsyncAbstractFileProgress,
+        write_window: int,
+        chunk_size: Optional[int],
+    ) -> None:
+        # Upload only blocks changed since the previous upload of src_path to dst
+        # if the remote file was not modified since then, otherwise upload
+        # the whole file.  Block hashes are recorded in the delta_store.
+        loop = asyncio.get_event_loop()
+        key = str(dst)
+        with _BlockHashStore(delta_store) as store:
+            record = store.get(key)
+            src_stat = src_path.stat()
+            if (
+                record is not None
+                and dst_stat is not None
+                and record.block_size == delta_block_size
+                and record.size == dst_stat.size
+                and record.remote_mtime == dst_stat.modification_time
+                and record.size <= src_stat.st_size
+            ):
+                async with self._file_limiter:
+                    hashes = await loop.run_in_executor(
+                        None, _hash_blocks, src_path, delta_block_size
+                    )
+                blocks = _changed_blocks(record.hashes, hashes)
+                await self._upload_blocks(
+                    src_path,
+                    dst,
+                    blocks,
+                    src_stat.st_size,
+                    delta_block_size,
+                    progress=progress,
+                )
+            else:
+                # No previous state, or the file was truncated (the storage
+                # has no operation for truncating a file).  The whole file
+                # is hashed while it is read for uploading.
+                hasher = _BlockHasher(delta_block_size) if not offset else None
+                await self._upload_file(
+                    src_path,
+                    dst,
+                    offset,
+                    progress=progress,
+                    write_window=write_window,
+                    chunk_size=chunk_size,
+                    hasher=hasher,
+                )
+                if hasher is not None:
+                    hashes = hasher.digest()
+                else:
+                    async with self._file_limiter:
+                        hashes = await loop.run_in_executor(
+                            None, _hash_blocks, src_path, delta_block_size
+                        )
+            new_src_stat = src_path.stat()
+            if (
+                new_src_stat.st_mtime_ns != src_stat.st_mtime_ns
+                or new_src_stat.st_size != src_stat.st_size
+            ):
+                # Changed while uploading, the hashes cannot be trusted
+                store.forget(key)
+                return
+            new_dst_stat = await self.stat(dst)
+            store.put(
+                key,
+                _BlockHashes(
+                    block_size=delta_block_size,
+                    size=src_stat.st_size,
+                    remote_mtime=new_dst_stat.modification_time,
+                    hashes=hashes,
+                ),
+            )
+
+    async def _upload_blocks(
+        self,
+        src_path: Path,
+        dst: URL,
+        blocks: List[int],
+        size: int,
+        block_size: int,
+        *,
+        progress: _AsyncAbstractFileProgress,
+    ) -> None:
+        src = URL(src_path.as_uri())
+        total = sum(min(block_size, size - block * block_size) for block in blocks)
+        async with self._file_limiter:
+            with src_path.open("rb") as stream, self._buffers.buffer(READ_SIZE) as buf:
+                await progress.start(StorageProgressStart(src, dst, total))
+                sent = 0
+                for block in blocks:
+                    offset = block * block_size
+                    stop = min(offset + block_size, size)
+                    stream.seek(offset)
+                    while offset < stop:
+                        chunk = await _read_chunk(stream, buf, stop - offset)
+                        if not chunk:
+                            break
+                        for retry in retries(
+                            f"Fail to upload {dst}",
+                            on_congestion=self._file_limiter.congested,
+                        ):
+                            async with retry:
+                                await self.write(dst, chunk, offset)
+                        offset += len(chunk)
+                        sent += len(chunk)
+                        await progress.step(src, dst, sent, total)
+                await progress.complete(StorageProgressComplete(src, dst, total))
+
     async def _upload_file(
         self,
         src_path: Path,
@@ -503,36 +933,104 @@ class Storage(metaclass=NoPublicConstructor):
         offset: int,
         *,
         progress: _AsyncAbstractFileProgress,
+        write_window: int = 1,
+        chunk_size: Optional[int] = None,
+        hasher: Optional["_BlockHasher"] = None,
     ) -> None:
+        # The hasher is fed with the read content, it requires offset == 0
         src = URL(src_path.as_uri())
-        loop = asyncio.get_event_loop()
-        async with self._file_sem:
-            with src_path.open("rb") as stream:
+        if chunk_size is None:
+            chunk_size = READ_SIZE
+        async with self._file_limiter:
+            with src_path.open("rb") as stream, self._buffers.buffer(chunk_size) as buf:
                 size = os.stat(stream.fileno()).st_size
                 await progress.start(StorageProgressStart(src, dst, size))
 
                 if offset:
                     stream.seek(offset)
                 else:
-                    chunk = await loop.run_in_executor(None, stream.read, READ_SIZE)
-                    for retry in retries(f"Fail to upload {dst}"):
+                    chunk = await _read_chunk(stream, buf, hasher=hasher)
+                    for retry in retries(
+                        f"Fail to upload {dst}",
+                        on_congestion=self._file_limiter.congested,
+                    ):
                         async with retry:
                             await self.create(dst, chunk)
                     offset = len(chunk)
 
-                if offset:
+                if offset and write_window > 1:
+                    await progress.step(src, dst, offset, size)
+                    await self._upload_chunks(
+                        src,
+                        dst,
+                        stream,
+                        size,
+                        offset,
+                        progress=progress,
+                        write_window=write_window,
+                        chunk_size=chunk_size,
+                        hasher=hasher,
+                    )
+                elif offset:
                     while True:
-                        await progress.step(StorageProgressStep(src, dst, offset, size))
-                        chunk = await loop.run_in_executor(None, stream.read, READ_SIZE)
+                        await progress.step(src, dst, offset, size)
+                        chunk = await _read_chunk(stream, buf, hasher=hasher)
                         if not chunk:
                             break
-                        for retry in retries(f"Fail to upload {dst}"):
+                        for retry in retries(
+                            f"Fail to upload {dst}",
+                            on_congestion=self._file_limiter.congested,
+                        ):
                             async with retry:
                                 await self.write(dst, chunk, offset)
                         offset += len(chunk)
 
                 await progress.complete(StorageProgressComplete(src, dst, size))
 
+    async def _upload_chunks(
+        self,
+        src: URL,
+        dst: URL,
+        stream: BufferedReader,
+        size: int,
+        offset: int,
+        *,
+        progress: _AsyncAbstractFileProgress,
+        write_window: int,
+        chunk_size: int,
+        hasher: Optional["_BlockHasher"] = None,
+    ) -> None:
+        # Keep up to write_window WRITE requests in flight for the same file.
+        # Chunks are read sequentially under the lock, so reading the next chunk
+        # overlaps with sending the previous ones.  Writes complete out of order,
+        # an interrupted upload can leave gaps below the remote size, and the
+        # storage cannot truncate a file.  So the chunks of uploads that can be
+        # continued from the remote size (continue_ or a journal) are written
+        # one by one.
+        read_lock = asyncio.Lock()
+        pos = current = offset
+
+        async def worker() -> None:
+            nonlocal pos, current
+            with self._buffers.buffer(chunk_size) as buf:
+                while True:
+                    async with read_lock:
+                        chunk = await _read_chunk(stream, buf, hasher=hasher)
+                        chunk_pos = pos
+                        pos += len(chunk)
+                    if not chunk:
+                        break
+                    for retry in retries(
+                        f"Fail to upload {dst}",
+                        on_congestion=self._file_limiter.congested,
+                    ):
+                        async with retry:
+                            await self.write(dst, chunk, chunk_pos)
+                    current += len(chunk)
+                    await progress.step(src, dst, current, size)
+
+        await run_concurrently(worker() for _ in range(write_window))
+
     async def upload_dir(
         self,
         src: URL,
@@ -543,7 +1041,13 @@ class Storage(metaclass=NoPublicConstructor):
         filter: Optional[Callable[[str], Awaitable[bool]]] = None,
         ignore_file_names: AbstractSet[str] = frozenset(),
         progress: Optional[AbstractRecursiveFileProgress] = None,
+        write_window: int = 1,
+        chunk_size: Optional[int] = None,
+        journal: Optional[Path] = None,
     ) -> None:
+        _check_write_window(write_window, chunk_size)
+        if continue_ or journal is not None:
+            write_window = 1  # see _upload_chunks()
         if filter is None:
             filter = _always
         src = normalize_local_path_uri(src)
@@ -555,37 +1059,79 @@ class Storage(metaclass=NoPublicConstructor):
             raise FileNotFoundError(errno.ENOENT, "No such file", str(path))
         if not path.is_dir():
             raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(path))
-        async_progress: _AsyncAbstractRecursiveFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue,
-            self._upload_dir(
+        if journal is not None:
+            with _TransferJournal(
+                journal,
                 src,
-                path,
                 dst,
-                "",
                 update=update,
                 continue_=continue_,
-                filter=filter,
-                ignore_file_names=ignore_file_names,
-                progress=async_progress,
+                ignore_file_names=sorted(ignore_file_names),
+            ) as transfer_journal:
+                plan = transfer_journal.load_plan()
+                if plan is None:
+                    plan = await self.plan_upload(
+                        src,
+                        dst,
+                        update=update,
+                        continue_=continue_,
+                        filter=filter,
+                        ignore_file_names=ignore_file_names,
+                    )
+                    transfer_journal.save_plan(plan)
+                else:
+                    # The files may be changed since the transfer was interrupted
+                    plan = await self.check_plan(plan)
+                await self._run_plan(
+                    plan,
+                    progress=progress,
+                    write_window=write_window,
+                    chunk_size=chunk_size,
+                    journal=transfer_journal,
+                )
+            journal.unlink()
+            return
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=MAX_LISTINGS,
+            max_bytes=MAX_INFLIGHT_BYTES,
+        )
+        await async_progress.run(
+            scheduler.run(
+                partial(
+                    self._upload_dir,
+                    src=src,
+                    src_path=path,
+                    dst=dst,
+                    rel_path="",
+                    update=update,
+                    continue_=continue_,
+                    file_filter=FileFilter(filter),
+                    ignore_file_names=ignore_file_names,
+                    progress=async_progress,
+                    write_window=write_window,
+                    chunk_size=chunk_size,
+                )
             ),
         )
 
     async def _upload_dir(
         self,
+        node: "_TransferDir",
+        *,
         src: URL,
         src_path: Path,
         dst: URL,
         rel_path: str,
-        *,
         update: bool,
         continue_: bool,
-        filter: Callable[[str], Awaitable[bool]],
+        file_filter: FileFilter,
         ignore_file_names: AbstractSet[str],
         progress: _AsyncAbstractRecursiveFileProgress,
+        write_window: int = 1,
+        chunk_size: Optional[int] = None,
     ) -> None:
-        tasks = []
         try:
             exists = False
             if update or continue_:
@@ -608,51 +1154,62 @@ class Storage(metaclass=NoPublicConstructor):
             raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(dst))
 
         await progress.enter(StorageProgressEnterDir(src, dst))
-        loop = asyncio.get_event_loop()
-        async with self._file_sem:
-            folder = await loop.run_in_executor(None, lambda: list(src_path.iterdir()))
+        node.on_done(partial(progress.leave, StorageProgressLeaveDir(src, dst)))
+        async with self._file_limiter:
+            folder = await _scan_dir_async(src_path)
 
         if ignore_file_names:
             for child in folder:
-                if child.name in ignore_file_names and child.is_file():
+                if child.name in ignore_file_names and child.is_file:
                     log.debug(f"Load ignore file {rel_path}{child.name}")
-                    file_filter = FileFilter(filter)
-                    file_filter.read_from_file(child, prefix=rel_path)
-                    filter = file_filter.match
+                    file_filter = file_filter.copy()
+                    file_filter.read_from_file(src_path / child.name, prefix=rel_path)
 
         for child in folder:
             name = child.name
             child_rel_path = f"{rel_path}{name}"
-            if child.is_dir():
+            if child.is_dir:
                 child_rel_path += "/"
-            if not await filter(child_rel_path):
+            if not await file_filter.match(child_rel_path):
                 log.debug(f"Skip {child_rel_path}")
                 continue
-            if child.is_file():
+            if child.is_file:
+                child_stat = child.stat
+                assert child_stat is not None
                 offset: Optional[int] = 0
                 if (update or continue_) and name in dst_files:
                     offset = self._check_upload(
-                        child.stat(), dst_files[name], update, continue_
+                        child_stat, dst_files[name], update, continue_
                     )
                 if offset is None:
                     continue
-                tasks.append(
-                    self._upload_file(
-                        src_path / name, dst / name, offset, progress=progress
-                    )
-                )
-            elif child.is_dir():
-                tasks.append(
-                    self._upload_dir(
-                        src / name,
+                await node.add_file(
+                    child_stat.st_size - offset,
+                    partial(
+                        self._upload_file,
                         src_path / name,
                         dst / name,
-                        child_rel_path,
+                        offset,
+                        progress=progress,
+                        write_window=write_window,
+                        chunk_size=chunk_size,
+                    ),
+                )
+            elif child.is_dir:
+                await node.add_dir(
+                    partial(
+                        self._upload_dir,
+                        src=src / name,
+                        src_path=src_path / name,
+                        dst=dst / name,
+                        rel_path=child_rel_path,
                         update=update,
                         continue_=continue_,
-                        filter=filter,
+                        file_filter=file_filter,
                         ignore_file_names=ignore_file_names,
                         progress=progress,
+                        write_window=write_window,
+                        chunk_size=chunk_size,
                     )
                 )
             else:
@@ -663,11 +1220,10 @@ class Storage(metaclass=NoPublicConstructor):
                     StorageProgressFail(
                         src / name,
                         dst / name,
-                        f"Cannot upload {child}, not regular file/directory",
+                        f"Cannot upload {src_path / name}, "
+                        "not regular file/directory",
                     ),
                 )  # pragma: no cover
-        await run_concurrently(tasks)
-        await progress.leave(StorageProgressLeaveDir(src, dst))
 
     async def download_file(
         self,
@@ -677,7 +1233,10 @@ class Storage(metaclass=NoPublicConstructor):
         update: bool = False,
         continue_: bool = False,
         progress: Optional[AbstractFileProgress] = None,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
     ) -> None:
+        _check_segments(parallel_segments, segment_size)
         src = normalize_storage_path_uri(
             src, self._config.username, self._config.cluster_name
         )
@@ -698,12 +1257,17 @@ class Storage(metaclass=NoPublicConstructor):
         if offset is None:
             return
 
-        async_progress: _AsyncAbstractFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue,
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        await async_progress.run(
             self._download_file(
-                src, dst, path, src_stat.size, offset, progress=async_progress
+                src,
+                dst,
+                path,
+                src_stat.size,
+                offset,
+                progress=async_progress,
+                parallel_segments=parallel_segments,
+                segment_size=segment_size,
             ),
         )
 
@@ -716,129 +1280,200 @@ class Storage(metaclass=NoPublicConstructor):
         offset: int,
         *,
         progress: _AsyncAbstractFileProgress,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
     ) -> None:
-        loop = asyncio.get_event_loop()
-        async with self._file_sem:
+        async with self._file_limiter:
             await progress.start(StorageProgressStart(src, dst, size))
-            with dst_path.open("rb+" if offset else "wb") as stream:
-                if offset:
-                    stream.seek(offset)
-                for retry in retries(f"Fail to download {src}"):
-                    pos = stream.tell()
-                    if pos >= size:
-                        break
-                    async with retry:
-                        it = self.open(src, offset=pos)
-                        async for chunk in it:
-                            pos += len(chunk)
-                            await progress.step(
-                                StorageProgressStep(src, dst, pos, size)
-                            )
-                            await loop.run_in_executor(None, stream.write, chunk)
-                            if chunk:
-                                retry.reset()
+            written = offset
+
+            async def step(n: int) -> None:
+                nonlocal written
+                written += n
+                await progress.step(src, dst, written, size)
+
+            if parallel_segments > 1 and size - offset > segment_size:
+                await _download_segments(
+                    dst_path,
+                    size,
+                    offset,
+                    lambda start, stop: self.open(src, offset=start, size=stop - start),
+                    msg=f"Fail to download {src}",
+                    on_congestion=self._file_limiter.congested,
+                    on_flush=step,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                )
+            else:
+                with dst_path.open("rb+" if offset else "wb") as stream:
+                    writer = _CoalescingWriter(
+                        _PositionalWriter(stream), offset, on_flush=step, stop=size
+                    )
+                    try:
+                        for retry in retries(
+                            f"Fail to download {src}",
+                            on_congestion=self._file_limiter.congested,
+                        ):
+                            if writer.pos >= size:
+                                break
+                            async with retry:
+                                it = self.open(src, offset=writer.pos)
+                                async for chunk in it:
+                                    await writer.write(chunk)
+                                    if chunk:
+                                        retry.reset()
+                    finally:
+                        await writer.flush()
 
             await progress.complete(StorageProgressComplete(src, dst, size))
 
-    async def download_dir(
+    async def sync(
         self,
         src: URL,
         dst: URL,
         *,
-        update: bool = False,
-        continue_: bool = False,
+        manifest: Path,
         filter: Optional[Callable[[str], Awaitable[bool]]] = None,
+        ignore_file_names: AbstractSet[str] = frozenset(),
         progress: Optional[AbstractRecursiveFileProgress] = None,
     ) -> None:
         if filter is None:
             filter = _always
-        src = normalize_storage_path_uri(
-            src, self._config.username, self._config.cluster_name
-        )
-        dst = normalize_local_path_uri(dst)
-        path = _extract_path(dst)
+        if src.scheme == "file" and dst.scheme == "storage":
+            src = normalize_local_path_uri(src)
+            dst = normalize_storage_path_uri(
+                dst, self._config.username, self._config.cluster_name
+            )
+            path = _extract_path(src).resolve()
+            if not path.exists():
+                raise FileNotFoundError(errno.ENOENT, "No such file", str(path))
+            if not path.is_dir():
+                raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(path))
+        elif src.scheme == "storage" and dst.scheme == "file":
+            src = normalize_storage_path_uri(
+                src, self._config.username, self._config.cluster_name
+            )
+            dst = normalize_local_path_uri(dst)
+            path = _extract_path(dst)
+        else:
+            raise ValueError(
+                f"Sync of {src.scheme!r} directory to {dst.scheme!r} directory "
+                "is not supported"
+            )
 
-        async_progress: _AsyncAbstractRecursiveFileProgress
-        queue, async_progress = queue_calls(progress)
-        await run_progress(
-            queue,
-            self._download_dir(
-                src,
-                dst,
-                path,
-                "",
-                update=update,
-                continue_=continue_,
-                filter=filter,
-                progress=async_progress,
-            ),
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=MAX_LISTINGS,
+            max_bytes=MAX_INFLIGHT_BYTES,
         )
+        list_dir: _ListDir
+        with _SyncManifest(manifest, src, dst) as sync_manifest:
+            if src.scheme == "file":
+                list_dir = partial(
+                    self._sync_upload_dir,
+                    src=src,
+                    src_path=path,
+                    dst=dst,
+                    rel_path="",
+                    manifest=sync_manifest,
+                    file_filter=FileFilter(filter),
+                    ignore_file_names=ignore_file_names,
+                    progress=async_progress,
+                )
+            else:
+                list_dir = partial(
+                    self._sync_download_dir,
+                    src=src,
+                    dst=dst,
+                    dst_path=path,
+                    rel_path="",
+                    manifest=sync_manifest,
+                    filter=filter,
+                    progress=async_progress,
+                )
+            await async_progress.run(scheduler.run(list_dir))
 
-    async def _download_dir(
+    async def _sync_upload_dir(
         self,
+        node: "_TransferDir",
+        *,
         src: URL,
+        src_path: Path,
         dst: URL,
-        dst_path: Path,
         rel_path: str,
-        *,
-        update: bool,
-        continue_: bool,
-        filter: Callable[[str], Awaitable[bool]],
+        manifest: "_SyncManifest",
+        file_filter: FileFilter,
+        ignore_file_names: AbstractSet[str],
         progress: _AsyncAbstractRecursiveFileProgress,
     ) -> None:
-        dst_path.mkdir(parents=True, exist_ok=True)
+        # Remote directories created by previous syncs are trusted to exist,
+        # the remote side is neither listed nor checked.
+        if not manifest.has_dir(rel_path):
+            try:
+                for retry in retries(f"Fail to create {dst}"):
+                    async with retry:
+                        await self.mkdir(dst, parents=True, exist_ok=True)
+            except FileExistsError:
+                raise NotADirectoryError(errno.ENOTDIR, "Not a directory", str(dst))
+            manifest.add_dir(rel_path)
+
         await progress.enter(StorageProgressEnterDir(src, dst))
-        tasks = []
-        if update or continue_:
-            loop = asyncio.get_event_loop()
-            async with self._file_sem:
-                dst_files = await loop.run_in_executor(
-                    None,
-                    lambda: {
-                        item.name: item for item in dst_path.iterdir() if item.is_file()
-                    },
-                )
+        node.on_done(partial(progress.leave, StorageProgressLeaveDir(src, dst)))
+        async with self._file_limiter:
+            folder = await _scan_dir_async(src_path)
 
-        for retry in retries(f"Fail to list {src}"):
-            async with retry:
-                folder = [item async for item in self.ls(src)]
+        if ignore_file_names:
+            for child in folder:
+                if child.name in ignore_file_names and child.is_file:
+                    log.debug(f"Load ignore file {rel_path}{child.name}")
+                    file_filter = file_filter.copy()
+                    file_filter.read_from_file(src_path / child.name, prefix=rel_path)
 
+        known = manifest.files(rel_path)
+        seen = set()
         for child in folder:
             name = child.name
             child_rel_path = f"{rel_path}{name}"
-            if child.is_dir():
+            if child.is_dir:
                 child_rel_path += "/"
-            if not await filter(child_rel_path):
+            if not await file_filter.match(child_rel_path):
                 log.debug(f"Skip {child_rel_path}")
                 continue
-            if child.is_file():
-                offset: Optional[int] = 0
-                if (update or continue_) and name in dst_files:
-                    offset = self._check_download(
-                        dst_files[name].stat(), child, update, continue_
-                    )
-                if offset is None:
+            if child.is_file:
+                seen.add(name)
+                child_stat = child.stat
+                assert child_stat is not None
+                entry = known.get(name)
+                if (
+                    entry is not None
+                    and entry.size == child_stat.st_size
+                    and entry.mtime == child_stat.st_mtime_ns
+                ):
                     continue
-                tasks.append(
-                    self._download_file(
-                        src / name,
+                await node.add_file(
+                    child_stat.st_size,
+                    partial(
+                        self._sync_upload_file,
+                        src_path / name,
                         dst / name,
-                        dst_path / name,
-                        child.size,
-                        offset,
+                        child_stat,
+                        rel_path=rel_path,
+                        manifest=manifest,
                         progress=progress,
-                    )
+                    ),
                 )
-            elif child.is_dir():
-                tasks.append(
-                    self._download_dir(
-                        src / name,
-                        dst / name,
-                        dst_path / name,
-                        child_rel_path,
-                        update=update,
-                        continue_=continue_,
-                        filter=filter,
+            elif child.is_dir:
+                await node.add_dir(
+                    partial(
+                        self._sync_upload_dir,
+                        src=src / name,
+                        src_path=src_path / name,
+                        dst=dst / name,
+                        rel_path=child_rel_path,
+                        manifest=manifest,
+                        file_filter=file_filter,
+                        ignore_file_names=ignore_file_names,
                         progress=progress,
                     )
                 )
@@ -847,17 +1482,872 @@ class Storage(metaclass=NoPublicConstructor):
                     StorageProgressFail(
                         src / name,
                         dst / name,
-                        f"Cannot download {child}, not regular file/directory",
+                        f"Cannot upload {src_path / name}, "
+                        "not regular file/directory",
                     ),
                 )  # pragma: no cover
-        await run_concurrently(tasks)
-        await progress.leave(StorageProgressLeaveDir(src, dst))
+        manifest.forget(rel_path, known.keys() - seen)
 
+    async def _sync_upload_file(
+        self,
+        src_path: Path,
+        dst: URL,
+        src_stat: os.stat_result,
+        *,
+        rel_path: str,
+        manifest: "_SyncManifest",
+        progress: _AsyncAbstractFileProgress,
+    ) -> None:
+        await self._upload_file(src_path, dst, 0, progress=progress)
+        # Record the state seen before uploading, if the file was changed
+        # in the meantime it will be uploaded again by the next sync.
+        manifest.record(
+            rel_path,
+            src_path.name,
+            size=src_stat.st_size,
+            mtime=src_stat.st_mtime_ns,
+            remote_mtime=None,
+        )
 
-_magic_check = re.compile("(?:[*?[])")
-
+    async def _sync_download_dir(
+        self,
+        node: "_TransferDir",
+        *,
+        src: URL,
+        dst: URL,
+        dst_path: Path,
+        rel_path: str,
+        manifest: "_SyncManifest",
+        filter: Callable[[str], Awaitable[bool]],
+        progress: _AsyncAbstractRecursiveFileProgress,
+    ) -> None:
+        dst_path.mkdir(parents=True, exist_ok=True)
+        await progress.enter(StorageProgressEnterDir(src, dst))
+        node.on_done(partial(progress.leave, StorageProgressLeaveDir(src, dst)))
 
-def _has_magic(s: str) -> bool:
+        for retry in retries(f"Fail to list {src}"):
+            async with retry:
+                folder = [item async for item in self.ls(src)]
+
+        known = manifest.files(rel_path)
+        dst_files: Dict[str, os.stat_result] = {}
+        if known:
+            async with self._file_limiter:
+                dst_files = {
+                    item.name: item.stat
+                    for item in await _scan_dir_async(dst_path)
+                    if item.stat is not None
+                }
+        seen = set()
+        for child in folder:
+            name = child.name
+            child_rel_path = f"{rel_path}{name}"
+            if child.is_dir():
+                child_rel_path += "/"
+            if not await filter(child_rel_path):
+                log.debug(f"Skip {child_rel_path}")
+                continue
+            if child.is_file():
+                seen.add(name)
+                entry = known.get(name)
+                dst_stat = dst_files.get(name)
+                if (
+                    entry is not None
+                    and entry.size == child.size
+                    and entry.remote_mtime == child.modification_time
+                    and dst_stat is not None
+                    and dst_stat.st_size == entry.size
+                    and dst_stat.st_mtime_ns == entry.mtime
+                ):
+                    continue
+                await node.add_file(
+                    child.size,
+                    partial(
+                        self._sync_download_file,
+                        src / name,
+                        dst / name,
+                        dst_path / name,
+                        child,
+                        rel_path=rel_path,
+                        manifest=manifest,
+                        progress=progress,
+                    ),
+                )
+            elif child.is_dir():
+                await node.add_dir(
+                    partial(
+                        self._sync_download_dir,
+                        src=src / name,
+                        dst=dst / name,
+                        dst_path=dst_path / name,
+                        rel_path=child_rel_path,
+                        manifest=manifest,
+                        filter=filter,
+                        progress=progress,
+                    )
+                )
+            else:
+                await progress.fail(
+                    StorageProgressFail(
+                        src / name,
+                        dst / name,
+                        f"Cannot download {child}, not regular file/directory",
+                    ),
+                )  # pragma: no cover
+        manifest.forget(rel_path, known.keys() - seen)
+
+    async def _sync_download_file(
+        self,
+        src: URL,
+        dst: URL,
+        dst_path: Path,
+        src_stat: FileStatus,
+        *,
+        rel_path: str,
+        manifest: "_SyncManifest",
+        progress: _AsyncAbstractFileProgress,
+    ) -> None:
+        await self._download_file(
+            src, dst, dst_path, src_stat.size, 0, progress=progress
+        )
+        dst_stat = dst_path.stat()
+        manifest.record(
+            rel_path,
+            dst_path.name,
+            size=dst_stat.st_size,
+            mtime=dst_stat.st_mtime_ns,
+            remote_mtime=src_stat.modification_time,
+        )
+
+    async def download_dir(
+        self,
+        src: URL,
+        dst: URL,
+        *,
+        update: bool = False,
+        continue_: bool = False,
+        filter: Optional[Callable[[str], Awaitable[bool]]] = None,
+        progress: Optional[AbstractRecursiveFileProgress] = None,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
+        journal: Optional[Path] = None,
+    ) -> None:
+        _check_segments(parallel_segments, segment_size)
+        if filter is None:
+            filter = _always
+        src = normalize_storage_path_uri(
+            src, self._config.username, self._config.cluster_name
+        )
+        dst = normalize_local_path_uri(dst)
+        path = _extract_path(dst)
+        if journal is not None:
+            with _TransferJournal(
+                journal, src, dst, update=update, continue_=continue_
+            ) as transfer_journal:
+                plan = transfer_journal.load_plan()
+                if plan is None:
+                    plan = await self.plan_download(
+                        src, dst, update=update, continue_=continue_, filter=filter
+                    )
+                    transfer_journal.save_plan(plan)
+                else:
+                    # The files may be changed since the transfer was interrupted
+                    plan = await self.check_plan(plan)
+                await self._run_plan(
+                    plan,
+                    progress=progress,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                    journal=transfer_journal,
+                )
+            journal.unlink()
+            return
+
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=MAX_LISTINGS,
+            max_bytes=MAX_INFLIGHT_BYTES,
+        )
+        await async_progress.run(
+            scheduler.run(
+                partial(
+                    self._download_dir,
+                    src=src,
+                    dst=dst,
+                    dst_path=path,
+                    rel_path="",
+                    update=update,
+                    continue_=continue_,
+                    filter=filter,
+                    progress=async_progress,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                )
+            ),
+        )
+
+    async def _download_dir(
+        self,
+        node: "_TransferDir",
+        *,
+        src: URL,
+        dst: URL,
+        dst_path: Path,
+        rel_path: str,
+        update: bool,
+        continue_: bool,
+        filter: Callable[[str], Awaitable[bool]],
+        progress: _AsyncAbstractRecursiveFileProgress,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
+    ) -> None:
+        dst_path.mkdir(parents=True, exist_ok=True)
+        await progress.enter(StorageProgressEnterDir(src, dst))
+        node.on_done(partial(progress.leave, StorageProgressLeaveDir(src, dst)))
+        if update or continue_:
+            async with self._file_limiter:
+                dst_files = {
+                    item.name: item.stat
+                    for item in await _scan_dir_async(dst_path)
+                    if item.stat is not None
+                }
+
+        for retry in retries(f"Fail to list {src}"):
+            async with retry:
+                folder = [item async for item in self.ls(src)]
+
+        for child in folder:
+            name = child.name
+            child_rel_path = f"{rel_path}{name}"
+            if child.is_dir():
+                child_rel_path += "/"
+            if not await filter(child_rel_path):
+                log.debug(f"Skip {child_rel_path}")
+                continue
+            if child.is_file():
+                offset: Optional[int] = 0
+                if (update or continue_) and name in dst_files:
+                    offset = self._check_download(
+                        dst_files[name], child, update, continue_
+                    )
+                if offset is None:
+                    continue
+                await node.add_file(
+                    child.size - offset,
+                    partial(
+                        self._download_file,
+                        src / name,
+                        dst / name,
+                        dst_path / name,
+                        child.size,
+                        offset,
+                        progress=progress,
+                        parallel_segments=parallel_segments,
+                        segment_size=segment_size,
+                    ),
+                )
+            elif child.is_dir():
+                await node.add_dir(
+                    partial(
+                        self._download_dir,
+                        src=src / name,
+                        dst=dst / name,
+                        dst_path=dst_path / name,
+                        rel_path=child_rel_path,
+                        update=update,
+                        continue_=continue_,
+                        filter=filter,
+                        progress=progress,
+                        parallel_segments=parallel_segments,
+                        segment_size=segment_size,
+                    )
+                )
+            else:
+                await progress.fail(
+                    StorageProgressFail(
+                        src / name,
+                        dst / name,
+                        f"Cannot download {child}, not regular file/directory",
+                    ),
+                )  # pragma: no cover
+
+    async def plan_upload(
+        self,
+        src: URL,
+        dst: URL,
+        *,
+        update: bool = False,
+        continue_: bool = False,
+        filter: Optional[Callable[[str], Awaitable[bool]]] = None,
+        ignore_file_names: AbstractSet[str] = frozenset(),
+    ) -> TransferPlan:
+        if filter is None:
+            filter = _always
+        src = normalize_local_path_uri(src)
+        dst = normalize_storage_path_uri(
+            dst, self._config.username, self._config.cluster_name
+        )
+        path = _extract_path(src).resolve()
+        if not path.exists():
+            raise FileNotFoundError(errno.ENOENT, "No such file", str(path))
+        if not path.is_dir():
+            offset: Optional[int] = 0
+            try:
+                dst_stat = await self.stat(dst)
+            except ResourceNotFound:
+                pass
+            else:
+                if dst_stat.is_dir():
+                    raise IsADirectoryError(errno.EISDIR, "Is a directory", str(dst))
+                if update or continue_:
+                    offset = self._check_upload(
+                        path.stat(), dst_stat, update, continue_
+                    )
+            return TransferPlan(
+                [_plan_file_entry(src, dst, path.stat().st_size, offset)]
+            )
+
+        # List the local tree first, then the remote directories which
+        # are needed to decide on updating or continuing files.
+        dirs: List[Tuple[URL, URL, List[Tuple[str, os.stat_result]]]] = []
+        todo: Deque[Tuple[URL, Path, URL, str, FileFilter]] = deque(
+            [(src, path, dst, "", FileFilter(filter))]
+        )
+        while todo:
+            dir_src, dir_path, dir_dst, rel_path, file_filter = todo.popleft()
+            async with self._file_limiter:
+                folder = await _scan_dir_async(dir_path)
+            if ignore_file_names:
+                for child in folder:
+                    if child.name in ignore_file_names and child.is_file:
+                        file_filter = file_filter.copy()
+                        file_filter.read_from_file(
+                            dir_path / child.name, prefix=rel_path
+                        )
+            files = []
+            for child in folder:
+                name = child.name
+                child_rel_path = f"{rel_path}{name}"
+                if child.is_dir:
+                    child_rel_path += "/"
+                if not await file_filter.match(child_rel_path):
+                    log.debug(f"Skip {child_rel_path}")
+                    continue
+                if child.stat is not None:
+                    files.append((name, child.stat))
+                elif child.is_dir:
+                    todo.append(
+                        (
+                            dir_src / name,
+                            dir_path / name,
+                            dir_dst / name,
+                            child_rel_path,
+                            file_filter,
+                        )
+                    )
+                else:
+                    log.warning(
+                        f"Cannot upload {dir_path / name}, not regular file/directory"
+                    )
+            dirs.append((dir_src, dir_dst, files))
+
+        remote: Dict[URL, Dict[str, FileStatus]] = {}
+        if update or continue_:
+            dsts = iter([dir_dst for _, dir_dst, _ in dirs])
+
+            async def list_remote() -> None:
+                for dir_dst in dsts:
+                    try:
+                        remote[dir_dst] = {
+                            item.name: item
+                            for item in await self._list_dir(dir_dst)
+                            if item.is_file()
+                        }
+                    except ResourceNotFound:
+                        pass
+
+            await run_concurrently(list_remote() for _ in range(MAX_LISTINGS))
+
+        entries = []
+        for dir_src, dir_dst, files in dirs:
+            entries.append(
+                TransferPlanEntry(dir_src, dir_dst, FileStatusType.DIRECTORY)
+            )
+            dst_files = remote.get(dir_dst, {})
+            for name, stat in files:
+                offset = 0
+                if name in dst_files:
+                    offset = self._check_upload(
+                        stat, dst_files[name], update, continue_
+                    )
+                entries.append(
+                    _plan_file_entry(
+                        dir_src / name, dir_dst / name, stat.st_size, offset
+                    )
+                )
+        return TransferPlan(entries)
+
+    async def plan_download(
+        self,
+        src: URL,
+        dst: URL,
+        *,
+        update: bool = False,
+        continue_: bool = False,
+        filter: Optional[Callable[[str], Awaitable[bool]]] = None,
+    ) -> TransferPlan:
+        if filter is None:
+            filter = _always
+        src = normalize_storage_path_uri(
+            src, self._config.username, self._config.cluster_name
+        )
+        dst = normalize_local_path_uri(dst)
+        path = _extract_path(dst)
+        src_stat = await self.stat(src)
+        if not src_stat.is_dir():
+            offset: Optional[int] = 0
+            if update or continue_:
+                try:
+                    dst_stat = path.stat()
+                except OSError:
+                    pass
+                else:
+                    if S_ISREG(dst_stat.st_mode):
+                        offset = self._check_download(
+                            dst_stat, src_stat, update, continue_
+                        )
+            return TransferPlan([_plan_file_entry(src, dst, src_stat.size, offset)])
+
+        file_filter = FileFilter(filter)
+
+        def rel_dir_path(stat: FileStatus) -> str:
+            return stat.uri.path[len(src.path) :].strip("/") + "/"
+
+        # Directories excluded by the filters are not listed at all, those
+        # excluded by the default filter are only known after listing.
+        included: Dict[URL, Tuple[str, URL, Path]] = {src: ("", dst, path)}
+        entries = []
+        async for dir_src, folder in self.walk(
+            src,
+            ordered=True,
+            descend=lambda stat: file_filter.check(rel_dir_path(stat)) is not False,
+        ):
+            if dir_src not in included:
+                continue
+            rel_path, dir_dst, dir_path = included[dir_src]
+            entries.append(
+                TransferPlanEntry(dir_src, dir_dst, FileStatusType.DIRECTORY)
+            )
+            dst_files: Dict[str, os.stat_result] = {}
+            if update or continue_:
+                try:
+                    dst_files = {
+                        item.name: item.stat
+                        for item in await _scan_dir_async(dir_path)
+                        if item.stat is not None
+                    }
+                except OSError:
+                    pass
+            for child in folder:
+                name = child.name
+                child_rel_path = f"{rel_path}{name}"
+                if child.is_dir():
+                    child_rel_path += "/"
+                if not await file_filter.match(child_rel_path):
+                    log.debug(f"Skip {child_rel_path}")
+                    continue
+                if child.is_file():
+                    offset = 0
+                    if name in dst_files:
+                        offset = self._check_download(
+                            dst_files[name], child, update, continue_
+                        )
+                    entries.append(
+                        _plan_file_entry(
+                            dir_src / name, dir_dst / name, child.size, offset
+                        )
+                    )
+                elif child.is_dir():
+                    included[dir_src / name] = (
+                        child_rel_path,
+                        dir_dst / name,
+                        dir_path / name,
+                    )
+        return TransferPlan(entries)
+
+    async def check_plan(self, plan: TransferPlan) -> TransferPlan:
+        # The files may be changed since the plan was made, e.g. dumped to
+        # a file and loaded later.  Sizes are refreshed, recorded offsets and
+        # skips are recomputed from the current files.
+        remote_dirs: Dict[URL, None] = {}
+        local_dirs: Dict[Path, None] = {}
+        for entry in plan.entries:
+            if not entry.is_file():
+                continue
+            upload = entry.src.scheme == "file"
+            local_dirs[_extract_path(entry.src if upload else entry.dst).parent] = None
+            if not upload or entry.offset or entry.skip:
+                remote = entry.dst if upload else entry.src
+                remote_dirs[remote.parent] = None
+        dirs = iter(remote_dirs)
+        listings: Dict[URL, Dict[str, FileStatus]] = {}
+        paths = iter(local_dirs)
+        local_listings: Dict[Path, Dict[str, os.stat_result]] = {}
+
+        async def list_remote() -> None:
+            for dir_uri in dirs:
+                try:
+                    listings[dir_uri] = {
+                        item.name: item
+                        for item in await self._list_dir(dir_uri)
+                        if item.is_file()
+                    }
+                except ResourceNotFound:
+                    pass
+
+        async def list_local() -> None:
+            # Files are stat'ed by directory in the executor, not one by one
+            # on the event loop
+            for path in paths:
+                try:
+                    async with self._file_limiter:
+                        folder = await _scan_dir_async(path)
+                except OSError:
+                    continue
+                local_listings[path] = {
+                    item.name: item.stat for item in folder if item.stat is not None
+                }
+
+        await run_concurrently(
+            itertools.chain(
+                (list_remote() for _ in range(MAX_LISTINGS)),
+                (list_local() for _ in range(MAX_LISTINGS)),
+            )
+        )
+        return TransferPlan(
+            [
+                self._check_plan_entry(entry, listings, local_listings)
+                if entry.is_file()
+                else entry
+                for entry in plan.entries
+            ]
+        )
+
+    def _check_plan_entry(
+        self,
+        entry: TransferPlanEntry,
+        listings: Dict[URL, Dict[str, FileStatus]],
+        local_listings: Dict[Path, Dict[str, os.stat_result]],
+    ) -> TransferPlanEntry:
+        upload = entry.src.scheme == "file"
+        local_path = _extract_path(entry.src if upload else entry.dst)
+        remote_uri = entry.dst if upload else entry.src
+        local = local_listings.get(local_path.parent, {}).get(local_path.name)
+        remote = listings.get(remote_uri.parent, {}).get(remote_uri.name)
+        src_size: Optional[int]
+        if upload:
+            src_size = local.st_size if local is not None else None
+        else:
+            src_size = remote.size if remote is not None else None
+        if src_size is None:
+            # The transfer reports the missing source
+            return entry
+        if not entry.offset and not entry.skip:
+            return replace(entry, size=src_size)
+        if local is None or remote is None:
+            return replace(entry, size=src_size, offset=0, skip=False)
+        # The checks of planning with the current files: a skipped file stays
+        # skipped while the destination is newer than the source, a partial
+        # one is continued from the current size of the destination.
+        if upload:
+            offset = self._check_upload(local, remote, entry.skip, not entry.skip)
+        else:
+            offset = self._check_download(local, remote, entry.skip, not entry.skip)
+        return _plan_file_entry(entry.src, entry.dst, src_size, offset)
+
+    async def run_plan(
+        self,
+        plan: TransferPlan,
+        *,
+        progress: Optional[AbstractRecursiveFileProgress] = None,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
+    ) -> None:
+        _check_segments(parallel_segments, segment_size)
+        for entry in plan.entries:
+            if (entry.src.scheme, entry.dst.scheme) not in (
+                ("file", "storage"),
+                ("storage", "file"),
+            ):
+                raise ValueError(
+                    f"Transfer of {entry.src.scheme!r} {entry.src} "
+                    f"to {entry.dst.scheme!r} is not supported"
+                )
+        await self._run_plan(
+            plan,
+            progress=progress,
+            parallel_segments=parallel_segments,
+            segment_size=segment_size,
+        )
+
+    async def _run_plan(
+        self,
+        plan: TransferPlan,
+        *,
+        progress: Optional[AbstractRecursiveFileProgress],
+        write_window: int = 1,
+        chunk_size: Optional[int] = None,
+        parallel_segments: int = 1,
+        segment_size: int = SEGMENT_SIZE,
+        journal: Optional["_TransferJournal"] = None,
+    ) -> None:
+        async_progress = _ProgressPipeline(progress, limiter=self._file_limiter)
+        scheduler = _TransferScheduler(
+            max_files=OPEN_FILES_LIMIT,
+            max_listings=1,
+            max_bytes=MAX_INFLIGHT_BYTES,
+        )
+        await async_progress.run(
+            scheduler.run(
+                partial(
+                    self._schedule_plan,
+                    plan=plan,
+                    progress=async_progress,
+                    write_window=write_window,
+                    chunk_size=chunk_size,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                    journal=journal,
+                )
+            )
+        )
+
+    async def _schedule_plan(
+        self,
+        node: "_TransferDir",
+        *,
+        plan: TransferPlan,
+        progress: _AsyncAbstractRecursiveFileProgress,
+        write_window: int,
+        chunk_size: Optional[int],
+        parallel_segments: int,
+        segment_size: int,
+        journal: Optional["_TransferJournal"],
+    ) -> None:
+        if journal is None or not journal.dirs_created:
+            remote_dirs = iter(
+                [
+                    entry.dst
+                    for entry in plan.entries
+                    if entry.is_dir() and entry.dst.scheme == "storage"
+                ]
+            )
+
+            async def mkdirs() -> None:
+                for dst in remote_dirs:
+                    for retry in retries(f"Fail to create {dst}"):
+                        async with retry:
+                            await self.mkdir(dst, parents=True, exist_ok=True)
+
+            await run_concurrently(mkdirs() for _ in range(MAX_LISTINGS))
+            if journal is not None:
+                journal.set_dirs_created()
+        for entry in plan.entries:
+            if entry.is_dir() and entry.dst.scheme == "file":
+                _extract_path(entry.dst).mkdir(parents=True, exist_ok=True)
+
+        # Largest files first: a big file found late in the tree
+        # does not become the tail of the whole transfer.
+        files = sorted(
+            (
+                (index, entry)
+                for index, entry in enumerate(plan.entries)
+                if entry.is_file() and not entry.skip
+            ),
+            key=lambda item: item[1].transfer_size,
+            reverse=True,
+        )
+        for index, entry in files:
+            file_progress: _AsyncAbstractFileProgress = progress
+            transfer: _Callback
+            if entry.src.scheme == "file":
+                if journal is not None:
+                    # Steps report the confirmed prefix only without write-behind
+                    file_progress = _JournalProgress(
+                        progress, journal, index, record_offsets=write_window == 1
+                    )
+                transfer = partial(
+                    self._upload_file,
+                    _extract_path(entry.src),
+                    entry.dst,
+                    entry.offset,
+                    progress=file_progress,
+                    write_window=write_window,
+                    chunk_size=chunk_size,
+                )
+            else:
+                if journal is not None:
+                    # Parallel segments complete out of order
+                    file_progress = _JournalProgress(
+                        progress, journal, index, record_offsets=parallel_segments == 1
+                    )
+                transfer = partial(
+                    self._download_file,
+                    entry.src,
+                    entry.dst,
+                    _extract_path(entry.dst),
+                    entry.size,
+                    entry.offset,
+                    progress=file_progress,
+                    parallel_segments=parallel_segments,
+                    segment_size=segment_size,
+                )
+            await node.add_file(entry.transfer_size, transfer)
+
+
+class StorageFile(metaclass=NoPublicConstructor):
+    def __init__(
+        self,
+        storage: Storage,
+        uri: URL,
+        size: int,
+        *,
+        block_size: int,
+        cache_blocks: int,
+    ) -> None:
+        self._storage = storage
+        self._uri = uri
+        self._size = size
+        self._block_size = block_size
+        self._cache_blocks = cache_blocks
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._pos = 0
+        self._last_end = -1
+        self._readahead = 0
+        self._closed = False
+
+    @property
+    def uri(self) -> URL:
+        return self._uri
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        self._closed = True
+        self._cache.clear()
+
+    def tell(self) -> int:
+        self._check_closed()
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        self._check_closed()
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence}, should be 0, 1 or 2)")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    async def read(self, size: int = -1) -> bytes:
+        self._check_closed()
+        start = self._pos
+        if size < 0:
+            end = self._size
+        else:
+            end = min(start + size, self._size)
+        if end <= start:
+            return b""
+        data = await self._read_range(start, end)
+        self._pos = end
+        return data
+
+    async def readinto(self, buffer: Any) -> int:
+        view = memoryview(buffer).cast("B")
+        data = await self.read(len(view))
+        view[: len(data)] = data
+        return len(data)
+
+    def _check_closed(self) -> None:
+        if self._closed:
+            raise ValueError("I/O operation on closed file")
+
+    async def _read_range(self, start: int, end: int) -> bytes:
+        block_size = self._block_size
+        first = start // block_size
+        last = (end - 1) // block_size + 1
+        if start == self._last_end:
+            # Sequential read, fetch more blocks ahead with every request
+            self._readahead = min(max(1, self._readahead * 2), MAX_READAHEAD_BLOCKS)
+        else:
+            self._readahead = 0
+        self._last_end = end
+
+        blocks: Dict[int, bytes] = {}
+        missing = []
+        for block in range(first, last):
+            data = self._cache.get(block)
+            if data is None:
+                missing.append(block)
+            else:
+                self._cache.move_to_end(block)
+                blocks[block] = data
+
+        runs = _merge_blocks(missing)
+        if runs and runs[-1][1] == last:
+            # Extend the last request by the following blocks missed in the cache
+            nblocks = (self._size + block_size - 1) // block_size
+            stop = min(last + self._readahead, nblocks)
+            while runs[-1][1] < stop and runs[-1][1] not in self._cache:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+
+        async def fetch(run_start: int, run_stop: int) -> None:
+            data = await self._fetch(run_start * block_size, run_stop * block_size)
+            for block in range(run_start, run_stop):
+                pos = (block - run_start) * block_size
+                blocks[block] = data[pos : pos + block_size]
+
+        await run_concurrently(
+            fetch(run_start, run_stop) for run_start, run_stop in runs
+        )
+
+        for run_start, run_stop in runs:
+            for block in range(run_start, run_stop):
+                self._cache[block] = blocks[block]
+        while len(self._cache) > self._cache_blocks:
+            self._cache.popitem(last=False)
+
+        ret = bytearray()
+        for block in range(first, last):
+            block_start = block * block_size
+            ret += memoryview(blocks[block])[
+                max(start - block_start, 0) : end - block_start
+            ]
+        return bytes(ret)
+
+    async def _fetch(self, start: int, stop: int) -> bytes:
+        # One ranged request per run of adjacent blocks, resumed on errors
+        stop = min(stop, self._size)
+        return await self._storage._read(self._uri, start, stop)
+
+
+_magic_check = re.compile("(?:[*?[])")
+
+
+def _has_magic(s: str) -> bool:
     return _magic_check.search(s) is not None
 
 
@@ -905,27 +2395,1009 @@ def _parse_content_range(rng_str: Optional[str]) -> slice:
     return slice(start, end + 1)
 
 
-ProgressQueueItem = Optional[Tuple[Callable[[Any], None], Any]]
+def _merge_blocks(blocks: List[int]) -> List[Tuple[int, int]]:
+    # Sorted block numbers to a list of [start, stop) runs of adjacent blocks
+    runs: List[Tuple[int, int]] = []
+    for block in blocks:
+        if runs and runs[-1][1] == block:
+            runs[-1] = (runs[-1][0], block + 1)
+        else:
+            runs.append((block, block + 1))
+    return runs
 
 
-async def run_progress(
-    queue: "asyncio.Queue[QueuedCall]", coro: Awaitable[None]
-) -> None:
-    async def wrapped() -> None:
+def _check_segments(parallel_segments: int, segment_size: int) -> None:
+    if parallel_segments < 1:
+        raise ValueError("parallel_segments should be >= 1")
+    if segment_size <= 0:
+        raise ValueError("segment_size should be > 0")
+
+
+def _check_prefetch(concurrency: int, prefetch_bytes: int) -> None:
+    if concurrency <= 0:
+        raise ValueError("concurrency should be > 0")
+    if prefetch_bytes <= 0:
+        raise ValueError("prefetch_bytes should be > 0")
+
+
+def _check_write_window(write_window: int, chunk_size: Optional[int]) -> None:
+    if write_window < 1:
+        raise ValueError("write_window should be >= 1")
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError("chunk_size should be > 0")
+
+
+class _BufferPool:
+    """Reusable buffers for reading chunks of uploaded files.
+
+    A buffer is returned to the pool when the request sending it is
+    completed, so its content is never referenced by aiohttp afterwards.
+    Up to max_free() buffers are kept, e.g. one per file that can be
+    transferred concurrently with the current limit.
+    """
+
+    def __init__(self, max_free: Callable[[], int]) -> None:
+        self._max_free = max_free
+        self._free: List[bytearray] = []
+
+    @contextmanager
+    def buffer(self, size: int) -> Iterator[bytearray]:
+        for i, buf in enumerate(self._free):
+            if len(buf) == size:
+                del self._free[i]
+                break
+        else:
+            buf = bytearray(size)
         try:
-            await coro
+            yield buf
         finally:
-            # Add special marker to queue to allow loop below to exit
-            await queue.put(cast(QueuedCall, None))
+            if len(self._free) < self._max_free():
+                self._free.append(buf)
+
+
+class _AdaptiveLimiter:
+    """Limit the number of concurrently transferred files with AIMD control.
+
+    Every CONCURRENCY_INTERVAL the limit is increased by one if it was
+    reached during the interval, the total throughput did not drop and
+    the time a transfer spends per byte stays within LATENCY_TOLERANCE of
+    the best one seen, i.e. while more transfers make the whole faster
+    instead of sharing the same bandwidth.  Timeouts, 429, 502, 503 and
+    504 errors of the transfers, reported by congested(), halve the limit.  Waiters
+    are served in FIFO order.
+    """
+
+    def __init__(self, limit: int, *, min_limit: int, max_limit: int) -> None:
+        self._limit = limit
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._in_flight = 0
+        self._waiters: "Deque[asyncio.Future[None]]" = deque()
+        now = time.monotonic()
+        self._window_start = now
+        self._accounted = now
+        self._bytes = 0
+        self._busy = 0.0  # transfer-seconds spent in the window
+        self._saturated = False
+        self._throughput = 0.0
+        self._best_cost: Optional[float] = None
+        self._congestion = 0  # congestion events in the window
+        self.generation = 0  # incremented on every adjustment
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def throughput(self) -> float:
+        return self._throughput
+
+    async def __aenter__(self) -> None:
+        self._update()
+        if self._in_flight < self._limit and not self._waiters:
+            self._acquire()
+            return
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was already handed over
+                self._release()
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise
+
+    async def __aexit__(self, *args: Any) -> None:
+        self._release()
+
+    def record(self, size: int) -> None:
+        self._bytes += size
+        self._update()
+
+    def congested(self) -> None:
+        self._congestion += 1
+
+    def _acquire(self) -> None:
+        self._account()
+        self._in_flight += 1
+        if self._in_flight >= self._limit:
+            self._saturated = True
+
+    def _release(self) -> None:
+        self._account()
+        self._in_flight -= 1
+        self._wake()
+        self._update()
+
+    def _wake(self) -> None:
+        while self._waiters and self._in_flight < self._limit:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self._acquire()
+                fut.set_result(None)
+
+    def _account(self) -> None:
+        now = time.monotonic()
+        self._busy += self._in_flight * (now - self._accounted)
+        self._accounted = now
+
+    def _update(self) -> None:
+        now = time.monotonic()
+        if now - self._window_start >= CONCURRENCY_INTERVAL:
+            self._adjust(now)
+
+    def _adjust(self, now: float) -> None:
+        self._account()
+        throughput = self._bytes / (now - self._window_start)
+        if self._congestion:
+            self._limit = max(self._min_limit, self._limit // 2)
+            self._best_cost = None
+        elif self._saturated and self._bytes:
+            cost = self._busy / self._bytes
+            if self._best_cost is None:
+                self._best_cost = cost
+            else:
+                # Let the best cost age, it depends on sizes of files too
+                self._best_cost = min(cost, self._best_cost * (1 + LATENCY_TOLERANCE))
+            if throughput >= self._throughput and cost <= self._best_cost * (
+                1 + LATENCY_TOLERANCE
+            ):
+                self._limit = min(self._max_limit, self._limit + 1)
+        self._congestion = 0
+        self._throughput = throughput
+        self._window_start = now
+        self._bytes = 0
+        self._busy = 0.0
+        self._saturated = self._in_flight >= self._limit
+        self.generation += 1
+        self._wake()
+
+
+async def _read_chunk(
+    stream: BufferedReader,
+    buf: bytearray,
+    size: Optional[int] = None,
+    hasher: Optional["_BlockHasher"] = None,
+) -> memoryview:
+    # Read into the preallocated buffer instead of allocating a new bytes object
+    loop = asyncio.get_event_loop()
+    view = memoryview(buf)
+    if size is not None:
+        view = view[:size]
+
+    def read() -> int:
+        n = stream.readinto(view)
+        if hasher is not None:
+            hasher.update(view[:n])
+        return n
+
+    n = await loop.run_in_executor(None, read)
+    return view[:n]
+
+
+class _PositionalWriter:
+    """Write data at arbitrary offsets of an open file.
+
+    Safe to call from several executor threads at once.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self._stream = stream
+        self._fd = stream.fileno()
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes, offset: int) -> None:
+        if hasattr(os, "pwrite"):
+            buf = memoryview(data)
+            while buf:
+                written = os.pwrite(self._fd, buf, offset)
+                buf = buf[written:]
+                offset += written
+        else:  # pragma: no cover
+            # No pwrite() on Windows
+            with self._lock:
+                self._stream.seek(offset)
+                self._stream.write(data)
+
+
+class _CoalescingWriter:
+    """Collect small network chunks into large buffers written at once.
+
+    Buffer boundaries are aligned to the buffer size from the start of the
+    file.  A full buffer is written by _PositionalWriter in an executor
+    thread while the next one is being filled, and on_flush is called with
+    the number of bytes written once the write is completed.  Buffers are
+    allocated on demand and do not exceed the data expected up to stop.
+    """
+
+    def __init__(
+        self,
+        writer: _PositionalWriter,
+        offset: int,
+        *,
+        on_flush: Callable[[int], Awaitable[None]],
+        stop: Optional[int] = None,
+        buffer_size: Optional[int] = None,
+    ) -> None:
+        if buffer_size is None:
+            buffer_size = WRITE_BUFFER_SIZE
+        self._writer = writer
+        self._on_flush = on_flush
+        self._stop = stop
+        self._buffer_size = buffer_size
+        self._buf = bytearray()  # allocated on the first write
+        self._spare: Optional[bytearray] = None
+        self._writing: Optional[bytearray] = None
+        self._start = offset
+        self._len = 0
+        self._limit = buffer_size - offset % buffer_size
+        self._pending: Optional["asyncio.Future[None]"] = None
+        self._pending_size = 0
+
+    @property
+    def pos(self) -> int:
+        # The end of accepted data, including not yet written one
+        return self._start + self._len
+
+    async def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            if not self._buf:
+                self._buf = self._take_buffer()
+            n = min(len(view), len(self._buf) - self._len)
+            self._buf[self._len : self._len + n] = view[:n]
+            self._len += n
+            view = view[n:]
+            if self._len == len(self._buf):
+                await self._flush_buffer()
+
+    async def flush(self) -> None:
+        if self._len:
+            await self._flush_buffer()
+        await self._wait_pending()
+
+    def _take_buffer(self) -> bytearray:
+        size = self._limit
+        if self._stop is not None and self._stop > self._start:
+            size = min(size, self._stop - self._start)
+        spare, self._spare = self._spare, None
+        if spare is not None and len(spare) == size:
+            return spare
+        return bytearray(size)
+
+    async def _flush_buffer(self) -> None:
+        await self._wait_pending()
+        # The buffer of the completed write can be reused
+        self._spare = self._writing
+        loop = asyncio.get_event_loop()
+        data = memoryview(self._buf)[: self._len]
+        self._pending = loop.run_in_executor(
+            None, self._writer.write, data, self._start
+        )
+        self._pending_size = self._len
+        self._writing = self._buf
+        self._buf = bytearray()
+        self._start += self._len
+        self._len = 0
+        self._limit = self._buffer_size
+
+    async def _wait_pending(self) -> None:
+        if self._pending is not None:
+            pending = self._pending
+            self._pending = None
+            await pending
+            await self._on_flush(self._pending_size)
+
+
+async def _download_segments(
+    path: Path,
+    size: int,
+    offset: int,
+    fetch: Callable[[int, int], AsyncIterator[bytes]],
+    *,
+    msg: str,
+    on_congestion: Callable[[], None],
+    on_flush: Callable[[int], Awaitable[None]],
+    parallel_segments: int,
+    segment_size: int,
+) -> None:
+    """Download the bytes from offset to size of a file as concurrent ranges.
+
+    fetch(start, stop) yields the content of a range.  The ranges are written
+    in place in any order into a ".part" file next to path, which replaces
+    path when the download is done.  On failure the file is cut to the
+    contiguous prefix written so far before it replaces path, so it can be
+    continued.  If the process is killed, path is left as it was or missing,
+    never of the full size with holes.
+    """
+    tmp_path = path.with_name(path.name + ".part")
+    if offset:
+        # Continue the prefix written before
+        os.replace(path, tmp_path)
+    try:
+        stream = tmp_path.open("rb+" if offset else "wb")
+    except OSError:
+        if offset:
+            os.replace(tmp_path, path)
+        raise
+    try:
+        with stream:
+            writer = _PositionalWriter(stream)
+            segments = iter(range(offset, size, segment_size))
+            ends: Dict[int, int] = {}  # segment start -> end of written data
+
+            async def download_segment(start: int, stop: int) -> None:
+                ends[start] = start
+
+                async def step(n: int) -> None:
+                    ends[start] += n
+                    await on_flush(n)
+
+                segment = _CoalescingWriter(writer, start, on_flush=step, stop=stop)
+                try:
+                    for retry in retries(msg, on_congestion=on_congestion):
+                        pos = segment.pos
+                        if pos >= stop:
+                            break
+                        async with retry:
+                            async for chunk in fetch(pos, stop):
+                                await segment.write(chunk)
+                                if chunk:
+                                    retry.reset()
+                finally:
+                    await segment.flush()
+
+            async def worker() -> None:
+                for start in segments:
+                    await download_segment(start, min(start + segment_size, size))
+
+            try:
+                await run_concurrently(worker() for _ in range(parallel_segments))
+            except BaseException:
+                pos = offset
+                while pos in ends:
+                    end = ends[pos]
+                    complete = end == min(pos + segment_size, size)
+                    pos = end
+                    if not complete:
+                        break
+                stream.truncate(pos)
+                raise
+    finally:
+        os.replace(tmp_path, path)
+
+
+@dataclass(frozen=True)
+class _ManifestEntry:
+    size: int
+    mtime: int  # local st_mtime_ns
+    remote_mtime: Optional[int]
+
+
+class _SyncManifest:
+    """Local state of Storage.sync() kept in a SQLite database.
+
+    Records the files transferred by the last syncs of the same pair of
+    directories, keyed by the directory relative path and the file name.
+    The manifest is loaded into memory once, changes are written in
+    batches of COMMIT_INTERVAL, so the event loop is not blocked by a query
+    per file or directory.
+    """
+
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, path: Path, src: URL, dst: URL) -> None:
+        self._path = path
+        self._key = f"{src} {dst}"
+        self._dirs: Set[str] = set()
+        self._files: Dict[str, Dict[str, _ManifestEntry]] = {}
+        # Uncommitted changes, None for removed files
+        self._new_dirs: List[str] = []
+        self._changes: Dict[Tuple[str, str], Optional[_ManifestEntry]] = {}
+
+    def __enter__(self) -> "_SyncManifest":
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self._path))
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT);
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS files (
+                dir TEXT,
+                name TEXT,
+                size INTEGER,
+                mtime INTEGER,
+                remote_mtime INTEGER,
+                PRIMARY KEY (dir, name));
+            """
+        )
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'pair'").fetchone()
+        if row is None or row["value"] != self._key:
+            # The manifest was used for other directories, start from scratch
+            with self._db:
+                self._db.execute("DELETE FROM dirs")
+                self._db.execute("DELETE FROM files")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('pair', ?)",
+                    (self._key,),
+                )
+        else:
+            self._dirs = {
+                row["path"] for row in self._db.execute("SELECT path FROM dirs")
+            }
+            cur = self._db.execute(
+                "SELECT dir, name, size, mtime, remote_mtime FROM files"
+            )
+            for row in cur:
+                self._files.setdefault(row["dir"], {})[row["name"]] = _ManifestEntry(
+                    row["size"], row["mtime"], row["remote_mtime"]
+                )
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        # Keep the progress of a failed sync too
+        self._commit()
+        self._db.close()
+
+    def has_dir(self, path: str) -> bool:
+        return path in self._dirs
+
+    def add_dir(self, path: str) -> None:
+        self._dirs.add(path)
+        self._new_dirs.append(path)
+        self._changed()
+
+    def files(self, dir_path: str) -> Dict[str, _ManifestEntry]:
+        return dict(self._files.get(dir_path, {}))
+
+    def record(
+        self,
+        dir_path: str,
+        name: str,
+        *,
+        size: int,
+        mtime: int,
+        remote_mtime: Optional[int],
+    ) -> None:
+        entry = _ManifestEntry(size, mtime, remote_mtime)
+        self._files.setdefault(dir_path, {})[name] = entry
+        self._changes[(dir_path, name)] = entry
+        self._changed()
+
+    def forget(self, dir_path: str, names: Iterable[str]) -> None:
+        files = self._files.get(dir_path, {})
+        for name in names:
+            files.pop(name, None)
+            self._changes[(dir_path, name)] = None
+            self._changed()
+
+    def _changed(self) -> None:
+        if len(self._new_dirs) + len(self._changes) >= self.COMMIT_INTERVAL:
+            self._commit()
+
+    def _commit(self) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO dirs (path) VALUES (?)",
+                [(path,) for path in self._new_dirs],
+            )
+            self._db.executemany(
+                """
+                INSERT OR REPLACE INTO files (dir, name, size, mtime, remote_mtime)
+                VALUES (?, ?, ?, ?, ?)""",
+                [
+                    (dir_path, name, entry.size, entry.mtime, entry.remote_mtime)
+                    for (dir_path, name), entry in self._changes.items()
+                    if entry is not None
+                ],
+            )
+            self._db.executemany(
+                "DELETE FROM files WHERE dir = ? AND name = ?",
+                [key for key, entry in self._changes.items() if entry is None],
+            )
+        self._new_dirs = []
+        self._changes = {}
+
+
+class _TransferJournal:
+    """Progress of Storage.upload_dir() or download_dir() kept in a SQLite database.
+
+    Stores the transfer plan together with the completed files and
+    the offsets of partially transferred ones, so an interrupted
+    transfer of the same pair of directories with the same options
+    continues without listing them again.  The progress is kept in memory
+    and written at most every COMMIT_PERIOD.
+    """
+
+    COMMIT_PERIOD = 1.0  # seconds
+
+    def __init__(self, path: Path, src: URL, dst: URL, **options: Any) -> None:
+        self._path = path
+        self._key = f"{src} {dst} {json.dumps(options, sort_keys=True)}"
+        self._committed = time.monotonic()
+        self._offsets: Dict[int, int] = {}
+        self._done: List[int] = []
+
+    def __enter__(self) -> "_TransferJournal":
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self._path))
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT);
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                entry TEXT,
+                offset INTEGER,
+                done INTEGER);
+            """
+        )
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'pair'").fetchone()
+        if row is None or row["value"] != self._key:
+            # The journal was used for other directories, start from scratch
+            with self._db:
+                self._db.execute("DELETE FROM meta")
+                self._db.execute("DELETE FROM entries")
+                self._db.execute(
+                    "INSERT INTO meta (key, value) VALUES ('pair', ?)", (self._key,)
+                )
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        # Keep the progress of a failed transfer too
+        self._commit()
+        self._db.close()
+
+    def load_plan(self) -> Optional[TransferPlan]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'plan'").fetchone()
+        if row is None:
+            return None
+        entries = []
+        for row in self._db.execute(
+            "SELECT entry, offset, done FROM entries ORDER BY id"
+        ):
+            entry = TransferPlanEntry._from_json(json.loads(row["entry"]))
+            if row["done"]:
+                entry = replace(entry, skip=True)
+            elif row["offset"] > entry.offset:
+                entry = replace(entry, offset=row["offset"])
+            entries.append(entry)
+        return TransferPlan(entries)
+
+    def save_plan(self, plan: TransferPlan) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO entries (id, entry, offset, done) VALUES (?, ?, ?, ?)",
+                [
+                    (index, json.dumps(entry._to_json()), entry.offset, entry.skip)
+                    for index, entry in enumerate(plan.entries)
+                ],
+            )
+            self._db.execute("INSERT INTO meta (key, value) VALUES ('plan', '')")
+
+    @property
+    def dirs_created(self) -> bool:
+        cur = self._db.execute("SELECT 1 FROM meta WHERE key = 'dirs'")
+        return cur.fetchone() is not None
+
+    def set_dirs_created(self) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('dirs', '')"
+            )
+
+    def record_offset(self, index: int, offset: int) -> None:
+        self._offsets[index] = offset
+        self._changed()
+
+    def record_done(self, index: int) -> None:
+        self._offsets.pop(index, None)
+        self._done.append(index)
+        self._changed()
+
+    def _changed(self) -> None:
+        now = time.monotonic()
+        if now - self._committed >= self.COMMIT_PERIOD:
+            self._commit()
+            self._committed = now
+
+    def _commit(self) -> None:
+        with self._db:
+            self._db.executemany(
+                "UPDATE entries SET offset = ? WHERE id = ?",
+                [(offset, index) for index, offset in self._offsets.items()],
+            )
+            self._db.executemany(
+                "UPDATE entries SET done = 1 WHERE id = ?",
+                [(index,) for index in self._done],
+            )
+        self._offsets.clear()
+        self._done.clear()
+
+
+class _JournalProgress(_AsyncAbstractFileProgress):
+    def __init__(
+        self,
+        progress: _AsyncAbstractFileProgress,
+        journal: _TransferJournal,
+        index: int,
+        *,
+        record_offsets: bool,
+    ) -> None:
+        self._progress = progress
+        self._journal = journal
+        self._index = index
+        self._record_offsets = record_offsets
+
+    async def start(self, data: StorageProgressStart) -> None:
+        await self._progress.start(data)
+
+    async def step(self, src: URL, dst: URL, current: int, size: int) -> None:
+        if self._record_offsets:
+            self._journal.record_offset(self._index, current)
+        await self._progress.step(src, dst, current, size)
+
+    async def complete(self, data: StorageProgressComplete) -> None:
+        self._journal.record_done(self._index)
+        await self._progress.complete(data)
+
+
+@dataclass(frozen=True)
+class _LocalEntry:
+    name: str
+    is_dir: bool
+    is_file: bool
+    stat: Optional[os.stat_result]  # for regular files only
+
+
+def _scan_dir(path: Path) -> List[_LocalEntry]:
+    # The file type is cached by DirEntry from readdir(), so directories
+    # cost no syscalls and regular files a single stat() for size and mtime.
+    # Symlinks are followed like Path.is_dir()/is_file() do.
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            is_dir = entry.is_dir()
+            is_file = not is_dir and entry.is_file()
+            entries.append(
+                _LocalEntry(
+                    entry.name, is_dir, is_file, entry.stat() if is_file else None
+                )
+            )
+    return entries
+
 
+async def _scan_dir_async(path: Path) -> List[_LocalEntry]:
     loop = asyncio.get_event_loop()
-    task = loop.create_task(wrapped())
-    while True:
-        item = await queue.get()
-        if item is None:
-            break
-        item()
-    await task
+    return await loop.run_in_executor(None, _scan_dir, path)
+
+
+def _plan_file_entry(
+    src: URL, dst: URL, size: int, offset: Optional[int]
+) -> TransferPlanEntry:
+    if offset is None:
+        return TransferPlanEntry(src, dst, FileStatusType.FILE, size, skip=True)
+    return TransferPlanEntry(src, dst, FileStatusType.FILE, size, offset)
+
+
+def _is_regular_file(path: Path) -> bool:
+    try:
+        return S_ISREG(path.stat().st_mode)
+    except OSError:
+        return False
+
+
+_BLOCK_HASH_SIZE = hashlib.sha256().digest_size
+
+
+class _BlockHasher:
+    """Concatenated SHA-256 digests of consecutive blocks of a file.
+
+    Fed with the content of the file read sequentially from the start.
+    """
+
+    def __init__(self, block_size: int) -> None:
+        self._block_size = block_size
+        self._digests: List[bytes] = []
+        self._hash = hashlib.sha256()
+        self._remaining = block_size
+
+    def update(self, data: memoryview) -> None:
+        while data:
+            n = min(len(data), self._remaining)
+            self._hash.update(data[:n])
+            data = data[n:]
+            self._remaining -= n
+            if not self._remaining:
+                self._digests.append(self._hash.digest())
+                self._hash = hashlib.sha256()
+                self._remaining = self._block_size
+
+    def digest(self) -> bytes:
+        digests = self._digests
+        if self._remaining < self._block_size:
+            digests = digests + [self._hash.digest()]
+        return b"".join(digests)
+
+
+def _hash_blocks(path: Path, block_size: int) -> bytes:
+    hasher = _BlockHasher(block_size)
+    buf = memoryview(bytearray(READ_SIZE))
+    with path.open("rb") as stream:
+        while True:
+            n = stream.readinto(buf)
+            if not n:
+                break
+            hasher.update(buf[:n])
+    return hasher.digest()
+
+
+def _changed_blocks(old_hashes: bytes, new_hashes: bytes) -> List[int]:
+    ret = []
+    for block, pos in enumerate(range(0, len(new_hashes), _BLOCK_HASH_SIZE)):
+        stop = pos + _BLOCK_HASH_SIZE
+        if old_hashes[pos:stop] != new_hashes[pos:stop]:
+            ret.append(block)
+    return ret
+
+
+@dataclass(frozen=True)
+class _BlockHashes:
+    block_size: int
+    size: int
+    remote_mtime: int
+    hashes: bytes
+
+
+class _BlockHashStore:
+    """Block hashes of files uploaded by Storage.upload_file() in delta mode.
+
+    Kept in a SQLite database, keyed by the storage URI of the uploaded file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    def __enter__(self) -> "_BlockHashStore":
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self._path))
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blocks (
+                uri TEXT PRIMARY KEY,
+                block_size INTEGER,
+                size INTEGER,
+                remote_mtime INTEGER,
+                hashes BLOB)"""
+        )
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def get(self, uri: str) -> Optional[_BlockHashes]:
+        cur = self._db.execute(
+            "SELECT block_size, size, remote_mtime, hashes FROM blocks WHERE uri = ?",
+            (uri,),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return _BlockHashes(
+            row["block_size"], row["size"], row["remote_mtime"], row["hashes"]
+        )
+
+    def put(self, uri: str, record: _BlockHashes) -> None:
+        self._db.execute(
+            """
+            INSERT OR REPLACE INTO blocks (uri, block_size, size, remote_mtime, hashes)
+            VALUES (?, ?, ?, ?, ?)""",
+            (uri, record.block_size, record.size, record.remote_mtime, record.hashes),
+        )
+
+    def forget(self, uri: str) -> None:
+        self._db.execute("DELETE FROM blocks WHERE uri = ?", (uri,))
+
+
+ProgressQueueItem = Optional[Tuple[Callable[[Any], None], Any]]
+
+
+def _ignore(data: Any) -> None:
+    pass
+
+
+# Wakes up _ProgressPipeline.run() to schedule delivery of step events
+_WAKEUP: ProgressQueueItem = (_ignore, None)
+
+
+class _ProgressPipeline(
+    _AsyncAbstractRecursiveFileProgress, _AsyncAbstractDeleteProgress
+):
+    """Deliver progress events of transfer tasks to a synchronous progress.
+
+    Events are passed through a bounded queue and run() handles all queued
+    events at once.  Step events are not queued: only the latest step of
+    every file is kept, and pending steps are delivered at most max_rate
+    times per second or right before completion of the file.  Nothing is
+    constructed if progress is None.
+    """
+
+    def __init__(
+        self,
+        progress: Any,
+        *,
+        max_rate: Optional[float] = None,
+        maxsize: Optional[int] = None,
+        limiter: Optional[_AdaptiveLimiter] = None,
+    ) -> None:
+        if max_rate is None:
+            max_rate = PROGRESS_MAX_RATE
+        if maxsize is None:
+            maxsize = PROGRESS_QUEUE_SIZE
+        self._progress = progress
+        self._interval = 1 / max_rate
+        self._queue: "asyncio.Queue[ProgressQueueItem]" = asyncio.Queue(maxsize)
+        self._steps: Dict[Tuple[URL, URL], Tuple[int, int]] = {}
+        # Transferred bytes are fed to the limiter even without progress
+        self._limiter = limiter
+        self._positions: Dict[Tuple[URL, URL], int] = {}
+        self._generation = limiter.generation if limiter is not None else 0
+
+    async def run(self, coro: Awaitable[None]) -> None:
+        if self._progress is None:
+            await coro
+            return
+
+        async def wrapped() -> None:
+            try:
+                await coro
+            finally:
+                # Add special marker to queue to allow loop below to exit
+                await self._queue.put(None)
+
+        loop = asyncio.get_event_loop()
+        task = loop.create_task(wrapped())
+        try:
+            await self._handle_events()
+        except:  # noqa: E722
+            task.cancel()
+            await asyncio.wait([task])
+            raise
+        await task
+
+    async def _handle_events(self) -> None:
+        loop = asyncio.get_event_loop()
+        next_steps = loop.time()
+        done = False
+        while not done:
+            item: ProgressQueueItem
+            if self._steps:
+                timeout = max(next_steps - loop.time(), 0)
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = _WAKEUP
+            else:
+                item = await self._queue.get()
+            batch = [item]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for item in batch:
+                if item is None:
+                    done = True
+                else:
+                    method, data = item
+                    method(data)
+            now = loop.time()
+            if self._steps and (done or now >= next_steps):
+                steps = self._steps
+                self._steps = {}
+                for (src, dst), (current, size) in steps.items():
+                    self._progress.step(StorageProgressStep(src, dst, current, size))
+                next_steps = now + self._interval
+            limiter = self._limiter
+            if limiter is not None and limiter.generation != self._generation:
+                self._generation = limiter.generation
+                self._progress.concurrency(
+                    StorageProgressConcurrency(
+                        limiter.limit, limiter.in_flight, limiter.throughput
+                    )
+                )
+
+    async def _put(self, method: Callable[[Any], None], data: Any) -> None:
+        await self._queue.put((method, data))
+
+    async def start(self, data: StorageProgressStart) -> None:
+        if self._limiter is not None:
+            self._positions[(data.src, data.dst)] = 0
+        if self._progress is not None:
+            await self._put(self._progress.start, data)
+
+    async def step(self, src: URL, dst: URL, current: int, size: int) -> None:
+        if self._limiter is not None:
+            pos = self._positions.get((src, dst), 0)
+            if current > pos:
+                self._limiter.record(current - pos)
+                self._positions[(src, dst)] = current
+        if self._progress is None:
+            return
+        if not self._steps:
+            try:
+                self._queue.put_nowait(_WAKEUP)
+            except asyncio.QueueFull:
+                pass  # run() is awake anyway
+        self._steps[(src, dst)] = (current, size)
+
+    async def complete(self, data: StorageProgressComplete) -> None:
+        if self._limiter is not None:
+            pos = self._positions.pop((data.src, data.dst), 0)
+            if data.size > pos:
+                self._limiter.record(data.size - pos)
+        if self._progress is not None:
+            # Deliver the last step of the file before its completion
+            step = self._steps.pop((data.src, data.dst), None)
+            if step is not None:
+                current, size = step
+                await self._put(
+                    self._progress.step,
+                    StorageProgressStep(data.src, data.dst, current, size),
+                )
+            await self._put(self._progress.complete, data)
+
+    async def enter(self, data: StorageProgressEnterDir) -> None:
+        if self._progress is not None:
+            await self._put(self._progress.enter, data)
+
+    async def leave(self, data: StorageProgressLeaveDir) -> None:
+        if self._progress is not None:
+            await self._put(self._progress.leave, data)
+
+    async def fail(self, data: StorageProgressFail) -> None:
+        if self._limiter is not None:
+            self._positions.pop((data.src, data.dst), None)
+        if self._progress is not None:
+            # A buffered step of the file is not delivered after its failure
+            self._steps.pop((data.src, data.dst), None)
+            await self._put(self._progress.fail, data)
+
+    async def delete(self, data: StorageProgressDelete) -> None:
+        if self._progress is not None:
+            await self._put(self._progress.delete, data)
 
 
 async def run_concurrently(coros: Iterable[Awaitable[Any]]) -> None:
@@ -946,5 +3418,247 @@ async def run_concurrently(coros: Iterable[Awaitable[Any]]) -> None:
         raise  # pragma: no cover
 
 
+_T = TypeVar("_T")
+
+
+async def _iter_prefetched(
+    items: AsyncIterator[Tuple[_T, int]],
+    fetch: Callable[[_T, int], Awaitable[bytes]],
+    *,
+    concurrency: int,
+    prefetch_bytes: int,
+) -> AsyncIterator[Tuple[_T, bytes]]:
+    """Yield (item, content) pairs in the order of items.
+
+    Up to concurrency items are fetched ahead of the consumer as long as
+    their total size fits into prefetch_bytes.  An item larger than the
+    budget is fetched alone.
+    """
+    pending: "Deque[Tuple[_T, int, asyncio.Future[bytes]]]" = deque()
+    pending_bytes = 0
+    next_item: Optional[Tuple[_T, int]] = None
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                if next_item is None:
+                    try:
+                        next_item = await items.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                item, size = next_item
+                if pending and pending_bytes + size > prefetch_bytes:
+                    break
+                next_item = None
+                pending.append((item, size, asyncio.ensure_future(fetch(item, size))))
+                pending_bytes += size
+            if not pending:
+                return
+            item, size, task = pending.popleft()
+            data = await task
+            pending_bytes -= size
+            yield item, data
+    finally:
+        tasks = [task for _, _, task in pending]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+async def _iter_buffered(
+    chunks: AsyncIterator[bytes], max_bytes: int
+) -> AsyncIterator[bytes]:
+    """Read chunks ahead of the consumer in a background task.
+
+    Up to max_bytes are buffered, a chunk larger than the budget is buffered
+    alone.  An error of the reader is raised after the buffered chunks are
+    consumed.
+    """
+    buffer: Deque[bytes] = deque()
+    buffered = 0
+    exhausted = False
+    cond = asyncio.Condition()
+
+    async def read() -> None:
+        nonlocal buffered, exhausted
+        try:
+            async for chunk in chunks:
+                async with cond:
+                    await cond.wait_for(
+                        lambda: not buffer or buffered + len(chunk) <= max_bytes
+                    )
+                    buffer.append(chunk)
+                    buffered += len(chunk)
+                    cond.notify_all()
+        finally:
+            async with cond:
+                exhausted = True
+                cond.notify_all()
+
+    task = asyncio.ensure_future(read())
+    try:
+        while True:
+            async with cond:
+                await cond.wait_for(lambda: bool(buffer) or exhausted)
+                if not buffer:
+                    break
+                chunk = buffer.popleft()
+                buffered -= len(chunk)
+                cond.notify_all()
+            yield chunk
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+        elif not task.cancelled():
+            task.exception()  # mark as retrieved
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
 async def _always(path: str) -> bool:
     return True
+
+
+_Callback = Callable[[], Awaitable[None]]
+
+
+class _TransferDir:
+    """A directory of a recursive transfer scheduled by _TransferScheduler.
+
+    The directory is done when it is listed and all files and subdirectories
+    added to it are done.
+    """
+
+    def __init__(
+        self, scheduler: "_TransferScheduler", parent: Optional["_TransferDir"]
+    ) -> None:
+        self._scheduler = scheduler
+        self._parent = parent
+        self._pending = 1  # the listing itself
+        self._callbacks: List[_Callback] = []
+
+    def on_done(self, callback: _Callback) -> None:
+        self._callbacks.append(callback)
+
+    async def add_dir(self, list_dir: "_ListDir") -> None:
+        self._pending += 1
+        await self._scheduler._dirs.put((_TransferDir(self._scheduler, self), list_dir))
+
+    async def add_file(self, size: int, transfer: _Callback) -> None:
+        self._pending += 1
+        await self._scheduler._files.put((self, size, transfer))
+
+    def add_listed_dir(self) -> "_TransferDir":
+        """Add a subdirectory listed by the caller instead of a list worker.
+
+        The caller adds files and subdirectories to the returned directory
+        and calls its listed() method when it is done with it.
+        """
+        self._pending += 1
+        return _TransferDir(self._scheduler, self)
+
+    async def listed(self) -> None:
+        await self._release()
+
+    async def _release(self) -> None:
+        self._pending -= 1
+        if self._pending:
+            return
+        for callback in self._callbacks:
+            await callback()
+        if self._parent is not None:
+            await self._parent._release()
+        else:
+            self._scheduler._finish()
+
+
+_ListDir = Callable[[_TransferDir], Awaitable[None]]
+
+
+class _TransferScheduler:
+    """Run a recursive transfer with bounded concurrency.
+
+    Directories are listed lazily by *max_listings* workers, files are
+    transferred by *max_files* workers.  The queue of files waiting for
+    transfer is bounded, so listing pauses when transfers cannot keep up.
+    *max_bytes* limits the total size of files transferred at once, a file
+    larger than the limit is transferred alone.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_files: int,
+        max_listings: int,
+        max_bytes: Optional[int],
+    ) -> None:
+        self._max_files = max_files
+        self._max_listings = max_listings
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._bytes_cond = asyncio.Condition()
+        self._dirs: "asyncio.Queue[Optional[Tuple[_TransferDir, _ListDir]]]" = (
+            asyncio.Queue()
+        )
+        self._files: "asyncio.Queue[Optional[Tuple[_TransferDir, int, _Callback]]]" = (
+            asyncio.Queue(max_files)
+        )
+
+    async def run(self, list_dir: _ListDir) -> None:
+        await self._dirs.put((_TransferDir(self, None), list_dir))
+        await run_concurrently(
+            itertools.chain(
+                (self._list_worker() for _ in range(self._max_listings)),
+                (self._file_worker() for _ in range(self._max_files)),
+            )
+        )
+
+    def _finish(self) -> None:
+        # All work is done, both queues are empty: stop the workers
+        for _ in range(self._max_listings):
+            self._dirs.put_nowait(None)
+        for _ in range(self._max_files):
+            self._files.put_nowait(None)
+
+    async def _list_worker(self) -> None:
+        while True:
+            item = await self._dirs.get()
+            if item is None:
+                return
+            node, list_dir = item
+            await list_dir(node)
+            await node._release()
+
+    async def _file_worker(self) -> None:
+        while True:
+            item = await self._files.get()
+            if item is None:
+                return
+            node, size, transfer = item
+            size = await self._acquire_bytes(size)
+            try:
+                await transfer()
+            finally:
+                await self._release_bytes(size)
+            await node._release()
+
+    async def _acquire_bytes(self, size: int) -> int:
+        max_bytes = self._max_bytes
+        if max_bytes is None:
+            return 0
+        size = min(size, max_bytes)
+        async with self._bytes_cond:
+            await self._bytes_cond.wait_for(lambda: self._bytes + size <= max_bytes)
+            self._bytes += size
+        return size
+
+    async def _release_bytes(self, size: int) -> None:
+        if size:
+            async with self._bytes_cond:
+                self._bytes -= size
+                self._bytes_cond.notify_all()
@@ -1,7 +1,9 @@
 import asyncio
 import logging
+import random
 import sys
-from functools import partial
+import time
+from dataclasses import dataclass
 from pathlib import Path
 from types import TracebackType
 from typing import (
@@ -20,7 +22,7 @@ from typing import (
 
 import aiohttp
 
-from .errors import ConfigError
+from .errors import ConfigError, ServerNotAvailable
 
 _T = TypeVar("_T")
 
@@ -83,23 +85,114 @@ class _ContextManager(Generic[_T], Awaitable[_T], AsyncContextManager[_T]):
 log = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 10
+    # Sleeps are drawn uniformly from [0, min(max_delay, base_delay * 2 ** n)]
+    # for the n-th retry ("full jitter"), so concurrent failed calls do not
+    # retry in lockstep.
+    base_delay: float = 0.1
+    max_delay: float = 10.0
+    # Upper bound for the delay requested by the Retry-After header
+    max_retry_after: float = 60.0
+    retry_on: Tuple[Type[BaseException], ...] = (
+        aiohttp.ClientError,
+        ServerNotAvailable,
+    )
+
+    def delay(self, retry: int, error: BaseException) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class RetryBudget:
+    """Token bucket limiting the retries of all calls that share it.
+
+    Every retry takes a token.  Tokens are refilled at *per_second* rate
+    and by *ratio* for every successful call, up to *capacity*, so the
+    retries of a failing server are not multiplied by the number of
+    concurrent calls.  Without a token the call is still retried, but
+    only after the longest delay of the policy.
+    """
+
+    def __init__(
+        self, capacity: float = 100.0, per_second: float = 10.0, ratio: float = 0.1
+    ) -> None:
+        self._capacity = capacity
+        self._per_second = per_second
+        self._ratio = ratio
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def withdraw(self) -> bool:
+        self._refill(0)
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def deposit(self) -> None:
+        self._refill(self._ratio)
+
+    def _refill(self, tokens: float) -> None:
+        now = time.monotonic()
+        tokens += (now - self._updated) * self._per_second
+        self._tokens = min(self._capacity, self._tokens + tokens)
+        self._updated = now
+
+
+@dataclass
+class RetryStats:
+    attempts: int = 0
+    retries: int = 0
+    sleeps: int = 0
+    sleep_time: float = 0.0
+    budget_exhausted: int = 0
+    # Timeouts, 429, 502, 503 and 504 errors
+    congestion: int = 0
+
+
+# Process-wide settings and counters used by all retries() loops,
+# read at call time so they can be replaced
+RETRY_POLICY = RetryPolicy()
+RETRY_BUDGET = RetryBudget()
+RETRY_STATS = RetryStats()
+
+# Signs of an overloaded server, retried by the default retry_on (read
+# timeouts as aiohttp.ServerTimeoutError).  Other 5xx errors (ServerError)
+# are neither retried nor counted: they report a failure of the call
+# itself, which may be not idempotent, and not the load of the server.
+_CONGESTION_ERRORS = (ServerNotAvailable, asyncio.TimeoutError)
+
+
 class retries:
     def __init__(
-        self, msg: str, attempts: int = 10, logger: Callable[[str], None] = log.info
+        self,
+        msg: str,
+        attempts: Optional[int] = None,
+        logger: Callable[[str], None] = log.info,
+        *,
+        policy: Optional[RetryPolicy] = None,
+        on_congestion: Optional[Callable[[], None]] = None,
     ) -> None:
         self._msg = msg
-        self._attempts = attempts
+        self._policy = policy if policy is not None else RETRY_POLICY
+        self._attempts = attempts if attempts is not None else self._policy.attempts
+        self._budget = RETRY_BUDGET
+        self._stats = RETRY_STATS
         self._logger = logger
+        self._on_congestion = on_congestion
         self.reset()
 
     def reset(self) -> None:
         self._attempt = 0
-        self._sleeptime = 0.0
 
     def __iter__(self) -> Iterator["retries"]:
         while self._attempt < self._attempts:
-            self._sleeptime += 0.1
             self._attempt += 1
+            self._stats.attempts += 1
             yield self
 
     async def __aenter__(self) -> None:
@@ -111,9 +204,29 @@ class retries:
         if type is None:
             # Stop iteration
             self._attempt = self._attempts
-        elif issubclass(type, aiohttp.ClientError) and self._attempt < self._attempts:
-            self._logger(f"{self._msg}: {value}.  Retry...")
-            await asyncio.sleep(self._sleeptime)
+            self._budget.deposit()
+            return False
+        if issubclass(type, _CONGESTION_ERRORS):
+            self._stats.congestion += 1
+            if self._on_congestion is not None:
+                self._on_congestion()
+        if issubclass(type, self._policy.retry_on) and self._attempt < self._attempts:
+            delay = self._policy.delay(self._attempt - 1, value)
+            if self._budget.withdraw():
+                self._logger(f"{self._msg}: {value}.  Retry...")
+            else:
+                # Slow down instead of failing a long running transfer
+                self._stats.budget_exhausted += 1
+                self._logger(
+                    f"{self._msg}: {value}.  Retry budget is exhausted, "
+                    f"retry slowly..."
+                )
+                delay = max(delay, self._policy.max_delay)
+            self._stats.retries += 1
+            if delay > 0:
+                self._stats.sleeps += 1
+                self._stats.sleep_time += delay
+                await asyncio.sleep(delay)
             return True
         return False
 
@@ -132,60 +245,3 @@ def find_project_root(path: Optional[Path] = None) -> Path:
             return here
         here = here.parent
     raise ConfigError(f"Project root is not found for {path}")
-
-
-QueuedCall = Callable[[], Any]
-
-
-async def _noop(*args: Any, **kwargs: Any) -> None:
-    pass
-
-
-class _NoopProxy:
-    def __getattr__(self, name: str) -> Callable[[Any], Coroutine[Any, Any, None]]:
-        return _noop
-
-
-def queue_calls(
-    any_obj: Any,
-    allow_any_for_none: bool = True,
-) -> Tuple["asyncio.Queue[QueuedCall]", Any]:  # Sadly, but there is now way to annotate
-    """Add calls to asyncio.Queue instead executing them directly
-
-    Wraps given object into proxy, so trying to call any of its method will produce
-    a coroutine, that add QueuedCall to queue. For example, the following code:
-
-    class Foo:
-        def bar(self, arg):
-            print(arg)
-    queue, wrapped = queue_calls(Foo())
-    await wrapped.bar("foo")
-
-    Will add partial(foo.bar, "foo",)) to the queue and will not print
-    anything.
-
-    To execute calls, you can do next:
-
-    queued_call = await queue.get()
-    queued_call.execute()
-
-    In case `any_obj` is `None` and `allow_any_for_none` is set, then a proxy will not
-    raise any AttributeErrors and just absorb all cals silently.
-    """
-    queue: "asyncio.Queue[QueuedCall]" = asyncio.Queue()
-
-    async def add_to_queue(
-        real_method: Callable[..., None], *args: Any, **kwargs: Any
-    ) -> None:
-        await queue.put(partial(real_method, *args, **kwargs))
-
-    class Proxy:
-        def __getattr__(self, name: str) -> Callable[[Any], Coroutine[Any, Any, None]]:
-            real_method = getattr(any_obj, name)
-            setattr(self, name, partial(add_to_queue, real_method))
-            return partial(add_to_queue, real_method)
-
-    if any_obj is None and allow_any_for_none:
-        return queue, _NoopProxy()
-
-    return queue, Proxy()
@@ -1,17 +1,24 @@
 import asyncio
+import json
 from dataclasses import replace
 from pathlib import Path
-from typing import Callable, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import aiohttp
 import aiohttp.pytest_plugin
 import pytest
+from aiohttp import web
 from jose import jwt
 from yarl import URL
 
+import neuro_sdk.utils
 from neuro_sdk import Client, Cluster, Preset, __version__
 from neuro_sdk.config import _AuthConfig, _AuthToken, _ConfigData, _save
+from neuro_sdk.storage import _parse_content_range
 from neuro_sdk.tracing import _make_trace_config
+from neuro_sdk.utils import RetryBudget
+
+from tests import _RawTestServerFactory
 
 
 def setup_test_loop(
@@ -23,6 +30,14 @@ def setup_test_loop(
 aiohttp.pytest_plugin.setup_test_loop = setup_test_loop
 
 
+@pytest.fixture(autouse=True)
+def retry_budget(monkeypatch: Any) -> RetryBudget:
+    # Retries of one test should not slow down the next ones
+    budget = RetryBudget()
+    monkeypatch.setattr(neuro_sdk.utils, "RETRY_BUDGET", budget)
+    return budget
+
+
 @pytest.fixture
 def token() -> str:
     return jwt.encode({"identity": "user"}, "secret", algorithm="HS256")
@@ -86,7 +101,7 @@ def make_client(
         registry_url: str = "https://registry-dev.neu.ro",
         trace_id: str = "bd7a977555f6b982",
         clusters: Optional[Dict[str, Cluster]] = None,
-        token_url: Optional[URL] = None
+        token_url: Optional[URL] = None,
     ) -> Client:
         url = URL(url_str)
         if clusters is None:
@@ -130,3 +145,125 @@ def make_client(
         return Client._create(session, config_dir, trace_id)
 
     return go
+
+
+async def make_listiter_response(
+    request: web.Request, file_statuses: List[Any]
+) -> web.StreamResponse:
+    assert request.query == {"op": "LISTSTATUS"}
+    assert request.headers["Accept"] == "application/x-ndjson"
+    resp = web.StreamResponse()
+    resp.headers["Content-Type"] = "application/x-ndjson"
+    await resp.prepare(request)
+    for item in file_statuses:
+        await resp.write(json.dumps({"FileStatus": item}).encode() + b"\n")
+    return resp
+
+
+@pytest.fixture
+def storage_path(tmp_path: Path) -> Path:
+    ret = tmp_path / "storage"
+    ret.mkdir()
+    return ret
+
+
+@pytest.fixture
+async def storage_server(
+    aiohttp_raw_server: _RawTestServerFactory, storage_path: Path
+) -> Any:
+    PREFIX = "/storage/user"
+    PREFIX_LEN = len(PREFIX)
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        assert "b3" in request.headers
+        op = request.query["op"]
+        path = request.path
+        assert path.startswith(PREFIX)
+        path = path[PREFIX_LEN:]
+        if path.startswith("/"):
+            path = path[1:]
+        local_path = storage_path / path
+        if op == "CREATE":
+            content = await request.read()
+            local_path.write_bytes(content)
+            return web.Response(status=201)
+
+        elif op == "WRITE":
+            rng = _parse_content_range(request.headers.get("Content-Range"))
+            content = await request.read()
+            assert rng.stop - rng.start == len(content)
+            with open(local_path, "r+b") as f:
+                f.seek(rng.start)
+                f.write(content)
+            return web.Response(status=200)
+
+        elif op == "OPEN":
+            rng = request.http_range
+            content = local_path.read_bytes()
+            response = web.StreamResponse()
+            start, stop, _ = rng.indices(len(content))
+            if not (rng.start is rng.stop is None):
+                if start >= stop:
+                    raise RuntimeError
+                response.set_status(web.HTTPPartialContent.status_code)
+                response.headers[
+                    "Content-Range"
+                ] = f"bytes {start}-{stop-1}/{len(content)}"
+                response.content_length = stop - start
+            await response.prepare(request)
+            chunk_size = 200
+            if stop - start > chunk_size:
+                await response.write(content[start : start + chunk_size])
+                raise RuntimeError
+            else:
+                await response.write(content[start:stop])
+                await response.write_eof()
+                return response
+
+        elif op == "GETFILESTATUS":
+            if not local_path.exists():
+                raise web.HTTPNotFound()
+            stat = local_path.stat()
+            return web.json_response(
+                {
+                    "FileStatus": {
+                        "path": local_path.name,
+                        "type": "FILE" if local_path.is_file() else "DIRECTORY",
+                        "length": stat.st_size,
+                        "modificationTime": stat.st_mtime,
+                        "permission": "write",
+                    }
+                }
+            )
+
+        elif op == "MKDIRS":
+            try:
+                local_path.mkdir(parents=True, exist_ok=True)
+            except FileExistsError:
+                raise web.HTTPBadRequest(
+                    text=json.dumps({"error": "File exists", "errno": "EEXIST"}),
+                    content_type="application/json",
+                )
+            return web.Response(status=201)
+
+        elif op == "LISTSTATUS":
+            if not local_path.exists():
+                raise web.HTTPNotFound()
+            ret = []
+            for child in local_path.iterdir():
+                stat = child.stat()
+                ret.append(
+                    {
+                        "path": child.name,
+                        "type": "FILE" if child.is_file() else "DIRECTORY",
+                        "length": stat.st_size,
+                        "modificationTime": stat.st_mtime,
+                        "permission": "write",
+                    }
+                )
+            return await make_listiter_response(request, ret)
+
+        else:
+            raise web.HTTPInternalServerError(text=f"Unsupported operation {op}")
+
+    return await aiohttp_raw_server(handler)
@@ -3,11 +3,23 @@ import base64
 import hashlib
 import os
 import time
+from dataclasses import replace
 from datetime import datetime
 from pathlib import Path
-from typing import Any, AsyncIterator, Callable, Dict, List, NoReturn, Optional, Set
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    NoReturn,
+    Optional,
+    Set,
+    Tuple,
+)
 from unittest import mock
 
+import aiohttp
 import pytest
 from aiohttp import web
 from yarl import URL
@@ -16,14 +28,17 @@ import neuro_sdk.blob_storage
 from neuro_sdk import (
     Action,
     BlobListing,
+    BlobPart,
     BucketListing,
     Client,
+    Cluster,
+    IllegalArgumentError,
     PrefixListing,
     StorageProgressComplete,
     StorageProgressStart,
     StorageProgressStep,
 )
-from neuro_sdk.blob_storage import calc_md5
+from neuro_sdk.blob_storage import _DigestCache, calc_md5
 
 from tests import _TestServerFactory
 
@@ -45,6 +60,7 @@ class BlobUrlRotes:
     GET_OBJECT = r"/blob/o/{bucket}/{path:.+}"
     PUT_OBJECT = r"/blob/o/{bucket}/{path:.+}"
     DELETE_OBJECT = r"/blob/o/{bucket}/{path:.+}"
+    POST_OBJECT = r"/blob/o/{bucket}/{path:.+}"
 
 
 # Bucket `foo` structure
@@ -128,13 +144,34 @@ def blob_storage_contents() -> _ContentsObj:
     return contents
 
 
+class MultipartUploads:
+    """State of multipart uploads of the blob_storage_server"""
+
+    def __init__(self) -> None:
+        # upload id -> key, part number -> body
+        self.uploads: Dict[str, Tuple[str, Dict[int, bytes]]] = {}
+        self.aborted: List[str] = []
+        self.part_requests: List[int] = []
+        # part numbers which fail once with 503 Service Unavailable
+        self.fail_parts: Set[int] = set()
+        # the status of failing to initiate an upload
+        self.create_status: Optional[int] = None
+
+
+@pytest.fixture
+def multipart_uploads() -> MultipartUploads:
+    return MultipartUploads()
+
+
 @pytest.fixture
 async def blob_storage_server(
     aiohttp_server: _TestServerFactory,
     blob_storage_contents: _ContentsObj,
+    multipart_uploads: MultipartUploads,
 ) -> Any:
     """Minimal functional Blob Storage server implementation"""
     CONTENTS = blob_storage_contents
+    UPLOADS = multipart_uploads
 
     def with_keys(d: Dict[str, Any], keys: List[str]) -> Dict[str, Any]:
         res = {}
@@ -176,13 +213,27 @@ async def blob_storage_server(
                     new_contents.append(item)
             contents = new_contents
 
-        return web.json_response(
-            {
-                "contents": sorted(contents, key=lambda x: x["key"]),
-                "common_prefixes": [{"prefix": p} for p in sorted(common_prefixes)],
-                "is_truncated": False,
-            }
+        # Keys and prefixes are paged together in lexicographical order
+        items = sorted(
+            [(item["key"], item) for item in contents]
+            + [(p, {"prefix": p}) for p in common_prefixes],
+            key=lambda x: x[0],
+        )
+        start_after = request.query.get(
+            "continuation_token", request.query.get("start_after", "")
         )
+        items = [x for x in items if x[0] > start_after]
+        max_keys = int(request.query.get("max_keys", 1000))
+        page = items[:max_keys]
+        is_truncated = len(items) > max_keys
+        res = {
+            "contents": [item for _, item in page if "key" in item],
+            "common_prefixes": [item for _, item in page if "prefix" in item],
+            "is_truncated": is_truncated,
+        }
+        if is_truncated:
+            res["continuation_token"] = page[-1][0]
+        return web.json_response(res)
 
     async def get_blob(request: web.Request) -> web.StreamResponse:
         assert "b3" in request.headers
@@ -222,6 +273,8 @@ async def blob_storage_server(
         assert "b3" in request.headers
         assert request.match_info["bucket"] == "foo"
 
+        if "uploadId" in request.query:
+            return await upload_part(request)
         key = request.match_info["path"]
         body = await request.content.read()
         blob = {
@@ -235,10 +288,71 @@ async def blob_storage_server(
 
         return web.Response(headers={"ETag": repr(etag)})
 
+    async def create_multipart_upload(request: web.Request) -> web.Response:
+        if UPLOADS.create_status is not None:
+            return web.Response(status=UPLOADS.create_status)
+        upload_id = f"upload-{len(UPLOADS.uploads)}"
+        UPLOADS.uploads[upload_id] = request.match_info["path"], {}
+        return web.json_response({"upload_id": upload_id})
+
+    async def upload_part(request: web.Request) -> web.Response:
+        upload_id = request.query["uploadId"]
+        if upload_id not in UPLOADS.uploads:
+            raise web.HTTPNotFound()
+        part_number = int(request.query["partNumber"])
+        UPLOADS.part_requests.append(part_number)
+        body = await request.content.read()
+        if part_number in UPLOADS.fail_parts:
+            UPLOADS.fail_parts.remove(part_number)
+            raise web.HTTPServiceUnavailable()
+        md5 = hashlib.md5(body)
+        content_md5 = request.headers.get("Content-MD5")
+        if content_md5 is not None:
+            if content_md5 != base64.b64encode(md5.digest()).decode("ascii"):
+                raise web.HTTPBadRequest()
+        UPLOADS.uploads[upload_id][1][part_number] = body
+        return web.Response(headers={"ETag": repr(md5.hexdigest())})
+
+    async def complete_multipart_upload(request: web.Request) -> web.Response:
+        upload_id = request.query["uploadId"]
+        if upload_id not in UPLOADS.uploads:
+            raise web.HTTPNotFound()
+        key, parts = UPLOADS.uploads.pop(upload_id)
+        assert key == request.match_info["path"]
+        data = await request.json()
+        body = b""
+        for part in data["parts"]:
+            part_body = parts[part["part_number"]]
+            assert part["etag"] == repr(hashlib.md5(part_body).hexdigest())
+            body += part_body
+        CONTENTS[key] = {
+            "key": key,
+            "size": len(body),
+            "last_modified": time.time(),
+            "body": body,
+        }
+        return web.Response(headers={"ETag": repr(hashlib.md5(body).hexdigest())})
+
+    async def post_blob(request: web.Request) -> web.Response:
+        assert "b3" in request.headers
+        assert request.match_info["bucket"] == "foo"
+
+        if "uploads" in request.query:
+            return await create_multipart_upload(request)
+        return await complete_multipart_upload(request)
+
     async def delete_blob(request: web.Request) -> NoReturn:
         assert "b3" in request.headers
         assert request.match_info["bucket"] == "foo"
 
+        if "uploadId" in request.query:
+            upload_id = request.query["uploadId"]
+            if upload_id not in UPLOADS.uploads:
+                raise web.HTTPNotFound()
+            del UPLOADS.uploads[upload_id]
+            UPLOADS.aborted.append(upload_id)
+            raise web.HTTPNoContent()
+
         key = request.match_info["path"]
         if key not in CONTENTS:
             raise web.HTTPNotFound()
@@ -253,6 +367,7 @@ async def blob_storage_server(
     # HEAD will also use this
     app.router.add_get(BlobUrlRotes.GET_OBJECT, get_blob)
     app.router.add_put(BlobUrlRotes.PUT_OBJECT, put_blob)
+    app.router.add_post(BlobUrlRotes.POST_OBJECT, post_blob)
     app.router.add_delete(BlobUrlRotes.DELETE_OBJECT, delete_blob)
 
     return await aiohttp_server(app)
@@ -497,6 +612,95 @@ async def test_blob_storage_list_blobs_recursive(
     )
 
 
+async def test_blob_storage_iter_blobs(
+    blob_storage_server: Any, make_client: _MakeClient
+) -> None:
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        client.blob_storage._default_batch_size = 2
+
+        items = [item.path async for item in client.blob_storage.iter_blobs("foo")]
+        assert items == [
+            "empty/",
+            "folder1/",
+            "test.json",
+            "test1.txt",
+            "test2.txt",
+        ]
+
+        items = [
+            item.path
+            async for item in client.blob_storage.iter_blobs(
+                "foo", recursive=True, start_after="folder1/xxx.txt", max_keys=3
+            )
+        ]
+        assert items == ["folder1/yyy.json", "test.json", "test1.txt"]
+
+        blobs, prefixes = await client.blob_storage.list_blobs(
+            "foo", start_after="folder1/"
+        )
+        assert [blob.key for blob in blobs] == ["test.json", "test1.txt", "test2.txt"]
+        assert prefixes == []
+
+
+async def test_blob_storage_iter_blobs_prefetch(
+    blob_storage_server: Any, make_client: _MakeClient
+) -> None:
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        client.blob_storage._default_batch_size = 2
+        with mock.patch.object(
+            client.blob_storage._core,
+            "request",
+            wraps=client.blob_storage._core.request,
+        ) as request:
+            it = client.blob_storage.iter_blobs("foo", recursive=True)
+            item = await it.__anext__()
+            assert item.path == "empty/"
+            for _ in range(10):
+                await asyncio.sleep(0)
+            # The 2nd page is requested before the 1st one is consumed
+            assert request.call_count == 2
+            await it.aclose()
+        assert request.call_count == 2
+
+
+async def test_blob_storage_iter_blobs_resume_without_start_after(
+    blob_storage_server: Any, make_client: _MakeClient
+) -> None:
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        client.blob_storage._default_batch_size = 2
+        uri = URL("blob:foo")
+        expected = [
+            blob.key async for blob in client.blob_storage._iter_blobs(uri, "foo", "")
+        ]
+        iter_pages = client.blob_storage._iter_blob_pages
+        calls = 0
+
+        async def pages(
+            bucket_name: str,
+            prefix: str = "",
+            *,
+            start_after: Any = None,
+            **kwargs: Any,
+        ) -> AsyncIterator[Any]:
+            nonlocal calls
+            calls += 1
+            first = calls == 1
+            # A server which ignores start_after
+            async for page in iter_pages(bucket_name, prefix, **kwargs):
+                yield page
+                if first:
+                    raise aiohttp.ClientError("Connection lost")
+
+        with mock.patch.object(client.blob_storage, "_iter_blob_pages", pages):
+            keys = [
+                blob.key
+                async for blob in client.blob_storage._iter_blobs(uri, "foo", "")
+            ]
+    assert calls == 2
+    assert len(expected) > 2
+    assert keys == expected
+
+
 async def test_blob_storage_head_blob(
     aiohttp_server: _TestServerFactory, make_client: _MakeClient
 ) -> None:
@@ -775,6 +979,67 @@ async def test_blob_storage_large_calc_md5(tmp_path: Path) -> None:
     assert (await calc_md5(txt_file))[0] == body_md5
 
 
+async def test_blob_storage_md5_cache(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+) -> None:
+    local_file = tmp_path / "file.txt"
+    local_file.write_bytes(b"first")
+    # Not modified recently
+    stat = local_file.stat()
+    os.utime(local_file, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 * 10 ** 9))
+    src = URL(local_file.as_uri())
+    dst = URL("blob:foo/file.txt")
+
+    with mock.patch("neuro_sdk.blob_storage.calc_md5", wraps=calc_md5) as calc_md5_mock:
+        async with make_client(blob_storage_server.make_url("/")) as client:
+            await client.blob_storage.upload_file(src, dst)
+            await client.blob_storage.upload_file(src, dst)
+        assert calc_md5_mock.call_count == 1
+
+        # the cache is persistent
+        async with make_client(blob_storage_server.make_url("/")) as client:
+            await client.blob_storage.upload_file(src, dst)
+            assert calc_md5_mock.call_count == 1
+
+            local_file.write_bytes(b"second")
+            stat = local_file.stat()
+            os.utime(local_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            await client.blob_storage.upload_file(src, dst)
+            assert calc_md5_mock.call_count == 2
+
+    assert blob_storage_contents["file.txt"]["body"] == b"second"
+
+
+async def test_blob_storage_md5_cache_racy_file(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+) -> None:
+    local_file = tmp_path / "file.txt"
+    local_file.write_bytes(b"first")
+    src = URL(local_file.as_uri())
+    dst = URL("blob:foo/file.txt")
+
+    with mock.patch("neuro_sdk.blob_storage.calc_md5", wraps=calc_md5) as calc_md5_mock:
+        async with make_client(blob_storage_server.make_url("/")) as client:
+            await client.blob_storage.upload_file(src, dst)
+            # Could be rewritten within the same mtime tick, so not cached
+            await client.blob_storage.upload_file(src, dst)
+        assert calc_md5_mock.call_count == 2
+
+
+def test_digest_cache_unusable(tmp_path: Path) -> None:
+    (tmp_path / "file").write_bytes(b"")
+    cache = _DigestCache(tmp_path / "file" / "md5_cache.db")
+    stat = (tmp_path / "file").stat()
+    cache.put(stat, "digest")
+    assert cache.get(stat) is None
+    cache.close()
+
+
 # high level API
 
 
@@ -820,6 +1085,40 @@ async def test_blob_storage_upload_not_a_file(
     progress.complete.assert_called_with(StorageProgressComplete(src, dst, 0))
 
 
+async def test_blob_storage_upload_file_mmap(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+    small_block_size: None,
+    monkeypatch: Any,
+) -> None:
+    monkeypatch.setattr(neuro_sdk.blob_storage, "MMAP_THRESHOLD", 1000)
+    big = os.urandom(1000)
+    small = os.urandom(999)
+    (tmp_path / "big.bin").write_bytes(big)
+    (tmp_path / "small.bin").write_bytes(small)
+    progress = mock.Mock()
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        for name in "big.bin", "small.bin":
+            await client.blob_storage.upload_file(
+                URL((tmp_path / name).as_uri()),
+                URL(f"blob:foo/{name}"),
+                progress=progress,
+            )
+
+    assert blob_storage_contents["big.bin"]["body"] == big
+    assert blob_storage_contents["small.bin"]["body"] == small
+    src = URL((tmp_path / "big.bin").as_uri())
+    dst = URL("blob://default/foo/big.bin")
+    steps = [
+        c[0][0].current for c in progress.step.call_args_list if c[0][0].src == src
+    ]
+    assert set(steps) <= {300, 600, 900, 1000}
+    progress.step.assert_any_call(StorageProgressStep(src, dst, 1000, 1000))
+
+
 async def test_blob_storage_upload_regular_file_new_file(
     blob_storage_server: Any,
     make_client: _MakeClient,
@@ -961,6 +1260,235 @@ async def test_blob_storage_upload_regular_file_to_not_existing(
     assert uploaded["body"] == expected
 
 
+@pytest.fixture
+def small_parts(monkeypatch: Any) -> None:
+    monkeypatch.setattr(neuro_sdk.blob_storage, "MULTIPART_THRESHOLD", 1000)
+    monkeypatch.setattr(neuro_sdk.blob_storage, "PART_SIZE", 300)
+
+
+async def test_blob_storage_multipart_upload_api(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    multipart_uploads: MultipartUploads,
+) -> None:
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        upload_id = await client.blob_storage.create_multipart_upload("foo", "big")
+        part2 = await client.blob_storage.upload_part(
+            "foo", "big", upload_id, 2, b"world"
+        )
+        part1 = await client.blob_storage.upload_part(
+            "foo", "big", upload_id, 1, b"hello "
+        )
+        assert part1 == BlobPart(1, repr(hashlib.md5(b"hello ").hexdigest()))
+        etag = await client.blob_storage.complete_multipart_upload(
+            "foo", "big", upload_id, [part2, part1]
+        )
+        assert etag == repr(hashlib.md5(b"hello world").hexdigest())
+
+        upload_id = await client.blob_storage.create_multipart_upload("foo", "other")
+        await client.blob_storage.abort_multipart_upload("foo", "other", upload_id)
+
+    assert blob_storage_contents["big"]["body"] == b"hello world"
+    assert "other" not in blob_storage_contents
+    assert multipart_uploads.uploads == {}
+    assert multipart_uploads.aborted == [upload_id]
+
+
+async def test_blob_storage_upload_file_multipart(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    multipart_uploads: MultipartUploads,
+    tmp_path: Path,
+    small_parts: None,
+) -> None:
+    content = os.urandom(3500)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    multipart_uploads.fail_parts.add(5)
+    src = URL(local_file.as_uri())
+    progress = mock.Mock()
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        await client.blob_storage.upload_file(
+            src, URL("blob:foo/file.bin"), progress=progress
+        )
+
+    assert blob_storage_contents["file.bin"]["body"] == content
+    # only the failed part is sent again
+    assert sorted(multipart_uploads.part_requests) == [
+        1,
+        2,
+        3,
+        4,
+        5,
+        5,
+        6,
+        7,
+        8,
+        9,
+        10,
+        11,
+        12,
+    ]
+    dst = URL("blob://default/foo/file.bin")
+    progress.start.assert_called_with(StorageProgressStart(src, dst, 3500))
+    progress.step.assert_called_with(StorageProgressStep(src, dst, 3500, 3500))
+    progress.complete.assert_called_with(StorageProgressComplete(src, dst, 3500))
+
+
+@pytest.mark.parametrize("status", [404, 405, 501])
+async def test_blob_storage_upload_file_multipart_unsupported(
+    status: int,
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    multipart_uploads: MultipartUploads,
+    tmp_path: Path,
+    small_parts: None,
+) -> None:
+    content = os.urandom(1500)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    multipart_uploads.create_status = status
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        with mock.patch.object(
+            client.blob_storage,
+            "create_multipart_upload",
+            wraps=client.blob_storage.create_multipart_upload,
+        ) as create:
+            await client.blob_storage.upload_file(
+                URL(local_file.as_uri()), URL("blob:foo/file.bin")
+            )
+            await client.blob_storage.upload_file(
+                URL(local_file.as_uri()), URL("blob:foo/file2.bin")
+            )
+
+    # The server is asked once, the files are uploaded by a single PUT
+    assert create.call_count == 1
+    assert multipart_uploads.part_requests == []
+    assert blob_storage_contents["file.bin"]["body"] == content
+    assert blob_storage_contents["file2.bin"]["body"] == content
+
+
+@pytest.mark.parametrize("status", [400, 413, 500])
+async def test_blob_storage_upload_file_multipart_create_error(
+    status: int,
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    multipart_uploads: MultipartUploads,
+    tmp_path: Path,
+    small_parts: None,
+) -> None:
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(os.urandom(1500))
+    multipart_uploads.create_status = status
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        with pytest.raises(IllegalArgumentError):
+            await client.blob_storage.upload_file(
+                URL(local_file.as_uri()), URL("blob:foo/file.bin")
+            )
+        # Other errors do not disable multipart uploads
+        multipart_uploads.create_status = None
+        await client.blob_storage.upload_file(
+            URL(local_file.as_uri()), URL("blob:foo/file.bin")
+        )
+    assert multipart_uploads.part_requests
+
+
+async def test_blob_storage_upload_dir_multipart_bounded_memory(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+    small_parts: None,
+    monkeypatch: Any,
+) -> None:
+    monkeypatch.setattr(neuro_sdk.blob_storage, "MAX_BUFFERED_PARTS", 3)
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    for i in range(5):
+        (local_dir / f"file{i}.bin").write_bytes(os.urandom(2000))
+    buffered = max_buffered = 0
+
+    async def upload_part(*args: Any, **kwargs: Any) -> BlobPart:
+        nonlocal buffered, max_buffered
+        buffered += 1
+        max_buffered = max(max_buffered, buffered)
+        try:
+            await asyncio.sleep(0.01)
+            return await upload_part_orig(*args, **kwargs)
+        finally:
+            buffered -= 1
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        upload_part_orig = client.blob_storage.upload_part
+        with mock.patch.object(client.blob_storage, "upload_part", upload_part):
+            await client.blob_storage.upload_dir(
+                URL(local_dir.as_uri()), URL("blob:foo/folder")
+            )
+
+    assert max_buffered == 3
+    for i in range(5):
+        path = local_dir / f"file{i}.bin"
+        assert blob_storage_contents[f"folder/{path.name}"]["body"] == (
+            path.read_bytes()
+        )
+
+
+async def test_blob_storage_upload_file_multipart_abort(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    multipart_uploads: MultipartUploads,
+    tmp_path: Path,
+    small_parts: None,
+) -> None:
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(os.urandom(1500))
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        with mock.patch.object(
+            client.blob_storage, "upload_part", side_effect=ValueError("broken")
+        ):
+            with pytest.raises(ValueError, match="broken"):
+                await client.blob_storage.upload_file(
+                    URL(local_file.as_uri()), URL("blob:foo/file.bin")
+                )
+
+    assert "file.bin" not in blob_storage_contents
+    assert multipart_uploads.uploads == {}
+    assert multipart_uploads.aborted == ["upload-0"]
+
+
+async def test_blob_storage_upload_dir_multipart(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    multipart_uploads: MultipartUploads,
+    tmp_path: Path,
+    small_parts: None,
+) -> None:
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    small = os.urandom(500)
+    big = os.urandom(2000)
+    (local_dir / "small.bin").write_bytes(small)
+    (local_dir / "big.bin").write_bytes(big)
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        await client.blob_storage.upload_dir(
+            URL(local_dir.as_uri()), URL("blob:foo/folder")
+        )
+
+    assert blob_storage_contents["folder/small.bin"]["body"] == small
+    assert blob_storage_contents["folder/big.bin"]["body"] == big
+    assert len(multipart_uploads.part_requests) == 7
+
+
 async def test_blob_storage_upload_recursive_src_doesnt_exist(
     make_client: _MakeClient,
 ) -> None:
@@ -1164,6 +1692,121 @@ async def test_blob_storage_download_large_file(
     progress.complete.assert_called_with(StorageProgressComplete(src, dst, file_size))
 
 
+async def test_blob_storage_download_file_parallel_segments(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+) -> None:
+    content = os.urandom(3500)
+    add_blob(blob_storage_contents, "file.bin", content)
+    local_file = tmp_path / "file.bin"
+    src = URL("blob:foo/file.bin")
+    dst = URL(local_file.as_uri())
+    progress = mock.Mock()
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        await client.blob_storage.download_file(
+            src,
+            dst,
+            progress=progress,
+            parallel_segments=3,
+            segment_size=1000,
+        )
+    assert local_file.read_bytes() == content
+
+    src = URL("blob://default/foo/file.bin")
+    progress.start.assert_called_with(StorageProgressStart(src, dst, 3500))
+    progress.step.assert_called_with(StorageProgressStep(src, dst, 3500, 3500))
+    progress.complete.assert_called_with(StorageProgressComplete(src, dst, 3500))
+
+
+async def test_blob_storage_download_file_parallel_segments_interrupted(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+    zero_time_threshold: None,
+) -> None:
+    content = os.urandom(3500)
+    add_blob(blob_storage_contents, "file.bin", content)
+    local_file = tmp_path / "file.bin"
+    src = URL("blob:foo/file.bin")
+    dst = URL(local_file.as_uri())
+    await asyncio.sleep(2)
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        fetch_blob = client.blob_storage.fetch_blob
+
+        async def failing_fetch_blob(
+            bucket_name: str, key: str, offset: int = 0, size: Optional[int] = None
+        ) -> AsyncIterator[bytes]:
+            if offset >= 2000:
+                raise RuntimeError("Interrupted")
+            async for chunk in fetch_blob(bucket_name, key, offset, size):
+                yield chunk
+
+        with mock.patch.object(client.blob_storage, "fetch_blob", failing_fetch_blob):
+            with pytest.raises(RuntimeError, match="Interrupted"):
+                await client.blob_storage.download_file(
+                    src, dst, parallel_segments=2, segment_size=1000
+                )
+    # Only a contiguous prefix is kept
+    partial = local_file.read_bytes()
+    assert len(partial) <= 2000
+    assert partial == content[: len(partial)]
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        await client.blob_storage.download_file(
+            src, dst, continue_=True, parallel_segments=2, segment_size=1000
+        )
+    assert local_file.read_bytes() == content
+
+
+async def test_blob_storage_download_dir_parallel_segments(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+) -> None:
+    small = os.urandom(100)
+    big = os.urandom(2500)
+    add_blob(blob_storage_contents, "folder/small.bin", small)
+    add_blob(blob_storage_contents, "folder/big.bin", big)
+    local_dir = tmp_path / "folder"
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        with mock.patch.object(client.blob_storage, "head_blob") as head_blob:
+            await client.blob_storage.download_dir(
+                URL("blob:foo/folder"),
+                URL(local_dir.as_uri()),
+                parallel_segments=2,
+                segment_size=1000,
+            )
+    # sizes are taken from the listing
+    head_blob.assert_not_called()
+    assert (local_dir / "small.bin").read_bytes() == small
+    assert (local_dir / "big.bin").read_bytes() == big
+
+
+async def test_blob_storage_download_file_invalid_parallel_segments(
+    make_client: _MakeClient, tmp_path: Path
+) -> None:
+    async with make_client("https://example.com") as client:
+        with pytest.raises(ValueError, match="parallel_segments"):
+            await client.blob_storage.download_file(
+                URL("blob:foo/file.bin"),
+                URL((tmp_path / "file.bin").as_uri()),
+                parallel_segments=0,
+            )
+        with pytest.raises(ValueError, match="segment_size"):
+            await client.blob_storage.download_dir(
+                URL("blob:foo/folder"),
+                URL((tmp_path / "folder").as_uri()),
+                segment_size=0,
+            )
+
+
 async def test_blob_storage_download_regular_file_to_existing_file(
     blob_storage_server: Any,
     make_client: _MakeClient,
@@ -1273,6 +1916,169 @@ async def test_blob_storage_download_dir(
     ]
 
 
+def spy_listings(client: Client) -> List[Tuple[str, bool]]:
+    calls: List[Tuple[str, bool]] = []
+    iter_blob_pages = client.blob_storage._iter_blob_pages
+
+    def spy(
+        bucket_name: str, prefix: str = "", *, recursive: bool = False, **kwargs: Any
+    ) -> Any:
+        calls.append((prefix, recursive))
+        return iter_blob_pages(bucket_name, prefix, recursive=recursive, **kwargs)
+
+    client.blob_storage._iter_blob_pages = spy  # type: ignore
+    return calls
+
+
+async def test_blob_storage_download_dir_single_listing(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+) -> None:
+    for key in ["folder1/sub/a.txt", "folder1/sub/deep/b.txt", "folder2/c.txt"]:
+        add_blob(blob_storage_contents, key, b"x")
+    local_dir = tmp_path / "local"
+
+    async def filter(name: str) -> bool:
+        return name != "folder1/sub/deep/"
+
+    progress = mock.Mock()
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        calls = spy_listings(client)
+        await client.blob_storage.download_dir(
+            URL("blob:foo"), URL(local_dir.as_uri()), filter=filter, progress=progress
+        )
+
+    assert calls == [("", True)]
+    files = sorted(dir_list(local_dir), key=lambda x: x["path"])
+    assert [f["path"] for f in files] == [
+        "empty",
+        "folder1",
+        "folder1/sub",
+        "folder1/sub/a.txt",
+        "folder1/xxx.txt",
+        "folder1/yyy.json",
+        "folder2",
+        "folder2/c.txt",
+        "test.json",
+        "test1.txt",
+        "test2.txt",
+    ]
+    entered = [c[0][0].src for c in progress.enter.call_args_list]
+    left = [c[0][0].src for c in progress.leave.call_args_list]
+    assert sorted(entered) == sorted(left)
+    assert sorted(map(str, entered)) == [
+        "blob://default/foo",
+        "blob://default/foo/empty",
+        "blob://default/foo/folder1",
+        "blob://default/foo/folder1/sub",
+        "blob://default/foo/folder2",
+    ]
+    # A directory is left after all its files are transferred
+    events = [
+        (name, str(args[0].src))
+        for name, args, _ in progress.mock_calls
+        if name in ("complete", "leave")
+    ]
+    assert events.index(
+        ("complete", "blob://default/foo/folder1/sub/a.txt")
+    ) < events.index(("leave", "blob://default/foo/folder1/sub"))
+    assert events[-1] == ("leave", "blob://default/foo")
+
+
+async def test_blob_storage_download_dir_resume_listing(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+) -> None:
+    local_dir = tmp_path / "local"
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        iter_blob_pages = client.blob_storage._iter_blob_pages
+        failed = False
+
+        async def flaky(*args: Any, **kwargs: Any) -> Any:
+            nonlocal failed
+            async for blobs, prefixes in iter_blob_pages(*args, **kwargs):
+                if not failed:
+                    failed = True
+                    yield blobs[:3], prefixes
+                    raise aiohttp.ClientConnectionError("Connection lost")
+                yield blobs, prefixes
+
+        client.blob_storage._iter_blob_pages = flaky  # type: ignore
+        progress = mock.Mock()
+        await client.blob_storage.download_dir(
+            URL("blob:foo"), URL(local_dir.as_uri()), progress=progress
+        )
+
+    assert failed
+    started = [str(c[0][0].src) for c in progress.start.call_args_list]
+    assert sorted(started) == [
+        "blob://default/foo/folder1/xxx.txt",
+        "blob://default/foo/folder1/yyy.json",
+        "blob://default/foo/test.json",
+        "blob://default/foo/test1.txt",
+        "blob://default/foo/test2.txt",
+    ]
+    files = sorted(dir_list(local_dir), key=lambda x: x["path"])
+    assert [f["path"] for f in files] == [
+        "empty",
+        "folder1",
+        "folder1/xxx.txt",
+        "folder1/yyy.json",
+        "test.json",
+        "test1.txt",
+        "test2.txt",
+    ]
+
+
+async def test_blob_storage_iter_contents(
+    blob_storage_server: Any, make_client: _MakeClient
+) -> None:
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        ret = [
+            (uri, data)
+            async for uri, data in client.blob_storage.iter_contents(
+                URL("blob:foo"), concurrency=2, prefetch_bytes=300
+            )
+        ]
+        assert ret == [
+            (URL("blob:foo/folder1/xxx.txt"), b"w"),
+            (URL("blob:foo/folder1/yyy.json"), b"bb"),
+            (URL("blob:foo/test.json"), b"w" * 213),
+            (URL("blob:foo/test1.txt"), b"w" * 111),
+            (URL("blob:foo/test2.txt"), b"w" * 222),
+        ]
+
+        ret = [
+            (uri, data)
+            async for uri, data in client.blob_storage.iter_contents(
+                URL("blob:foo"), pattern="*.txt"
+            )
+        ]
+        assert ret == [
+            (URL("blob:foo/test1.txt"), b"w" * 111),
+            (URL("blob:foo/test2.txt"), b"w" * 222),
+        ]
+
+        ret = [
+            (uri, data)
+            async for uri, data in client.blob_storage.iter_contents(
+                URL("blob:foo/folder1/"), pattern="*.json"
+            )
+        ]
+        assert ret == [(URL("blob:foo/folder1/yyy.json"), b"bb")]
+
+        with pytest.raises(ValueError):
+            async for _ in client.blob_storage.iter_contents(
+                URL("blob:foo"), concurrency=0
+            ):
+                pass
+
+
 async def test_blob_storage_download_dir_with_slash(
     blob_storage_server: Any,
     make_client: _MakeClient,
@@ -1420,6 +2226,73 @@ async def test_storage_upload_dir_update(
     assert blob_storage_contents["nested/file.txt"]["body"] == b"old"
 
 
+async def test_storage_upload_dir_single_listing(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+    zero_time_threshold: None,
+) -> None:
+    local_dir = tmp_path / "folder"
+    (local_dir / "sub" / "deep").mkdir(parents=True)
+    (local_dir / "xxx.txt").write_bytes(b"w")
+    (local_dir / "new.txt").write_bytes(b"new")
+    (local_dir / "sub" / "a.txt").write_bytes(b"a")
+    (local_dir / "sub" / "deep" / "b.txt").write_bytes(b"b")
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        calls = spy_listings(client)
+        with mock.patch.object(
+            client.blob_storage, "_mkdir", wraps=client.blob_storage._mkdir
+        ) as mkdir:
+            await client.blob_storage.upload_dir(
+                URL(local_dir.as_uri()), URL("blob:foo/folder1"), update=True
+            )
+
+    assert calls == [("folder1/", True)]
+    # "folder1/" exists implicitly, only new folders are created
+    assert sorted(str(c[0][0]) for c in mkdir.call_args_list) == [
+        "blob://default/foo/folder1/sub/",
+        "blob://default/foo/folder1/sub/deep/",
+    ]
+    assert blob_storage_contents["folder1/new.txt"]["body"] == b"new"
+    assert blob_storage_contents["folder1/sub/a.txt"]["body"] == b"a"
+    assert blob_storage_contents["folder1/sub/deep/b.txt"]["body"] == b"b"
+
+
+async def test_storage_upload_dir_no_listing_without_update(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    blob_storage_contents: _ContentsObj,
+    tmp_path: Path,
+) -> None:
+    local_dir = tmp_path / "folder"
+    (local_dir / "sub").mkdir(parents=True)
+    (local_dir / "sub" / "a.txt").write_bytes(b"a")
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        calls = spy_listings(client)
+        await client.blob_storage.upload_dir(URL(local_dir.as_uri()), URL("blob:foo"))
+
+    assert calls == []
+    assert blob_storage_contents["sub/a.txt"]["body"] == b"a"
+
+
+async def test_storage_upload_dir_nested_conflict(
+    blob_storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+) -> None:
+    local_dir = tmp_path / "folder"
+    (local_dir / "yyy.json").mkdir(parents=True)
+
+    async with make_client(blob_storage_server.make_url("/")) as client:
+        with pytest.raises(NotADirectoryError):
+            await client.blob_storage.upload_dir(
+                URL(local_dir.as_uri()), URL("blob:foo/folder1")
+            )
+
+
 async def test_storage_download_file_update(
     blob_storage_server: Any,
     make_client: _MakeClient,
@@ -1619,3 +2492,131 @@ def add_blob(
     if mtime is None:
         mtime = time.time()
     contents[key]["last_modified"] = mtime
+
+
+@pytest.fixture
+async def bridge_client(
+    blob_storage_server: Any,
+    storage_server: Any,
+    make_client: _MakeClient,
+    cluster_config: Cluster,
+) -> AsyncIterator[Client]:
+    cluster_config = replace(
+        cluster_config,
+        storage_url=storage_server.make_url("/storage"),
+        blob_storage_url=blob_storage_server.make_url("/blob"),
+    )
+    async with make_client(
+        "https://example.com", clusters={cluster_config.name: cluster_config}
+    ) as client:
+        yield client
+
+
+async def test_blob_storage_copy_from_storage(
+    bridge_client: Client,
+    storage_path: Path,
+    blob_storage_contents: _ContentsObj,
+) -> None:
+    body = os.urandom(1000)
+    (storage_path / "file.bin").write_bytes(body)
+    progress = mock.Mock()
+
+    await bridge_client.blob_storage.copy_from_storage(
+        URL("storage:file.bin"), URL("blob:foo/copied.bin"), progress=progress
+    )
+
+    assert blob_storage_contents["copied.bin"]["body"] == body
+    src = URL("storage://default/user/file.bin")
+    dst = URL("blob://default/foo/copied.bin")
+    progress.start.assert_called_with(StorageProgressStart(src, dst, 1000))
+    progress.complete.assert_called_with(StorageProgressComplete(src, dst, 1000))
+
+
+async def test_blob_storage_copy_from_storage_dir(
+    bridge_client: Client, storage_path: Path
+) -> None:
+    (storage_path / "folder").mkdir()
+
+    with pytest.raises(IsADirectoryError):
+        await bridge_client.blob_storage.copy_from_storage(
+            URL("storage:folder"), URL("blob:foo/folder")
+        )
+
+
+async def test_blob_storage_copy_to_storage(
+    bridge_client: Client,
+    storage_path: Path,
+    blob_storage_contents: _ContentsObj,
+) -> None:
+    body = os.urandom(1000)
+    add_blob(blob_storage_contents, "file.bin", body)
+    progress = mock.Mock()
+
+    await bridge_client.blob_storage.copy_to_storage(
+        URL("blob:foo/file.bin"), URL("storage:copied.bin"), progress=progress
+    )
+
+    assert (storage_path / "copied.bin").read_bytes() == body
+    src = URL("blob://default/foo/file.bin")
+    dst = URL("storage://default/user/copied.bin")
+    progress.start.assert_called_with(StorageProgressStart(src, dst, 1000))
+    progress.complete.assert_called_with(StorageProgressComplete(src, dst, 1000))
+
+
+async def test_blob_storage_copy_dir_from_storage(
+    bridge_client: Client,
+    storage_path: Path,
+    blob_storage_contents: _ContentsObj,
+) -> None:
+    contents = {
+        "a.bin": os.urandom(500),
+        "empty.txt": b"",
+        "nested/b.txt": b"b" * 20,
+        "nested/deeper/c.bin": os.urandom(300),
+        "skipped/d.txt": b"d",
+    }
+    for name, body in contents.items():
+        path = storage_path / "folder" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+
+    async def filter(path: str) -> bool:
+        return path != "skipped/"
+
+    await bridge_client.blob_storage.copy_dir_from_storage(
+        URL("storage:folder"), URL("blob:foo/copied"), filter=filter
+    )
+
+    copied = {
+        key: blob["body"]
+        for key, blob in blob_storage_contents.items()
+        if key.startswith("copied/")
+    }
+    assert copied == {
+        "copied/": b"",
+        "copied/a.bin": contents["a.bin"],
+        "copied/empty.txt": b"",
+        "copied/nested/": b"",
+        "copied/nested/b.txt": contents["nested/b.txt"],
+        "copied/nested/deeper/": b"",
+        "copied/nested/deeper/c.bin": contents["nested/deeper/c.bin"],
+    }
+
+
+async def test_blob_storage_copy_dir_to_storage(
+    bridge_client: Client, storage_path: Path
+) -> None:
+    await bridge_client.blob_storage.copy_dir_to_storage(
+        URL("blob:foo"), URL("storage:copied")
+    )
+
+    files = sorted(dir_list(storage_path / "copied"), key=lambda x: x["path"])
+    assert files == [
+        {"dir": True, "path": "empty"},
+        {"dir": True, "path": "folder1"},
+        {"body": b"w", "dir": False, "path": "folder1/xxx.txt", "size": 1},
+        {"body": b"bb", "dir": False, "path": "folder1/yyy.json", "size": 2},
+        {"body": b"w" * 213, "dir": False, "path": "test.json", "size": 213},
+        {"body": b"w" * 111, "dir": False, "path": "test1.txt", "size": 111},
+        {"body": b"w" * 222, "dir": False, "path": "test2.txt", "size": 222},
+    ]
@@ -10,7 +10,14 @@ from aiohttp import web
 from yarl import URL
 
 from neuro_sdk import Client, Cluster, ConfigError, Preset
-from neuro_sdk.config import _check_sections, _merge_user_configs, _validate_user_config
+from neuro_sdk.config import (
+    UserConfigCacheInfo,
+    _check_sections,
+    _merge_user_configs,
+    _validate_user_config,
+    clear_user_config_cache,
+    user_config_cache_info,
+)
 from neuro_sdk.login import _AuthToken
 
 from tests import _TestServerFactory
@@ -127,6 +134,55 @@ async def test_get_user_config_from_local(
         }
 
 
+async def test_get_user_config_cached(
+    monkeypatch: Any, tmp_path: Path, make_client: _MakeClient
+) -> None:
+    async with make_client("https://example.com") as client:
+        proj_dir = tmp_path / "project"
+        proj_dir.mkdir(parents=True, exist_ok=True)
+        monkeypatch.chdir(proj_dir)
+        local_conf = proj_dir / ".neuro.toml"
+        local_conf.write_text(toml.dumps({"job": {"ps-format": "id"}}))
+
+        clear_user_config_cache()
+        with mock.patch("neuro_sdk.config.toml.load", wraps=toml.load) as load:
+            for i in range(10):
+                assert await client.config.get_user_config() == {
+                    "job": {"ps-format": "id"}
+                }
+            assert load.call_count == 1
+        assert user_config_cache_info() == UserConfigCacheInfo(hits=9, misses=1, size=1)
+
+
+async def test_get_user_config_cache_invalidated(
+    monkeypatch: Any, tmp_path: Path, make_client: _MakeClient
+) -> None:
+    async with make_client("https://example.com") as client:
+        proj_dir = tmp_path / "project"
+        proj_dir.mkdir(parents=True, exist_ok=True)
+        monkeypatch.chdir(proj_dir)
+        local_conf = proj_dir / ".neuro.toml"
+        local_conf.write_text(toml.dumps({"job": {"ps-format": "id"}}))
+
+        clear_user_config_cache()
+        assert await client.config.get_user_config() == {"job": {"ps-format": "id"}}
+
+        local_conf.write_text(toml.dumps({"job": {"ps-format": "id,name"}}))
+        assert await client.config.get_user_config() == {
+            "job": {"ps-format": "id,name"}
+        }
+
+        global_conf = client.config._path / "user.toml"
+        global_conf.write_text(toml.dumps({"job": {"life-span": "1d"}}))
+        assert await client.config.get_user_config() == {
+            "job": {"ps-format": "id,name", "life-span": "1d"}
+        }
+
+        local_conf.unlink()
+        assert await client.config.get_user_config() == {"job": {"life-span": "1d"}}
+        assert user_config_cache_info().misses == 4
+
+
 @pytest.fixture
 def multiple_clusters_config() -> Dict[str, Cluster]:
     return {
@@ -10,7 +10,12 @@ from aiohttp import web
 from typing_extensions import AsyncContextManager
 from yarl import URL
 
-from neuro_sdk import IllegalArgumentError, ServerNotAvailable
+from neuro_sdk import (
+    IllegalArgumentError,
+    ServerError,
+    ServerNotAvailable,
+    TooManyRequests,
+)
 from neuro_sdk.core import (
     _Core,
     _ensure_schema,
@@ -135,6 +140,57 @@ async def test_server_bad_gateway(
                 assert resp.status == 200
 
 
+async def test_server_internal_error(
+    aiohttp_server: _TestServerFactory, api_factory: _ApiFactory
+) -> None:
+    async def handler(request: web.Request) -> web.Response:
+        raise web.HTTPInternalServerError()
+
+    app = web.Application()
+    app.router.add_get("/test", handler)
+    srv = await aiohttp_server(app)
+
+    async with api_factory(srv.make_url("/")) as api:
+        url = srv.make_url("test")
+        with pytest.raises(
+            ServerError, match="^500: Internal Server Error$"
+        ) as exc_info:
+            async with api.request(method="GET", url=url, auth="auth"):
+                pass
+        assert exc_info.value.status == 500
+
+
+async def test_server_retry_after(
+    aiohttp_server: _TestServerFactory, api_factory: _ApiFactory
+) -> None:
+    async def unavailable(request: web.Request) -> web.Response:
+        raise web.HTTPServiceUnavailable(headers={"Retry-After": "7"})
+
+    async def throttled(request: web.Request) -> web.Response:
+        raise web.HTTPTooManyRequests(
+            headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/unavailable", unavailable)
+    app.router.add_get("/throttled", throttled)
+    srv = await aiohttp_server(app)
+
+    async with api_factory(srv.make_url("/")) as api:
+        url = srv.make_url("unavailable")
+        with pytest.raises(ServerNotAvailable) as exc_info:
+            async with api.request(method="GET", url=url, auth="auth"):
+                pass
+        assert exc_info.value.retry_after == 7.0
+
+        url = srv.make_url("throttled")
+        with pytest.raises(TooManyRequests) as exc_info:
+            async with api.request(method="GET", url=url, auth="auth"):
+                pass
+        # The date is in the past
+        assert exc_info.value.retry_after == 0.0
+
+
 # ### Cookies tests ###
 
 
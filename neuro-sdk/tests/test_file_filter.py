@@ -1,4 +1,5 @@
 import codecs
+from typing import Any, List
 
 from neuro_sdk.file_filter import FileFilter, translate
 
@@ -144,6 +145,48 @@ async def test_exclude_include_with_prefix() -> None:
     assert not await ff.match("parent/child/ham.txt")
 
 
+async def test_copy_with_prefix() -> None:
+    parent = FileFilter()
+    parent.exclude("*.txt")
+    parent.exclude("node_modules/")
+    child = parent.copy()
+    child.include("s*", "dir/")
+    child.exclude("*.py", "dir/")
+
+    assert not await child.match("spam.txt")
+    assert await child.match("dir/spam.txt")
+    assert not await child.match("dir/ham.txt")
+    assert not await child.match("dir/spam.py")
+    assert await child.match("spam.py")
+    assert not await child.match("dir/node_modules/")
+    # The original is not changed
+    assert len(parent.filters) == 2
+    assert not await parent.match("dir/spam.txt")
+    assert await parent.match("dir/spam.py")
+
+
+async def test_check() -> None:
+    async def default(path: str) -> bool:
+        calls.append(path)
+        return False
+
+    calls: List[str] = []
+    ff = FileFilter(default)
+    assert ff.check("spam") is None
+    ff.exclude("*.txt")
+    ff.include("s*")
+    ff.exclude(".git/")
+    assert ff.check("spam.txt") is True
+    assert ff.check("ham.txt") is False
+    assert ff.check("dir/.git/") is False
+    assert ff.check("dir/.git") is None
+    assert ff.check("ham") is None
+    assert await ff.match("spam.txt")
+    assert calls == []
+    assert not await ff.match("ham")
+    assert calls == ["ham"]
+
+
 def test_translate() -> None:
     assert translate("") == "/?"
     assert translate("abc") == r"abc/?"
@@ -169,7 +212,7 @@ def test_translate_recursive() -> None:
     assert translate("abc/**/def") == r"abc/(?:.+/)?def/?"
 
 
-async def test_read_from_buffer() -> None:
+async def test_read_from_buffer(capsys: Any) -> None:
     ff = FileFilter()
     ff.read_from_buffer(
         codecs.BOM_UTF8 + b"*.txt  \r\n"  # CRLF and trailing spaces
@@ -182,3 +225,4 @@ async def test_read_from_buffer() -> None:
     assert await ff.match("base/spam.txt")
     assert not await ff.match("base/ham.txt")
     assert await ff.match("ham.txt")
+    assert capsys.readouterr() == ("", "")
@@ -1,10 +1,12 @@
 import logging
-from typing import Any
+from typing import Any, List
 
 import aiohttp
 import pytest
 
-from neuro_sdk.utils import retries
+import neuro_sdk.utils
+from neuro_sdk import ServerError, ServerNotAvailable, TooManyRequests
+from neuro_sdk.utils import RetryBudget, RetryPolicy, RetryStats, retries
 
 
 async def test_success(caplog: Any) -> None:
@@ -87,3 +89,102 @@ async def test_unexpected_error(caplog: Any) -> None:
 
     assert count == 1
     assert caplog.record_tuples == []
+
+
+async def test_server_not_available(caplog: Any, monkeypatch: Any) -> None:
+    stats = RetryStats()
+    monkeypatch.setattr(neuro_sdk.utils, "RETRY_STATS", stats)
+    caplog.set_level(logging.INFO)
+    count = 0
+    for retry in retries("Fails", attempts=5):
+        async with retry:
+            count += 1
+            if count == 1:
+                raise ServerNotAvailable("502: Bad Gateway")
+            if count == 2:
+                raise TooManyRequests("429: Too Many Requests")
+
+    assert count == 3
+    assert stats.attempts == 3
+    assert stats.retries == 2
+    assert stats.congestion == 2
+
+
+async def test_server_error_not_congestion(monkeypatch: Any) -> None:
+    stats = RetryStats()
+    monkeypatch.setattr(neuro_sdk.utils, "RETRY_STATS", stats)
+    events: List[int] = []
+    with pytest.raises(ServerError):
+        for retry in retries("Fails", on_congestion=lambda: events.append(1)):
+            async with retry:
+                raise ServerError("500: Internal Server Error")
+
+    # Neither retried nor counted
+    assert stats.attempts == 1
+    assert stats.congestion == 0
+    assert events == []
+
+
+async def test_retry_after(monkeypatch: Any) -> None:
+    stats = RetryStats()
+    monkeypatch.setattr(neuro_sdk.utils, "RETRY_STATS", stats)
+    policy = RetryPolicy(max_retry_after=0.02)
+    count = 0
+    for retry in retries("Fails", policy=policy):
+        async with retry:
+            count += 1
+            if count <= 2:
+                error = TooManyRequests("429: Too Many Requests")
+                error.retry_after = 0.01 * count
+                raise error
+
+    assert count == 3
+    assert stats.sleeps == 2
+    assert stats.sleep_time == pytest.approx(0.01 + 0.02)
+
+
+def test_policy_full_jitter() -> None:
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    error = aiohttp.ClientError()
+    for retry in range(5):
+        delays = [policy.delay(retry, error) for _ in range(100)]
+        assert all(0 <= delay <= min(5.0, 2 ** retry) for delay in delays)
+        assert len(set(delays)) > 1
+
+
+async def test_budget_exhausted(caplog: Any, monkeypatch: Any) -> None:
+    stats = RetryStats()
+    monkeypatch.setattr(neuro_sdk.utils, "RETRY_STATS", stats)
+    monkeypatch.setattr(
+        neuro_sdk.utils, "RETRY_BUDGET", RetryBudget(capacity=1, per_second=0)
+    )
+    caplog.set_level(logging.INFO)
+    count = 0
+    with pytest.raises(aiohttp.ClientError):
+        policy = RetryPolicy(attempts=3, base_delay=0, max_delay=0.01)
+        for retry in retries("Fails", policy=policy):
+            async with retry:
+                count += 1
+                raise aiohttp.ClientError("Ouch!")
+
+    # Retried slowly
+    assert count == 3
+    assert stats.retries == 2
+    assert stats.budget_exhausted == 1
+    assert stats.sleeps == 1
+    assert stats.sleep_time == pytest.approx(0.01)
+    assert caplog.record_tuples[-1] == (
+        "neuro_sdk.utils",
+        logging.INFO,
+        "Fails: Ouch!.  Retry budget is exhausted, retry slowly...",
+    )
+
+
+def test_budget_refill() -> None:
+    budget = RetryBudget(capacity=1, per_second=0, ratio=0.5)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
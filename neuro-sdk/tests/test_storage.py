@@ -1,32 +1,63 @@
 import asyncio
 import errno
+import functools
+import io
 import json
 import os
+import sys
 from filecmp import dircmp
 from pathlib import Path
-from shutil import copytree
-from typing import Any, AsyncIterator, Callable, List, Tuple
+from shutil import copytree, rmtree
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from unittest import mock
 
+import aiohttp
 import pytest
 from aiohttp import web
 from yarl import URL
 
 import neuro_sdk.storage
+import neuro_sdk.utils
 from neuro_sdk import (
     Action,
     Client,
     FileStatus,
     FileStatusType,
     IllegalArgumentError,
+    ResourceNotFound,
+    ServerNotAvailable,
     StorageProgressComplete,
+    StorageProgressConcurrency,
+    StorageProgressFail,
     StorageProgressStart,
     StorageProgressStep,
+    TransferPlan,
+    TransferPlanEntry,
 )
 from neuro_sdk.abc import StorageProgressDelete
-from neuro_sdk.storage import _parse_content_range
+from neuro_sdk.file_filter import FileFilter
+from neuro_sdk.storage import (
+    _AdaptiveLimiter,
+    _BlockHasher,
+    _BufferPool,
+    _CoalescingWriter,
+    _hash_blocks,
+    _iter_buffered,
+    _iter_prefetched,
+    _ManifestEntry,
+    _parse_content_range,
+    _PositionalWriter,
+    _ProgressPipeline,
+    _scan_dir,
+    _SyncManifest,
+    _TransferDir,
+    _TransferJournal,
+    _TransferScheduler,
+)
+from neuro_sdk.utils import RetryStats, retries
 
-from tests import _RawTestServerFactory, _TestServerFactory
+from tests import _TestServerFactory
+from tests.conftest import make_listiter_response
 
 _MakeClient = Callable[..., Client]
 
@@ -53,115 +84,6 @@ def small_block_size(monkeypatch: Any) -> None:
     monkeypatch.setattr(neuro_sdk.storage, "READ_SIZE", 300)
 
 
-@pytest.fixture
-def storage_path(tmp_path: Path) -> Path:
-    ret = tmp_path / "storage"
-    ret.mkdir()
-    return ret
-
-
-@pytest.fixture
-async def storage_server(
-    aiohttp_raw_server: _RawTestServerFactory, storage_path: Path
-) -> Any:
-    PREFIX = "/storage/user"
-    PREFIX_LEN = len(PREFIX)
-
-    async def handler(request: web.Request) -> web.StreamResponse:
-        assert "b3" in request.headers
-        op = request.query["op"]
-        path = request.path
-        assert path.startswith(PREFIX)
-        path = path[PREFIX_LEN:]
-        if path.startswith("/"):
-            path = path[1:]
-        local_path = storage_path / path
-        if op == "CREATE":
-            content = await request.read()
-            local_path.write_bytes(content)
-            return web.Response(status=201)
-
-        elif op == "WRITE":
-            rng = _parse_content_range(request.headers.get("Content-Range"))
-            content = await request.read()
-            assert rng.stop - rng.start == len(content)
-            with open(local_path, "r+b") as f:
-                f.seek(rng.start)
-                f.write(content)
-            return web.Response(status=200)
-
-        elif op == "OPEN":
-            rng = request.http_range
-            content = local_path.read_bytes()
-            response = web.StreamResponse()
-            start, stop, _ = rng.indices(len(content))
-            if not (rng.start is rng.stop is None):
-                if start >= stop:
-                    raise RuntimeError
-                response.set_status(web.HTTPPartialContent.status_code)
-                response.headers[
-                    "Content-Range"
-                ] = f"bytes {start}-{stop-1}/{len(content)}"
-                response.content_length = stop - start
-            await response.prepare(request)
-            chunk_size = 200
-            if stop - start > chunk_size:
-                await response.write(content[start : start + chunk_size])
-                raise RuntimeError
-            else:
-                await response.write(content[start:stop])
-                await response.write_eof()
-                return response
-
-        elif op == "GETFILESTATUS":
-            if not local_path.exists():
-                raise web.HTTPNotFound()
-            stat = local_path.stat()
-            return web.json_response(
-                {
-                    "FileStatus": {
-                        "path": local_path.name,
-                        "type": "FILE" if local_path.is_file() else "DIRECTORY",
-                        "length": stat.st_size,
-                        "modificationTime": stat.st_mtime,
-                        "permission": "write",
-                    }
-                }
-            )
-
-        elif op == "MKDIRS":
-            try:
-                local_path.mkdir(parents=True, exist_ok=True)
-            except FileExistsError:
-                raise web.HTTPBadRequest(
-                    text=json.dumps({"error": "File exists", "errno": "EEXIST"}),
-                    content_type="application/json",
-                )
-            return web.Response(status=201)
-
-        elif op == "LISTSTATUS":
-            if not local_path.exists():
-                raise web.HTTPNotFound()
-            ret = []
-            for child in local_path.iterdir():
-                stat = child.stat()
-                ret.append(
-                    {
-                        "path": child.name,
-                        "type": "FILE" if child.is_file() else "DIRECTORY",
-                        "length": stat.st_size,
-                        "modificationTime": stat.st_mtime,
-                        "permission": "write",
-                    }
-                )
-            return await make_listiter_response(request, ret)
-
-        else:
-            raise web.HTTPInternalServerError(text=f"Unsupported operation {op}")
-
-    return await aiohttp_raw_server(handler)
-
-
 async def test_storage_ls_legacy(
     aiohttp_server: _TestServerFactory, make_client: _MakeClient
 ) -> None:
@@ -220,19 +142,6 @@ async def test_storage_ls_legacy(
     ]
 
 
-async def make_listiter_response(
-    request: web.Request, file_statuses: List[Any]
-) -> web.StreamResponse:
-    assert request.query == {"op": "LISTSTATUS"}
-    assert request.headers["Accept"] == "application/x-ndjson"
-    resp = web.StreamResponse()
-    resp.headers["Content-Type"] = "application/x-ndjson"
-    await resp.prepare(request)
-    for item in file_statuses:
-        await resp.write(json.dumps({"FileStatus": item}).encode() + b"\n")
-    return resp
-
-
 async def test_storage_ls(
     aiohttp_server: _TestServerFactory, make_client: _MakeClient
 ) -> None:
@@ -1235,6 +1144,37 @@ async def test_storage_download_regular_file_to_absent_file(
     progress.complete.assert_called_with(StorageProgressComplete(src, dst, file_size))
 
 
+async def test_storage_download_file_coalesced_progress(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+    monkeypatch: Any,
+) -> None:
+    monkeypatch.setattr(neuro_sdk.storage, "WRITE_BUFFER_SIZE", 1000)
+    content = os.urandom(3500)
+    (storage_path / "file.bin").write_bytes(content)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content[:300])
+    progress = mock.Mock()
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.download_file(
+            URL("storage:file.bin"),
+            URL(local_file.as_uri()),
+            continue_=True,
+            progress=progress,
+        )
+
+    assert local_file.read_bytes() == content
+    # Steps are reported for flushed buffers, the first one is aligned to the
+    # buffer size
+    steps = [c[0][0].current for c in progress.step.call_args_list]
+    assert steps == sorted(steps)
+    assert set(steps) <= {1000, 2000, 3000, 3500}
+    assert steps[-1] == 3500
+
+
 async def test_storage_download_regular_file_to_existing_file(
     storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
 ) -> None:
@@ -1705,3 +1645,1702 @@ async def test_storage_upload_dir_with_ignore_file_names(
     assert names == [".neuroignore", "nested", "three", "two"]
     names = sorted(os.listdir(storage_path / "folder" / "nested"))
     assert names == [".gitignore", "three"]
+
+
+async def test_storage_download_file_parallel_segments(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    content = os.urandom(3500)
+    storage_file = storage_path / "file.bin"
+    storage_file.write_bytes(content)
+    local_file = tmp_path / "file.bin"
+    src = URL("storage:file.bin")
+    dst = URL(local_file.as_uri())
+    progress = mock.Mock()
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.download_file(
+            src,
+            dst,
+            progress=progress,
+            parallel_segments=3,
+            segment_size=1000,
+        )
+    assert local_file.read_bytes() == content
+
+    src = URL("storage://default/user/file.bin")
+    progress.start.assert_called_with(StorageProgressStart(src, dst, 3500))
+    progress.step.assert_called_with(StorageProgressStep(src, dst, 3500, 3500))
+    progress.complete.assert_called_with(StorageProgressComplete(src, dst, 3500))
+
+
+async def test_storage_download_file_parallel_segments_continue(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+    zero_time_threshold: None,
+) -> None:
+    content = os.urandom(3500)
+    storage_file = storage_path / "file.bin"
+    storage_file.write_bytes(content)
+    local_file = tmp_path / "file.bin"
+    await asyncio.sleep(2)
+    local_file.write_bytes(content[:1200])
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.download_file(
+            URL("storage:file.bin"),
+            URL(local_file.as_uri()),
+            continue_=True,
+            parallel_segments=4,
+            segment_size=500,
+        )
+    assert local_file.read_bytes() == content
+
+
+async def test_storage_download_file_parallel_segments_interrupted(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+    zero_time_threshold: None,
+) -> None:
+    content = os.urandom(3500)
+    storage_file = storage_path / "file.bin"
+    storage_file.write_bytes(content)
+    local_file = tmp_path / "file.bin"
+    src = URL("storage:file.bin")
+    dst = URL(local_file.as_uri())
+    await asyncio.sleep(2)
+
+    async with make_client(storage_server.make_url("/")) as client:
+        open = client.storage.open
+
+        async def failing_open(
+            uri: URL, offset: int = 0, size: Optional[int] = None
+        ) -> AsyncIterator[bytes]:
+            if offset >= 2000:
+                raise RuntimeError("Interrupted")
+            async for chunk in open(uri, offset, size):
+                yield chunk
+
+        with mock.patch.object(client.storage, "open", failing_open):
+            with pytest.raises(RuntimeError, match="Interrupted"):
+                await client.storage.download_file(
+                    src, dst, parallel_segments=2, segment_size=1000
+                )
+    # Only a contiguous prefix is kept
+    partial = local_file.read_bytes()
+    assert len(partial) <= 2000
+    assert partial == content[: len(partial)]
+    assert not (tmp_path / "file.bin.part").exists()
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.download_file(
+            src, dst, continue_=True, parallel_segments=2, segment_size=1000
+        )
+    assert local_file.read_bytes() == content
+
+
+async def test_storage_download_dir_parallel_segments(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    storage_dir = storage_path / "folder"
+    storage_dir.mkdir()
+    small = os.urandom(100)
+    big = os.urandom(2500)
+    (storage_dir / "small.bin").write_bytes(small)
+    (storage_dir / "big.bin").write_bytes(big)
+    local_dir = tmp_path / "folder"
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.download_dir(
+            URL("storage:folder"),
+            URL(local_dir.as_uri()),
+            parallel_segments=2,
+            segment_size=1000,
+        )
+    assert (local_dir / "small.bin").read_bytes() == small
+    assert (local_dir / "big.bin").read_bytes() == big
+
+
+async def test_storage_download_file_invalid_parallel_segments(
+    make_client: _MakeClient, tmp_path: Path
+) -> None:
+    async with make_client("https://example.com") as client:
+        with pytest.raises(ValueError, match="parallel_segments"):
+            await client.storage.download_file(
+                URL("storage:file.bin"),
+                URL((tmp_path / "file.bin").as_uri()),
+                parallel_segments=0,
+            )
+        with pytest.raises(ValueError, match="segment_size"):
+            await client.storage.download_file(
+                URL("storage:file.bin"),
+                URL((tmp_path / "file.bin").as_uri()),
+                segment_size=0,
+            )
+
+
+async def test_storage_upload_file_write_window(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    content = os.urandom(3500)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    src = URL(local_file.as_uri())
+    dst = URL("storage:file.bin")
+    progress = mock.Mock()
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.upload_file(
+            src, dst, progress=progress, write_window=3, chunk_size=300
+        )
+    assert (storage_path / "file.bin").read_bytes() == content
+
+    dst = URL("storage://default/user/file.bin")
+    progress.start.assert_called_with(StorageProgressStart(src, dst, 3500))
+    progress.step.assert_called_with(StorageProgressStep(src, dst, 3500, 3500))
+    progress.complete.assert_called_with(StorageProgressComplete(src, dst, 3500))
+    # Steps of a file are merged by the progress pipeline
+    steps = [c[0][0].current for c in progress.step.call_args_list]
+    assert steps == sorted(steps)
+    assert set(steps) <= set(range(300, 3500, 300)) | {3500}
+
+
+async def test_storage_upload_file_write_window_retry(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    content = os.urandom(2000)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    offsets: List[int] = []
+
+    async with make_client(storage_server.make_url("/")) as client:
+        write = client.storage.write
+
+        async def flaky_write(uri: URL, data: bytes, offset: int) -> None:
+            offsets.append(offset)
+            if offsets.count(1200) == 1 and offset == 1200:
+                raise aiohttp.ClientConnectionError
+            await write(uri, data, offset)
+
+        with mock.patch.object(client.storage, "write", flaky_write):
+            await client.storage.upload_file(
+                URL(local_file.as_uri()),
+                URL("storage:file.bin"),
+                write_window=4,
+                chunk_size=400,
+            )
+    assert (storage_path / "file.bin").read_bytes() == content
+    assert sorted(offsets) == [400, 800, 1200, 1200, 1600]
+
+
+async def test_storage_upload_file_write_window_continue(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+    zero_time_threshold: None,
+) -> None:
+    content = os.urandom(2000)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    os.utime(local_file, (1000, 1000))
+    src = URL(local_file.as_uri())
+    dst = URL("storage:file.bin")
+
+    async with make_client(storage_server.make_url("/")) as client:
+        write = client.storage.write
+
+        async def failing_write(uri: URL, data: bytes, offset: int) -> None:
+            if offset == 1200:
+                raise RuntimeError("Interrupted")
+            await write(uri, data, offset)
+
+        with mock.patch.object(client.storage, "write", failing_write):
+            with pytest.raises(RuntimeError, match="Interrupted"):
+                await client.storage.upload_file(
+                    src, dst, continue_=True, write_window=4, chunk_size=400
+                )
+        # No gaps, the chunks after the failed one are not written
+        assert (storage_path / "file.bin").read_bytes() == content[:1200]
+
+        await client.storage.upload_file(
+            src, dst, continue_=True, write_window=4, chunk_size=400
+        )
+    assert (storage_path / "file.bin").read_bytes() == content
+
+
+async def test_storage_upload_dir_write_window(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    small = os.urandom(100)
+    big = os.urandom(2500)
+    (local_dir / "small.bin").write_bytes(small)
+    (local_dir / "big.bin").write_bytes(big)
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.upload_dir(
+            URL(local_dir.as_uri()),
+            URL("storage:folder"),
+            write_window=2,
+            chunk_size=1000,
+        )
+    assert (storage_path / "folder" / "small.bin").read_bytes() == small
+    assert (storage_path / "folder" / "big.bin").read_bytes() == big
+
+
+async def test_storage_upload_file_invalid_write_window(
+    make_client: _MakeClient, tmp_path: Path
+) -> None:
+    async with make_client("https://example.com") as client:
+        with pytest.raises(ValueError, match="write_window"):
+            await client.storage.upload_file(
+                URL((tmp_path / "file.bin").as_uri()),
+                URL("storage:file.bin"),
+                write_window=0,
+            )
+        with pytest.raises(ValueError, match="chunk_size"):
+            await client.storage.upload_file(
+                URL((tmp_path / "file.bin").as_uri()),
+                URL("storage:file.bin"),
+                chunk_size=0,
+            )
+
+
+async def test_coalescing_writer(tmp_path: Path) -> None:
+    flushed: List[int] = []
+
+    async def on_flush(n: int) -> None:
+        flushed.append(n)
+
+    content = os.urandom(330)
+    path = tmp_path / "file.bin"
+    path.write_bytes(content[:30])
+    with path.open("rb+") as stream:
+        writer = _CoalescingWriter(
+            _PositionalWriter(stream), 30, on_flush=on_flush, buffer_size=100
+        )
+        for pos in range(30, 330, 7):
+            await writer.write(content[pos : min(pos + 7, 330)])
+            assert writer.pos == min(pos + 7, 330)
+        await writer.flush()
+    assert flushed == [70, 100, 100, 30]
+    assert path.read_bytes() == content
+
+
+async def test_coalescing_writer_buffers_up_to_stop(tmp_path: Path) -> None:
+    flushed: List[int] = []
+
+    async def on_flush(n: int) -> None:
+        flushed.append(n)
+
+    content = os.urandom(260)
+    path = tmp_path / "file.bin"
+    with path.open("wb+") as stream:
+        writer = _CoalescingWriter(
+            _PositionalWriter(stream),
+            0,
+            on_flush=on_flush,
+            stop=250,
+            buffer_size=100,
+        )
+        await writer.write(content[:10])
+        assert len(writer._buf) == 100
+        await writer.write(content[10:210])
+        # Only the rest of the expected data is allocated
+        await writer.write(content[210:220])
+        assert len(writer._buf) == 50
+        # Unexpected data past stop is still accepted
+        await writer.write(content[220:])
+        await writer.flush()
+    assert flushed == [100, 100, 50, 10]
+    assert path.read_bytes() == content
+
+
+async def test_progress_pipeline_merges_steps() -> None:
+    progress = mock.Mock()
+    pipeline = _ProgressPipeline(progress, max_rate=1000, maxsize=2)
+    src = URL("file:///file.txt")
+    dst = URL("storage://default/user/file.txt")
+
+    async def transfer() -> None:
+        await pipeline.start(StorageProgressStart(src, dst, 100))
+        for i in range(1, 101):
+            await pipeline.step(src, dst, i, 100)
+        await pipeline.complete(StorageProgressComplete(src, dst, 100))
+
+    await pipeline.run(transfer())
+    assert progress.method_calls == [
+        mock.call.start(StorageProgressStart(src, dst, 100)),
+        mock.call.step(StorageProgressStep(src, dst, 100, 100)),
+        mock.call.complete(StorageProgressComplete(src, dst, 100)),
+    ]
+
+
+async def test_progress_pipeline_fail_drops_step() -> None:
+    progress = mock.Mock()
+    pipeline = _ProgressPipeline(progress, max_rate=1000, maxsize=2)
+    src = URL("file:///file.txt")
+    dst = URL("storage://default/user/file.txt")
+
+    async def transfer() -> None:
+        await pipeline.start(StorageProgressStart(src, dst, 100))
+        await pipeline.step(src, dst, 50, 100)
+        await pipeline.fail(StorageProgressFail(src, dst, "Boom"))
+
+    await pipeline.run(transfer())
+    assert progress.method_calls == [
+        mock.call.start(StorageProgressStart(src, dst, 100)),
+        mock.call.fail(StorageProgressFail(src, dst, "Boom")),
+    ]
+
+
+async def test_progress_pipeline_max_rate() -> None:
+    progress = mock.Mock()
+    pipeline = _ProgressPipeline(progress, max_rate=10)
+    src = URL("file:///file.txt")
+    dst = URL("storage://default/user/file.txt")
+
+    async def transfer() -> None:
+        for i in range(1, 11):
+            await pipeline.step(src, dst, i, 10)
+            await asyncio.sleep(0.03)
+
+    await pipeline.run(transfer())
+    steps = [c[0][0].current for c in progress.step.call_args_list]
+    assert 1 < len(steps) < 10
+    assert steps == sorted(steps)
+    assert steps[-1] == 10
+
+
+async def test_progress_pipeline_none() -> None:
+    pipeline = _ProgressPipeline(None)
+    src = URL("file:///file.txt")
+    dst = URL("storage://default/user/file.txt")
+    done = False
+
+    async def transfer() -> None:
+        nonlocal done
+        await pipeline.start(StorageProgressStart(src, dst, 10))
+        await pipeline.step(src, dst, 10, 10)
+        await pipeline.complete(StorageProgressComplete(src, dst, 10))
+        done = True
+
+    await pipeline.run(transfer())
+    assert done
+
+
+async def test_progress_pipeline_error() -> None:
+    progress = mock.Mock()
+    progress.start.side_effect = RuntimeError("Boom")
+    pipeline = _ProgressPipeline(progress, maxsize=1)
+    src = URL("file:///file.txt")
+    dst = URL("storage://default/user/file.txt")
+    cancelled = False
+
+    async def transfer() -> None:
+        nonlocal cancelled
+        try:
+            while True:
+                await pipeline.start(StorageProgressStart(src, dst, 10))
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    with pytest.raises(RuntimeError, match="Boom"):
+        await asyncio.wait_for(pipeline.run(transfer()), 5)
+    assert cancelled
+
+
+async def test_progress_pipeline_concurrency() -> None:
+    limiter = _AdaptiveLimiter(2, min_limit=1, max_limit=4)
+    progress = mock.Mock()
+    pipeline = _ProgressPipeline(progress, limiter=limiter)
+    src = URL("file:///file.txt")
+    dst = URL("storage://default/user/file.txt")
+
+    async def transfer() -> None:
+        await pipeline.start(StorageProgressStart(src, dst, 10))
+        await pipeline.step(src, dst, 4, 10)
+        limiter._adjust(limiter._window_start + 1.0)
+        await pipeline.complete(StorageProgressComplete(src, dst, 10))
+
+    await pipeline.run(transfer())
+    progress.concurrency.assert_called_once_with(
+        StorageProgressConcurrency(limit=2, in_flight=0, throughput=4.0)
+    )
+    # The rest of the file is counted by the next window
+    assert limiter._bytes == 6
+
+
+async def test_adaptive_limiter_fifo() -> None:
+    limiter = _AdaptiveLimiter(2, min_limit=1, max_limit=4)
+    order = []
+    release = asyncio.Event()
+
+    async def transfer(i: int) -> None:
+        async with limiter:
+            order.append(i)
+            assert limiter.in_flight <= limiter.limit
+            await release.wait()
+
+    tasks = [asyncio.ensure_future(transfer(i)) for i in range(5)]
+    await asyncio.sleep(0.01)
+    assert order == [0, 1]
+    assert limiter.in_flight == 2
+    # A cancelled waiter doesn't take a slot
+    tasks[2].cancel()
+    release.set()
+    await asyncio.wait(tasks)
+    assert order == [0, 1, 3, 4]
+    assert limiter.in_flight == 0
+
+
+async def test_adaptive_limiter_aimd(monkeypatch: Any) -> None:
+    stats = RetryStats()
+    monkeypatch.setattr(neuro_sdk.utils, "RETRY_STATS", stats)
+    monkeypatch.setattr(neuro_sdk.storage, "CONCURRENCY_INTERVAL", 1000)
+    monkeypatch.setattr(neuro_sdk.storage, "LATENCY_TOLERANCE", 1000)
+    limiter = _AdaptiveLimiter(2, min_limit=1, max_limit=3)
+
+    async def window(size: int, transfers: int) -> None:
+        for _ in range(transfers):
+            await limiter.__aenter__()
+        limiter.record(size)
+        for _ in range(transfers):
+            await limiter.__aexit__(None, None, None)
+        limiter._adjust(limiter._window_start + 1.0)
+
+    # Not saturated
+    await window(1000, 1)
+    assert limiter.limit == 2
+    # Saturated and throughput grows
+    await window(2000, 2)
+    assert limiter.limit == 3
+    assert limiter.throughput == 2000
+    # Up to max_limit only
+    await window(3000, 3)
+    assert limiter.limit == 3
+    # Throughput drops
+    limiter._limit = 2
+    await window(1000, 2)
+    assert limiter.limit == 2
+    # Congestion of other calls is ignored
+    stats.congestion += 1
+    await window(2000, 2)
+    assert limiter.limit == 3
+    # Multiplicative decrease on timeouts, 429, 502, 503 and 504 of own transfers
+    with pytest.raises(ServerNotAvailable):
+        for retry in retries("Fails", 1, on_congestion=limiter.congested):
+            async with retry:
+                raise ServerNotAvailable("503: Service Unavailable")
+    await window(5000, 2)
+    assert limiter.limit == 1
+    limiter.congested()
+    await window(5000, 1)
+    assert limiter.limit == 1
+
+
+@pytest.mark.skipif(
+    sys.platform == "win32", reason="Symlinks require privileges on Windows"
+)
+def test_scan_dir(tmp_path: Path) -> None:
+    (tmp_path / "file.txt").write_bytes(b"data")
+    (tmp_path / "folder").mkdir()
+    (tmp_path / "link").symlink_to(tmp_path / "folder")
+    (tmp_path / "broken").symlink_to(tmp_path / "missing")
+
+    entries = {entry.name: entry for entry in _scan_dir(tmp_path)}
+    assert entries.keys() == {"file.txt", "folder", "link", "broken"}
+
+    file = entries["file.txt"]
+    assert file.is_file and not file.is_dir
+    assert file.stat is not None
+    assert file.stat.st_size == 4
+    assert file.stat.st_mtime_ns == (tmp_path / "file.txt").stat().st_mtime_ns
+
+    for name in ("folder", "link"):
+        assert entries[name].is_dir
+        assert not entries[name].is_file
+        assert entries[name].stat is None
+
+    broken = entries["broken"]
+    assert not broken.is_dir and not broken.is_file
+    assert broken.stat is None
+
+
+def test_buffer_pool() -> None:
+    max_free = 1
+    pool = _BufferPool(max_free=lambda: max_free)
+    with pool.buffer(10) as buf1, pool.buffer(10) as buf2:
+        assert buf1 is not buf2
+        assert len(buf1) == len(buf2) == 10
+    # buf2 is released first, buf1 exceeds max_free and is dropped
+    with pool.buffer(10) as buf:
+        assert buf is buf2
+    with pool.buffer(20) as buf:
+        assert len(buf) == 20
+    with pool.buffer(10) as buf:
+        assert buf is buf2
+    # Follows the current limit
+    max_free = 2
+    with pool.buffer(10) as buf1, pool.buffer(10) as buf2:
+        pass
+    with pool.buffer(10) as buf3, pool.buffer(10) as buf4:
+        assert {id(buf3), id(buf4)} == {id(buf1), id(buf2)}
+
+
+async def test_transfer_scheduler_bounded() -> None:
+    # A tree of 5 directories with 10 files in each one
+    events: List[str] = []
+    files_in_flight = max_files_in_flight = 0
+    listings = max_listings = 0
+
+    async def transfer(name: str) -> None:
+        nonlocal files_in_flight, max_files_in_flight
+        files_in_flight += 1
+        max_files_in_flight = max(max_files_in_flight, files_in_flight)
+        await asyncio.sleep(0.001)
+        files_in_flight -= 1
+        events.append(name)
+
+    async def leave(name: str) -> None:
+        events.append(f"leave {name}")
+
+    async def list_dir(node: _TransferDir, name: str, depth: int) -> None:
+        nonlocal listings, max_listings
+        listings += 1
+        max_listings = max(max_listings, listings)
+        node.on_done(functools.partial(leave, name))
+        await asyncio.sleep(0.001)
+        listings -= 1
+        for i in range(10):
+            await node.add_file(1, functools.partial(transfer, f"{name}/{i}"))
+        if depth < 4:
+            await node.add_dir(
+                functools.partial(list_dir, name=f"{name}/d", depth=depth + 1)
+            )
+
+    scheduler = _TransferScheduler(max_files=3, max_listings=2, max_bytes=None)
+    await scheduler.run(functools.partial(list_dir, name="root", depth=0))
+
+    assert max_files_in_flight == 3
+    assert max_listings == 1
+    assert len(events) == 55
+    leaves = [event for event in events if event.startswith("leave ")]
+    assert leaves == [
+        "leave root/d/d/d/d",
+        "leave root/d/d/d",
+        "leave root/d/d",
+        "leave root/d",
+        "leave root",
+    ]
+    assert events[-1] == "leave root"
+    for event in events:
+        if event.startswith("leave "):
+            # all files of a directory are done before leaving it
+            prefix = event[len("leave ") :] + "/"
+            index = events.index(event)
+            assert not any(
+                e.startswith(prefix) and not e.startswith("leave ")
+                for e in events[index:]
+            )
+
+
+async def test_transfer_scheduler_max_bytes() -> None:
+    in_flight = max_in_flight = 0
+    sizes = [30, 30, 50, 200, 10, 40]
+
+    async def transfer(size: int) -> None:
+        nonlocal in_flight, max_in_flight
+        in_flight += min(size, 100)
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= min(size, 100)
+
+    async def list_dir(node: _TransferDir) -> None:
+        for size in sizes:
+            await node.add_file(size, functools.partial(transfer, size))
+
+    scheduler = _TransferScheduler(max_files=10, max_listings=1, max_bytes=100)
+    await scheduler.run(list_dir)
+    assert max_in_flight == 100
+
+
+async def test_transfer_scheduler_empty() -> None:
+    events: List[str] = []
+
+    async def done() -> None:
+        events.append("done")
+
+    async def list_dir(node: _TransferDir) -> None:
+        node.on_done(done)
+
+    scheduler = _TransferScheduler(max_files=2, max_listings=2, max_bytes=None)
+    await scheduler.run(list_dir)
+    assert events == ["done"]
+
+
+async def test_transfer_scheduler_error() -> None:
+    started = []
+
+    async def transfer(i: int) -> None:
+        started.append(i)
+        if i == 3:
+            raise OSError("Boom")
+        await asyncio.sleep(10)
+
+    async def list_dir(node: _TransferDir) -> None:
+        for i in range(100):
+            await node.add_file(1, functools.partial(transfer, i))
+
+    scheduler = _TransferScheduler(max_files=4, max_listings=1, max_bytes=None)
+    with pytest.raises(OSError, match="Boom"):
+        await asyncio.wait_for(scheduler.run(list_dir), 5)
+    assert len(started) < 10
+
+
+async def test_storage_sync_upload(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    local_dir = tmp_path / "folder"
+    (local_dir / "nested").mkdir(parents=True)
+    (local_dir / "a.txt").write_bytes(b"a")
+    (local_dir / "b.txt").write_bytes(b"b")
+    (local_dir / "nested" / "c.txt").write_bytes(b"c")
+    manifest = tmp_path / "manifest.db"
+    src = URL(local_dir.as_uri())
+    dst = URL("storage:folder")
+    remote_dir = storage_path / "folder"
+
+    progress = mock.Mock()
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(src, dst, manifest=manifest, progress=progress)
+    assert (remote_dir / "a.txt").read_bytes() == b"a"
+    assert (remote_dir / "b.txt").read_bytes() == b"b"
+    assert (remote_dir / "nested" / "c.txt").read_bytes() == b"c"
+    assert progress.start.call_count == 3
+
+    # Nothing changed, nothing uploaded
+    progress = mock.Mock()
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(src, dst, manifest=manifest, progress=progress)
+    progress.start.assert_not_called()
+    assert progress.enter.call_count == 2
+    assert progress.leave.call_count == 2
+
+    # Only changed and new files are uploaded
+    (local_dir / "b.txt").write_bytes(b"bb")
+    (local_dir / "nested" / "d.txt").write_bytes(b"d")
+    progress = mock.Mock()
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(src, dst, manifest=manifest, progress=progress)
+    assert (remote_dir / "b.txt").read_bytes() == b"bb"
+    assert (remote_dir / "nested" / "d.txt").read_bytes() == b"d"
+    uploaded = sorted(call[0][0].src.name for call in progress.start.call_args_list)
+    assert uploaded == ["b.txt", "d.txt"]
+
+
+async def test_storage_sync_upload_filter(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    (local_dir / "a.txt").write_bytes(b"a")
+    (local_dir / "b.bin").write_bytes(b"b")
+
+    async def filter(path: str) -> bool:
+        return not path.endswith(".bin")
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(
+            URL(local_dir.as_uri()),
+            URL("storage:folder"),
+            manifest=tmp_path / "manifest.db",
+            filter=filter,
+        )
+    assert sorted(p.name for p in (storage_path / "folder").iterdir()) == ["a.txt"]
+
+
+async def test_storage_sync_download(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    remote_dir = storage_path / "folder"
+    (remote_dir / "nested").mkdir(parents=True)
+    (remote_dir / "a.txt").write_bytes(b"a")
+    (remote_dir / "nested" / "b.txt").write_bytes(b"b")
+    local_dir = tmp_path / "local"
+    manifest = tmp_path / "manifest.db"
+    src = URL("storage:folder")
+    dst = URL(local_dir.as_uri())
+
+    progress = mock.Mock()
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(src, dst, manifest=manifest, progress=progress)
+    assert (local_dir / "a.txt").read_bytes() == b"a"
+    assert (local_dir / "nested" / "b.txt").read_bytes() == b"b"
+    assert progress.start.call_count == 2
+
+    # Nothing changed, nothing downloaded
+    progress = mock.Mock()
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(src, dst, manifest=manifest, progress=progress)
+    progress.start.assert_not_called()
+
+    # Changed remote file and removed local file are downloaded
+    (remote_dir / "a.txt").write_bytes(b"aa")
+    (local_dir / "nested" / "b.txt").unlink()
+    progress = mock.Mock()
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(src, dst, manifest=manifest, progress=progress)
+    assert (local_dir / "a.txt").read_bytes() == b"aa"
+    assert (local_dir / "nested" / "b.txt").read_bytes() == b"b"
+    assert progress.start.call_count == 2
+
+
+async def test_storage_sync_manifest_of_other_dirs(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    (local_dir / "a.txt").write_bytes(b"a")
+    manifest = tmp_path / "manifest.db"
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.sync(
+            URL(local_dir.as_uri()), URL("storage:folder"), manifest=manifest
+        )
+        await client.storage.sync(
+            URL(local_dir.as_uri()), URL("storage:other"), manifest=manifest
+        )
+    assert (storage_path / "other" / "a.txt").read_bytes() == b"a"
+
+
+def test_sync_manifest_commits_in_batches(tmp_path: Path) -> None:
+    path = tmp_path / "manifest.db"
+    src = URL("file:///folder")
+    dst = URL("storage://default/user/folder")
+    with _SyncManifest(path, src, dst) as manifest:
+        manifest.add_dir("")
+        manifest.record("", "a.txt", size=1, mtime=2, remote_mtime=None)
+        manifest.record("", "b.txt", size=3, mtime=4, remote_mtime=None)
+        manifest.forget("", ["b.txt"])
+        assert manifest.has_dir("")
+        assert list(manifest.files("")) == ["a.txt"]
+        # Kept in memory until the commit interval is reached
+        with _SyncManifest(path, src, dst) as other:
+            assert not other.has_dir("")
+            assert other.files("") == {}
+    with _SyncManifest(path, src, dst) as manifest:
+        assert manifest.has_dir("")
+        assert manifest.files("") == {"a.txt": _ManifestEntry(1, 2, None)}
+        assert not manifest.has_dir("nested/")
+
+
+async def test_storage_sync_unsupported(
+    make_client: _MakeClient, tmp_path: Path
+) -> None:
+    async with make_client("https://example.com") as client:
+        with pytest.raises(ValueError, match="not supported"):
+            await client.storage.sync(
+                URL("storage:folder"),
+                URL("storage:other"),
+                manifest=tmp_path / "manifest.db",
+            )
+
+
+async def test_storage_upload_file_delta(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+    small_block_size: None,
+) -> None:
+    content = os.urandom(3500)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    storage_file = storage_path / "file.bin"
+    delta_store = tmp_path / "blocks.db"
+    src = URL(local_file.as_uri())
+    dst = URL("storage:file.bin")
+
+    # No previous state, upload the whole file hashing it on the fly
+    progress = mock.Mock()
+    async with make_client(storage_server.make_url("/")) as client:
+        with mock.patch.object(neuro_sdk.storage, "_hash_blocks") as hash_blocks:
+            await client.storage.upload_file(
+                src,
+                dst,
+                progress=progress,
+                delta_store=delta_store,
+                delta_block_size=1000,
+            )
+    hash_blocks.assert_not_called()
+    assert storage_file.read_bytes() == content
+    progress.start.assert_called_once()
+    assert progress.start.call_args[0][0].size == 3500
+
+    # Change the second block and append to the file
+    content = content[:1500] + b"x" * 10 + content[1510:] + os.urandom(600)
+    local_file.write_bytes(content)
+    progress = mock.Mock()
+    offsets: List[int] = []
+    async with make_client(storage_server.make_url("/")) as client:
+        write = client.storage.write
+
+        async def tracking_write(uri: URL, data: bytes, offset: int) -> None:
+            offsets.append(offset)
+            await write(uri, data, offset)
+
+        with mock.patch.object(client.storage, "write", tracking_write):
+            await client.storage.upload_file(
+                src,
+                dst,
+                progress=progress,
+                delta_store=delta_store,
+                delta_block_size=1000,
+            )
+    assert storage_file.read_bytes() == content
+    assert offsets == [1000, 1300, 1600, 1900, 3000, 3300, 3600, 3900, 4000]
+    dst = URL("storage://default/user/file.bin")
+    progress.start.assert_called_once_with(StorageProgressStart(src, dst, 2100))
+    progress.complete.assert_called_once_with(StorageProgressComplete(src, dst, 2100))
+
+
+def test_block_hasher(tmp_path: Path) -> None:
+    content = os.urandom(3500)
+    path = tmp_path / "file.bin"
+    path.write_bytes(content)
+    for size in (0, 1000, 3500):
+        hasher = _BlockHasher(1000)
+        for pos in range(0, size, 300):
+            hasher.update(memoryview(content[pos : min(pos + 300, size)]))
+        path.write_bytes(content[:size])
+        assert hasher.digest() == _hash_blocks(path, 1000)
+        assert len(hasher.digest()) == 32 * ((size + 999) // 1000)
+
+
+async def test_storage_upload_file_delta_truncated(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+) -> None:
+    content = os.urandom(3500)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    storage_file = storage_path / "file.bin"
+    delta_store = tmp_path / "blocks.db"
+    src = URL(local_file.as_uri())
+    dst = URL("storage:file.bin")
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.upload_file(
+            src, dst, delta_store=delta_store, delta_block_size=1000
+        )
+        local_file.write_bytes(content[:2000])
+        await client.storage.upload_file(
+            src, dst, delta_store=delta_store, delta_block_size=1000
+        )
+    assert storage_file.read_bytes() == content[:2000]
+
+
+async def test_storage_upload_file_delta_remote_changed(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+) -> None:
+    content = os.urandom(3500)
+    local_file = tmp_path / "file.bin"
+    local_file.write_bytes(content)
+    storage_file = storage_path / "file.bin"
+    delta_store = tmp_path / "blocks.db"
+    src = URL(local_file.as_uri())
+    dst = URL("storage:file.bin")
+
+    async with make_client(storage_server.make_url("/")) as client:
+        await client.storage.upload_file(
+            src, dst, delta_store=delta_store, delta_block_size=1000
+        )
+        # The remote file is modified by other means
+        storage_file.write_bytes(b"z" * 3500)
+        os.utime(storage_file, (0, 0))
+        progress = mock.Mock()
+        await client.storage.upload_file(
+            src,
+            dst,
+            progress=progress,
+            delta_store=delta_store,
+            delta_block_size=1000,
+        )
+    assert storage_file.read_bytes() == content
+    assert progress.start.call_args[0][0].size == 3500
+
+
+async def test_storage_open_file(
+    storage_server: Any, make_client: _MakeClient, storage_path: Path
+) -> None:
+    content = os.urandom(5000)
+    (storage_path / "file.bin").write_bytes(content)
+
+    async with make_client(storage_server.make_url("/")) as client:
+        async with client.storage.open_file(
+            URL("storage:file.bin"), block_size=300, cache_blocks=4
+        ) as f:
+            assert f.uri == URL("storage://default/user/file.bin")
+            assert f.size == 5000
+            assert f.tell() == 0
+            assert await f.read(10) == content[:10]
+            assert f.tell() == 10
+            assert f.seek(4000) == 4000
+            assert await f.read(1500) == content[4000:]
+            assert f.tell() == 5000
+            assert await f.read() == b""
+            assert f.seek(-100, os.SEEK_END) == 4900
+            assert await f.read(50) == content[4900:4950]
+            assert f.seek(-950, os.SEEK_CUR) == 4000
+            assert f.seek(1234) == 1234
+            buf = bytearray(700)
+            assert await f.readinto(buf) == 700
+            assert buf == content[1234:1934]
+            f.seek(0)
+            assert await f.read() == content
+            with pytest.raises(ValueError):
+                f.seek(-1)
+        assert f.closed
+        with pytest.raises(ValueError, match="closed file"):
+            await f.read()
+
+
+async def test_storage_open_file_cache_and_merge(
+    aiohttp_server: _TestServerFactory, make_client: _MakeClient
+) -> None:
+    content = os.urandom(10000)
+    ranges: List[Tuple[int, int]] = []
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        op = request.query["op"]
+        if op == "GETFILESTATUS":
+            return web.json_response(
+                {
+                    "FileStatus": {
+                        "path": "file.bin",
+                        "type": "FILE",
+                        "length": len(content),
+                        "modificationTime": 0,
+                        "permission": "read",
+                    }
+                }
+            )
+        assert op == "OPEN"
+        start, stop, _ = request.http_range.indices(len(content))
+        ranges.append((start, stop))
+        return web.Response(
+            status=web.HTTPPartialContent.status_code,
+            body=content[start:stop],
+            headers={"Content-Range": f"bytes {start}-{stop-1}/{len(content)}"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/storage/user/file.bin", handler)
+    srv = await aiohttp_server(app)
+
+    async with make_client(srv.make_url("/")) as client:
+        async with client.storage.open_file(
+            URL("storage:file.bin"), block_size=1000, cache_blocks=5
+        ) as f:
+            f.seek(1500)
+            assert await f.read(100) == content[1500:1600]
+            assert ranges == [(1000, 2000)]
+
+            # Cached block
+            f.seek(1000)
+            assert await f.read(200) == content[1000:1200]
+            assert ranges == [(1000, 2000)]
+
+            # Adjacent missed blocks around the cached one
+            ranges.clear()
+            f.seek(0)
+            assert await f.read(4000) == content[:4000]
+            assert ranges == [(0, 1000), (2000, 4000)]
+
+            # Sequential reads fetch more blocks ahead
+            ranges.clear()
+            assert await f.read(1000) == content[4000:5000]
+            assert await f.read(1000) == content[5000:6000]
+            assert await f.read(1000) == content[6000:7000]
+            assert await f.read(1000) == content[7000:8000]
+            assert ranges == [(4000, 6000), (6000, 10000)]
+
+            # Evicted blocks are requested again
+            ranges.clear()
+            f.seek(0)
+            assert await f.read(10) == content[:10]
+            assert ranges == [(0, 1000)]
+
+
+async def test_iter_prefetched() -> None:
+    sizes = [30, 30, 50, 200, 10, 40, 20]
+    in_flight = max_in_flight = 0
+    in_flight_bytes = max_in_flight_bytes = 0
+
+    async def items() -> AsyncIterator[Tuple[int, int]]:
+        for i, size in enumerate(sizes):
+            yield i, size
+
+    async def fetch(i: int, size: int) -> bytes:
+        nonlocal in_flight, max_in_flight, in_flight_bytes, max_in_flight_bytes
+        in_flight += 1
+        in_flight_bytes += size
+        max_in_flight = max(max_in_flight, in_flight)
+        max_in_flight_bytes = max(max_in_flight_bytes, in_flight_bytes)
+        # later items complete first
+        await asyncio.sleep(0.001 * (len(sizes) - i))
+        in_flight -= 1
+        in_flight_bytes -= size
+        return bytes([i]) * size
+
+    ret = [
+        item
+        async for item in _iter_prefetched(
+            items(), fetch, concurrency=3, prefetch_bytes=100
+        )
+    ]
+    assert ret == [(i, bytes([i]) * size) for i, size in enumerate(sizes)]
+    assert max_in_flight == 3
+    # the oversized item is fetched alone
+    assert max_in_flight_bytes == 200
+
+
+async def test_iter_prefetched_cancel() -> None:
+    started = []
+    cancelled = []
+
+    async def items() -> AsyncIterator[Tuple[int, int]]:
+        for i in range(100):
+            yield i, 1
+
+    async def fetch(i: int, size: int) -> bytes:
+        started.append(i)
+        try:
+            if i:
+                await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+        return b"x"
+
+    it = _iter_prefetched(items(), fetch, concurrency=4, prefetch_bytes=100)
+    async for i, data in it:
+        assert (i, data) == (0, b"x")
+        break
+    await it.aclose()  # type: ignore
+    assert started == [0, 1, 2, 3]
+    assert cancelled == [1, 2, 3]
+
+
+async def test_iter_buffered() -> None:
+    sizes = [30, 30, 50, 200, 10, 40, 20]
+    read = consumed = max_ahead = 0
+
+    async def chunks() -> AsyncIterator[bytes]:
+        nonlocal read, max_ahead
+        for i, size in enumerate(sizes):
+            chunk = bytes([i]) * size
+            read += size
+            max_ahead = max(max_ahead, read - consumed)
+            yield chunk
+
+    ret = []
+    async for chunk in _iter_buffered(chunks(), 100):
+        consumed += len(chunk)
+        ret.append(chunk)
+        await asyncio.sleep(0.001)
+    assert ret == [bytes([i]) * size for i, size in enumerate(sizes)]
+    # the reader runs ahead by the buffered chunks and the one waiting for room
+    assert 100 < max_ahead <= 100 + max(sizes)
+
+
+async def test_iter_buffered_error() -> None:
+    async def chunks() -> AsyncIterator[bytes]:
+        yield b"a"
+        yield b"b"
+        raise OSError("read error")
+
+    ret = []
+    with pytest.raises(OSError, match="read error"):
+        async for chunk in _iter_buffered(chunks(), 100):
+            ret.append(chunk)
+    assert ret == [b"a", b"b"]
+
+
+async def test_iter_buffered_cancel() -> None:
+    closed = False
+
+    async def chunks() -> AsyncIterator[bytes]:
+        nonlocal closed
+        try:
+            for i in range(100):
+                yield b"x" * 10
+        finally:
+            closed = True
+
+    it = _iter_buffered(chunks(), 30)
+    async for chunk in it:
+        assert chunk == b"x" * 10
+        break
+    await it.aclose()  # type: ignore
+    assert closed
+
+
+async def test_storage_iter_contents(
+    storage_server: Any, make_client: _MakeClient, storage_path: Path
+) -> None:
+    contents = {
+        "a.bin": os.urandom(500),
+        "b.txt": b"b" * 20,
+        "folder/c.txt": b"",
+        "folder/nested/d.txt": os.urandom(300),
+        "folder/nested/e.bin": os.urandom(50),
+    }
+    for name, body in contents.items():
+        path = storage_path / "data" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+
+    async with make_client(storage_server.make_url("/")) as client:
+        base = "storage://default/user/data/"
+        ret = {
+            str(uri)[len(base) :]: data
+            async for uri, data in client.storage.iter_contents(
+                URL("storage:data"), concurrency=2, prefetch_bytes=400
+            )
+        }
+        assert ret == contents
+
+        ret = {
+            str(uri)[len(base) :]: data
+            async for uri, data in client.storage.iter_contents(
+                URL("storage:data"), pattern="**/*.txt"
+            )
+        }
+        assert ret == {
+            name: body for name, body in contents.items() if name.endswith(".txt")
+        }
+
+        ret = {
+            str(uri)[len(base) :]: data
+            async for uri, data in client.storage.iter_contents(
+                URL("storage:data"), pattern="*.bin"
+            )
+        }
+        assert ret == {"a.bin": contents["a.bin"]}
+
+        with pytest.raises(ValueError):
+            async for _ in client.storage.iter_contents(
+                URL("storage:data"), prefetch_bytes=0
+            ):
+                pass
+
+
+async def test_storage_plan_upload(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+    monkeypatch: Any,
+) -> None:
+    local_dir = tmp_path / "folder"
+    (local_dir / "nested").mkdir(parents=True)
+    (local_dir / "empty").mkdir()
+    (local_dir / "big.bin").write_bytes(os.urandom(3000))
+    (local_dir / "small.txt").write_bytes(b"0123456789")
+    (local_dir / "nested" / "a.txt").write_bytes(b"a" * 100)
+    (local_dir / "nested" / "skip.log").write_bytes(b"log")
+    (local_dir / ".neuroignore").write_text("*.log\n")
+    # Remote files are newer: the partial one is continued,
+    # the complete one is skipped
+    os.utime(local_dir / "small.txt", (1000, 1000))
+    os.utime(local_dir / "nested" / "a.txt", (1000, 1000))
+    (storage_path / "folder" / "nested").mkdir(parents=True)
+    (storage_path / "folder" / "small.txt").write_bytes(b"01234")
+    (storage_path / "folder" / "nested" / "a.txt").write_bytes(b"a" * 100)
+
+    src = URL(local_dir.as_uri())
+    dst = URL("storage://default/user/folder")
+    monkeypatch.setattr(neuro_sdk.storage, "MAX_OPEN_FILES", 1)
+    async with make_client(storage_server.make_url("/")) as client:
+        plan = await client.storage.plan_upload(
+            src, dst, continue_=True, ignore_file_names={".neuroignore"}
+        )
+        assert plan.entries[0] == TransferPlanEntry(src, dst, FileStatusType.DIRECTORY)
+        assert set(plan.entries) == {
+            TransferPlanEntry(src, dst, FileStatusType.DIRECTORY),
+            TransferPlanEntry(src / "empty", dst / "empty", FileStatusType.DIRECTORY),
+            TransferPlanEntry(src / "nested", dst / "nested", FileStatusType.DIRECTORY),
+            TransferPlanEntry(
+                src / "big.bin", dst / "big.bin", FileStatusType.FILE, 3000
+            ),
+            TransferPlanEntry(
+                src / "small.txt", dst / "small.txt", FileStatusType.FILE, 10, 5
+            ),
+            TransferPlanEntry(
+                src / ".neuroignore", dst / ".neuroignore", FileStatusType.FILE, 6
+            ),
+            TransferPlanEntry(
+                src / "nested/a.txt",
+                dst / "nested/a.txt",
+                FileStatusType.FILE,
+                100,
+                skip=True,
+            ),
+        }
+        assert plan.transfer_files == 3
+        assert plan.transfer_bytes == 3000 + 5 + 6
+        assert plan.skipped_files == 1
+        # Planning doesn't change anything
+        assert not (storage_path / "folder" / "empty").exists()
+        assert not (storage_path / "folder" / "big.bin").exists()
+
+        stream = io.StringIO()
+        plan.dump(stream)
+        assert len(stream.getvalue().splitlines()) == len(plan.entries)
+        stream.seek(0)
+        assert TransferPlan.load(stream) == plan
+
+        progress = mock.Mock()
+        await client.storage.run_plan(plan, progress=progress)
+
+    # Largest first
+    assert [call[0][0].src.name for call in progress.start.call_args_list] == [
+        "big.bin",
+        ".neuroignore",
+        "small.txt",
+    ]
+    assert (storage_path / "folder" / "empty").is_dir()
+    for name in ("big.bin", "small.txt", ".neuroignore", "nested/a.txt"):
+        assert (storage_path / "folder" / name).read_bytes() == (
+            local_dir / name
+        ).read_bytes()
+    assert not (storage_path / "folder" / "nested" / "skip.log").exists()
+
+
+async def test_storage_plan_download(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    remote_dir = storage_path / "folder"
+    for name in ("nested", "excluded", "other/deep"):
+        (remote_dir / name).mkdir(parents=True)
+    (remote_dir / "big.bin").write_bytes(os.urandom(2000))
+    (remote_dir / "nested" / "a.txt").write_bytes(b"a" * 10)
+    (remote_dir / "nested" / "b.log").write_bytes(b"log")
+    (remote_dir / "excluded" / "c.txt").write_bytes(b"c")
+    (remote_dir / "other" / "deep" / "d.txt").write_bytes(b"d")
+    local_dir = tmp_path / "folder"
+
+    async def default(path: str) -> bool:
+        return path != "other/"
+
+    file_filter = FileFilter(default)
+    file_filter.exclude("*.log")
+    file_filter.exclude("excluded/")
+
+    src = URL("storage://default/user/folder")
+    dst = URL(local_dir.as_uri())
+    async with make_client(storage_server.make_url("/")) as client:
+        plan = await client.storage.plan_download(src, dst, filter=file_filter.match)
+        assert plan.entries[0] == TransferPlanEntry(src, dst, FileStatusType.DIRECTORY)
+        assert set(plan.entries) == {
+            TransferPlanEntry(src, dst, FileStatusType.DIRECTORY),
+            TransferPlanEntry(src / "nested", dst / "nested", FileStatusType.DIRECTORY),
+            TransferPlanEntry(
+                src / "big.bin", dst / "big.bin", FileStatusType.FILE, 2000
+            ),
+            TransferPlanEntry(
+                src / "nested/a.txt", dst / "nested/a.txt", FileStatusType.FILE, 10
+            ),
+        }
+        assert not local_dir.exists()
+
+        await client.storage.run_plan(plan)
+    assert (local_dir / "big.bin").read_bytes() == (remote_dir / "big.bin").read_bytes()
+    assert (local_dir / "nested" / "a.txt").read_bytes() == b"a" * 10
+    assert sorted(p.name for p in local_dir.rglob("*")) == [
+        "a.txt",
+        "big.bin",
+        "nested",
+    ]
+
+
+async def test_storage_check_plan(
+    storage_server: Any,
+    make_client: _MakeClient,
+    tmp_path: Path,
+    storage_path: Path,
+) -> None:
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    for name in ("partial.txt", "done.txt", "new.txt", "same.txt"):
+        (local_dir / name).write_bytes(b"0123456789")
+        os.utime(local_dir / name, (1000, 1000))
+    (storage_path / "folder").mkdir()
+    (storage_path / "folder" / "partial.txt").write_bytes(b"01234")
+    (storage_path / "folder" / "done.txt").write_bytes(b"0123456789")
+    (storage_path / "folder" / "same.txt").write_bytes(b"0123456789")
+
+    src = URL(local_dir.as_uri())
+    dst = URL("storage://default/user/folder")
+    async with make_client(storage_server.make_url("/")) as client:
+        plan = await client.storage.plan_upload(src, dst, continue_=True)
+        stream = io.StringIO()
+        plan.dump(stream)
+        # Blank lines are ignored
+        stream = io.StringIO("\n" + stream.getvalue().replace("\n", "\n\n"))
+        loaded = TransferPlan.load(stream)
+        assert loaded == plan
+        assert await client.storage.check_plan(loaded) == loaded
+
+        # The source is rewritten after planning, the partial destination
+        # is not its prefix anymore
+        (local_dir / "partial.txt").write_bytes(b"abcdefghijkl")
+        # The complete destination is removed
+        (storage_path / "folder" / "done.txt").unlink()
+        (local_dir / "new.txt").write_bytes(b"01")
+        # Local files are stat'ed by a scan of their directory
+        with mock.patch.object(
+            neuro_sdk.storage, "_scan_dir", wraps=neuro_sdk.storage._scan_dir
+        ) as scan_dir:
+            checked = await client.storage.check_plan(loaded)
+        scan_dir.assert_called_once_with(local_dir)
+
+    assert {entry.src.name: entry for entry in checked.entries if entry.is_file()} == {
+        "partial.txt": TransferPlanEntry(
+            src / "partial.txt", dst / "partial.txt", FileStatusType.FILE, 12
+        ),
+        "done.txt": TransferPlanEntry(
+            src / "done.txt", dst / "done.txt", FileStatusType.FILE, 10
+        ),
+        "new.txt": TransferPlanEntry(
+            src / "new.txt", dst / "new.txt", FileStatusType.FILE, 2
+        ),
+        "same.txt": TransferPlanEntry(
+            src / "same.txt", dst / "same.txt", FileStatusType.FILE, 10, skip=True
+        ),
+    }
+
+
+def _interrupt_journal(
+    path: Path, src: URL, dst: URL, plan: TransferPlan, **options: Any
+) -> None:
+    # Simulate a transfer killed after completing done.txt and
+    # the first 5 bytes of partial.txt and changed.txt
+    with _TransferJournal(path, src, dst, **options) as journal:
+        journal.save_plan(plan)
+        journal.set_dirs_created()
+        for index, entry in enumerate(plan.entries):
+            if entry.src.name == "done.txt":
+                journal.record_done(index)
+            elif entry.src.name in ("partial.txt", "changed.txt"):
+                journal.record_offset(index, 5)
+
+
+async def test_storage_upload_dir_journal(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    for name in ("new.txt", "done.txt", "partial.txt", "changed.txt"):
+        (local_dir / name).write_bytes(b"0123456789")
+        os.utime(local_dir / name, (1000, 1000))
+    journal_path = tmp_path / "journal" / "transfer.db"
+    src = URL(local_dir.as_uri())
+    dst = URL("storage://default/user/folder")
+
+    async with make_client(storage_server.make_url("/")) as client:
+        _interrupt_journal(
+            journal_path,
+            src,
+            dst,
+            await client.storage.plan_upload(src, dst),
+            update=False,
+            continue_=False,
+            ignore_file_names=[],
+        )
+        (storage_path / "folder").mkdir()
+        (storage_path / "folder" / "done.txt").write_bytes(b"DONE")
+        (storage_path / "folder" / "partial.txt").write_bytes(b"XXXXX")
+        (storage_path / "folder" / "changed.txt").write_bytes(b"XXXXX")
+        # The source is rewritten after the interrupted transfer
+        (local_dir / "changed.txt").write_bytes(b"abcdefghij")
+
+        await client.storage.upload_dir(src, dst, journal=journal_path)
+
+    assert not journal_path.exists()
+    assert (storage_path / "folder" / "new.txt").read_bytes() == b"0123456789"
+    assert (storage_path / "folder" / "partial.txt").read_bytes() == b"XXXXX56789"
+    assert (storage_path / "folder" / "changed.txt").read_bytes() == b"abcdefghij"
+    # Completed files are not transferred again
+    assert (storage_path / "folder" / "done.txt").read_bytes() == b"DONE"
+
+
+async def test_storage_upload_dir_journal_other_options(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    local_dir = tmp_path / "folder"
+    local_dir.mkdir()
+    (local_dir / "done.txt").write_bytes(b"0123456789")
+    journal_path = tmp_path / "transfer.db"
+    src = URL(local_dir.as_uri())
+    dst = URL("storage://default/user/folder")
+
+    async with make_client(storage_server.make_url("/")) as client:
+        _interrupt_journal(
+            journal_path,
+            src,
+            dst,
+            await client.storage.plan_upload(src, dst),
+            update=False,
+            continue_=False,
+            ignore_file_names=[],
+        )
+        (local_dir / "new.txt").write_bytes(b"01")
+        # The plan of the transfer without update is not reused
+        await client.storage.upload_dir(src, dst, update=True, journal=journal_path)
+
+    assert (storage_path / "folder" / "done.txt").read_bytes() == b"0123456789"
+    assert (storage_path / "folder" / "new.txt").read_bytes() == b"01"
+
+
+async def test_storage_download_dir_journal(
+    storage_server: Any, make_client: _MakeClient, tmp_path: Path, storage_path: Path
+) -> None:
+    remote_dir = storage_path / "folder"
+    (remote_dir / "nested").mkdir(parents=True)
+    for name in ("nested/new.txt", "done.txt", "partial.txt"):
+        (remote_dir / name).write_bytes(b"0123456789")
+        os.utime(remote_dir / name, (1000, 1000))
+    local_dir = tmp_path / "folder"
+    journal_path = tmp_path / "transfer.db"
+    src = URL("storage://default/user/folder")
+    dst = URL(local_dir.as_uri())
+    options = {"update": False, "continue_": False}
+
+    async with make_client(storage_server.make_url("/")) as client:
+        # The journal of other directories is discarded
+        _interrupt_journal(
+            journal_path,
+            src / "nested",
+            dst,
+            await client.storage.plan_download(src / "nested", dst),
+            **options,
+        )
+        await client.storage.download_dir(src, dst, journal=journal_path)
+        assert not journal_path.exists()
+        assert (local_dir / "done.txt").read_bytes() == b"0123456789"
+
+        rmtree(local_dir)
+        _interrupt_journal(
+            journal_path,
+            src,
+            dst,
+            await client.storage.plan_download(src, dst),
+            **options,
+        )
+        local_dir.mkdir()
+        (local_dir / "done.txt").write_bytes(b"DONE")
+        (local_dir / "partial.txt").write_bytes(b"XXXXX")
+
+        progress = mock.Mock()
+        await client.storage.download_dir(
+            src, dst, journal=journal_path, progress=progress
+        )
+
+    assert not journal_path.exists()
+    assert (local_dir / "nested" / "new.txt").read_bytes() == b"0123456789"
+    assert (local_dir / "partial.txt").read_bytes() == b"XXXXX56789"
+    assert (local_dir / "done.txt").read_bytes() == b"DONE"
+    assert sorted(call[0][0].src.name for call in progress.start.call_args_list) == [
+        "new.txt",
+        "partial.txt",
+    ]
+
+
+def test_transfer_journal_commits_periodically(tmp_path: Path) -> None:
+    path = tmp_path / "transfer.db"
+    src = URL("file:///folder")
+    dst = URL("storage://default/user/folder")
+    plan = TransferPlan(
+        [TransferPlanEntry(src / "a.txt", dst / "a.txt", FileStatusType.FILE, 10)]
+    )
+    with _TransferJournal(path, src, dst) as journal:
+        journal.save_plan(plan)
+        journal.record_offset(0, 5)
+        # Kept in memory until the commit period passes
+        with _TransferJournal(path, src, dst) as other:
+            loaded = other.load_plan()
+            assert loaded is not None
+            assert loaded.entries[0].offset == 0
+    with _TransferJournal(path, src, dst) as journal:
+        loaded = journal.load_plan()
+        assert loaded is not None
+        assert loaded.entries[0].offset == 5
+
+
+async def test_storage_walk(
+    storage_server: Any, make_client: _MakeClient, storage_path: Path
+) -> None:
+    for name in ("a/x", "a/y/deep", "b", ".hidden/sub"):
+        (storage_path / "data" / name).mkdir(parents=True)
+    (storage_path / "data" / "f.txt").write_bytes(b"f")
+    (storage_path / "data" / "a" / "x" / "g.txt").write_bytes(b"g")
+
+    async with make_client(storage_server.make_url("/")) as client:
+        base = "storage:data"
+
+        async def walk(**kwargs: Any) -> Dict[str, List[str]]:
+            ret = {}
+            async for folder, items in client.storage.walk(URL(base), **kwargs):
+                ret[str(folder)[len(base) + 1 :]] = sorted(item.name for item in items)
+            return ret
+
+        expected = {
+            "": [".hidden", "a", "b", "f.txt"],
+            ".hidden": ["sub"],
+            ".hidden/sub": [],
+            "a": ["x", "y"],
+            "a/x": ["g.txt"],
+            "a/y": ["deep"],
+            "a/y/deep": [],
+            "b": [],
+        }
+        assert await walk() == expected
+        assert await walk(max_concurrency=1) == expected
+
+        ordered = await walk(ordered=True)
+        assert ordered == expected
+        depths = [folder.count("/") + bool(folder) for folder in ordered]
+        assert depths == sorted(depths)
+
+        assert await walk(max_depth=1) == {
+            name: items for name, items in expected.items() if name.count("/") == 0
+        }
+        assert await walk(descend=lambda stat: not stat.name.startswith(".")) == {
+            name: items for name, items in expected.items() if not name.startswith(".")
+        }
+
+        with pytest.raises(ValueError):
+            await walk(max_concurrency=0)
+        with pytest.raises(ResourceNotFound):
+            async for _ in client.storage.walk(URL("storage:missing")):
+                pass
+
+
+async def test_storage_walk_concurrency(
+    aiohttp_server: _TestServerFactory, make_client: _MakeClient
+) -> None:
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        nonlocal in_flight, max_in_flight
+        assert request.query == {"op": "LISTSTATUS"}
+        depth = request.path.count("/") - 2
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        children = []
+        if depth < 2:
+            children = [
+                {
+                    "path": f"dir{i}",
+                    "length": 0,
+                    "type": "DIRECTORY",
+                    "modificationTime": 0,
+                    "permission": "read",
+                }
+                for i in range(5)
+            ]
+        return await make_listiter_response(request, children)
+
+    app = web.Application()
+    app.router.add_get("/storage/{path:.*}", handler)
+    srv = await aiohttp_server(app)
+
+    async with make_client(srv.make_url("/")) as client:
+        folders = [
+            folder
+            async for folder, _ in client.storage.walk(
+                URL("storage:"), max_concurrency=3
+            )
+        ]
+    assert len(folders) == 1 + 5 + 25
+    assert max_in_flight == 3
+
+
+async def test_storage_glob_recursive_depth_first(
+    aiohttp_server: _TestServerFactory, make_client: _MakeClient
+) -> None:
+    tree = {
+        "": ["a", "b", "f.txt"],
+        "a": ["x", "g.txt"],
+        "a/x": ["h.txt"],
+        "b": ["y"],
+        "b/y": [],
+    }
+
+    async def handler(request: web.Request) -> web.StreamResponse:
+        assert request.query == {"op": "LISTSTATUS"}
+        rel_path = request.path[len("/storage/user/") :].strip("/")
+        # Deeper directories are listed slower
+        await asyncio.sleep(0.01 * rel_path.count("/"))
+        children = [
+            {
+                "path": name,
+                "length": 0,
+                "type": "FILE" if "." in name else "DIRECTORY",
+                "modificationTime": 0,
+                "permission": "read",
+            }
+            for name in tree[rel_path]
+        ]
+        return await make_listiter_response(request, children)
+
+    app = web.Application()
+    app.router.add_get("/storage/{path:.*}", handler)
+    srv = await aiohttp_server(app)
+
+    async with make_client(srv.make_url("/")) as client:
+        found = [uri async for uri in client.storage.glob(URL("storage:**"))]
+        assert found == [
+            URL("storage:"),
+            URL("storage:a"),
+            URL("storage:a/x"),
+            URL("storage:a/x/h.txt"),
+            URL("storage:a/g.txt"),
+            URL("storage:b"),
+            URL("storage:b/y"),
+            URL("storage:f.txt"),
+        ]
+        found = [uri async for uri in client.storage.glob(URL("storage:**/*.txt"))]
+        assert found == [
+            URL("storage:f.txt"),
+            URL("storage:a/g.txt"),
+            URL("storage:a/x/h.txt"),
+        ]
+
+
+async def test_storage_open_file_is_dir(
+    storage_server: Any, make_client: _MakeClient, storage_path: Path
+) -> None:
+    (storage_path / "folder").mkdir()
+    async with make_client(storage_server.make_url("/")) as client:
+        with pytest.raises(IsADirectoryError):
+            async with client.storage.open_file(URL("storage:folder")):
+                pass